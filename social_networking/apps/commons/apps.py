@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CommonsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'social_networking.apps.commons'
+
+    def ready(self):
+        # connect signal receivers
+        from social_networking.apps.commons.db import queries  # noqa: F401
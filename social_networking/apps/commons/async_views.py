@@ -0,0 +1,67 @@
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+
+from social_networking.apps.commons import (
+    authentication as commons_authentication,
+    utils as commons_utils,
+)
+from social_networking.apps.commons.db import routing as db_routing
+
+authenticator = commons_authentication.AsyncSignedTokenAuthentication()
+
+
+def as_async_view(view_class, **initkwargs):
+    """
+    Serve a DRF APIView from an async Django view, to be run under ASGI.
+    Authentication, permissions, throttling and rendering run on the event loop, only the handler
+    (ORM work) runs in a thread, so a client which is slow to send or read holds no thread.
+    A view may define an async handler named after the method with an `a` prefix (e.g. apost), which
+    runs on the event loop and goes to threads itself for ORM work only.
+    Responses are the same as of view_class.as_view().
+    Note: Django 3.2 has no async ORM, handlers go through commons_utils.run_in_thread.
+    """
+
+    async def view(request, *args, **kwargs):
+        api_view = view_class(**initkwargs)
+        api_view.args = args
+        api_view.kwargs = kwargs
+        api_view.headers = api_view.default_response_headers
+        drf_request = api_view.initialize_request(request, *args, **kwargs)
+        api_view.request = drf_request
+
+        try:
+            user_auth = await authenticator.authenticate_async(request)
+            if user_auth is not None:
+                db_routing.authenticated(user_auth[0].id)
+            # user being set, initial() won't authenticate again in a blocking way.
+            drf_request.user, drf_request.auth = user_auth if user_auth is not None else (AnonymousUser(), None)
+            api_view.initial(drf_request, *args, **kwargs)
+
+            method = request.method.lower()
+            if method in api_view.http_method_names and hasattr(api_view, method):
+                handler = getattr(api_view, method)
+                async_handler = getattr(api_view, f'a{method}', None)
+            else:
+                handler, async_handler = api_view.http_method_not_allowed, None
+            if async_handler is not None:
+                drf_response = await async_handler(drf_request, *args, **kwargs)
+            else:
+                drf_response = await commons_utils.run_in_thread(handler, drf_request, *args, **kwargs)
+        except Exception as exc:
+            drf_response = api_view.handle_exception(exc)
+
+        drf_response = api_view.finalize_response(drf_request, drf_response, *args, **kwargs)
+        drf_response.render()
+        # plain response, Django would render a DRF Response again on its single sync thread.
+        response = HttpResponse(drf_response.content, status=drf_response.status_code)
+        for header, value in drf_response.items():
+            response[header] = value
+        return response
+
+    view.__name__ = view_class.__name__
+    view.__doc__ = view_class.__doc__
+    view.view_class = view_class
+    view.initkwargs = initkwargs
+    # token authenticated like APIView. csrf_exempt() can't be used, it hides that view is a coroutine function.
+    view.csrf_exempt = True
+    return view
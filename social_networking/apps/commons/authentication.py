@@ -1,18 +1,365 @@
+import copy
+import threading
+import time
 
-from rest_framework.authentication import TokenAuthentication
+from django.core.cache import caches
+
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
 from rest_framework import exceptions
 
+from social_networking.apps.commons import (
+    cache as commons_cache,
+    constants as commons_constants,
+    signing as commons_signing,
+    utils as commons_utils,
+)
+from social_networking.apps.commons.db import routing as db_routing
 from social_networking.apps.users import models as users_models
 
+# columns of request.user for signed access tokens, what views read of the logged in user.
+SIGNED_TOKEN_USER_FIELDS = ('id', 'name', 'email')
+
+
+class TokenCache:
+    """
+    Cache of token key -> (user, token) used by CustomTokenAuthentication, and of user id -> user
+    (SIGNED_TOKEN_USER_FIELDS loaded) used by SignedTokenAuthentication.
+    By default entries live in a bounded in process LRU cache with a timeout. A worker drops its own entries
+    on logout or a new token at once, other workers drop entries fetched before a revocation of the user
+    (see RevocationList) within SIGNED_ACCESS_TOKEN['REVOCATION_REFRESH_INTERVAL'] seconds.
+    When TOKEN_AUTH_CACHE['SHARED_CACHE_ALIAS'] names one of CACHES, that cache is used instead so
+    that invalidation done by one worker is seen by all workers at once.
+    """
+    key_prefix = 'auth-token'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured = False
+        self.enabled = True
+        self.timeout = None
+        self.local = None
+        self.shared = None
+        # user id -> token key, so that user changes can drop cached tokens without a query.
+        self.user_keys = None
+        # user id -> user of signed access tokens.
+        self.users = None
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self):
+        config = commons_utils.get_config('TOKEN_AUTH_CACHE', commons_constants.TOKEN_AUTH_CACHE_DEFAULTS)
+        self.enabled = config['ENABLED']
+        self.timeout = config['TIMEOUT']
+        self.local = commons_cache.LRUCache(config['MAX_SIZE'], config['TIMEOUT'])
+        self.shared = caches[config['SHARED_CACHE_ALIAS']] if config['SHARED_CACHE_ALIAS'] else None
+        self.user_keys = commons_cache.LRUCache(config['MAX_SIZE'], config['TIMEOUT'])
+        self.users = commons_cache.LRUCache(config['MAX_SIZE'], config['TIMEOUT'])
+        self._configured = True
+
+    def _ensure_configured(self):
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    self.configure()
+
+    def _cache_key(self, key):
+        return f'{self.key_prefix}:{key}'
+
+    def _user_cache_key(self, user_id):
+        return f'{self.key_prefix}:user:{user_id}'
+
+    def _signed_user_cache_key(self, user_id):
+        return f'{self.key_prefix}:signed-user:{user_id}'
+
+    def get(self, key):
+        self._ensure_configured()
+        if not self.enabled:
+            return None
+        if self.shared is not None:
+            cached = self.shared.get(self._cache_key(key))
+        else:
+            cached = self.local.get(key)
+            if cached is not None:
+                user, token, fetched_at = cached
+                cached = (user, token)
+                if revocation_list.is_user_revoked(user.id, fetched_at):
+                    # revoked by another worker since, for Ex: logout or a new token on login.
+                    self.local.delete(key)
+                    cached = None
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        user, token = cached
+        # hand out copies, cached instances are shared between requests and threads.
+        return copy.copy(user), copy.copy(token)
+
+    def set(self, key, user, token, fetched_at=None):
+        """
+        fetched_at (epoch milliseconds) is taken before the token was read, revocations after it drop the entry.
+        """
+        self._ensure_configured()
+        if not self.enabled:
+            return
+        if self.shared is not None:
+            self.shared.set_many(
+                {self._cache_key(key): (user, token), self._user_cache_key(user.id): key}, self.timeout
+            )
+        else:
+            self.local.set(key, (user, token, commons_signing.now_ms() if fetched_at is None else fetched_at))
+            self.user_keys.set(user.id, key)
+
+    def get_user(self, user_id):
+        self._ensure_configured()
+        if not self.enabled:
+            return None
+        if self.shared is not None:
+            user = self.shared.get(self._signed_user_cache_key(user_id))
+        else:
+            user = self.users.get(user_id)
+        if user is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return copy.copy(user)
+
+    def set_user(self, user):
+        self._ensure_configured()
+        if not self.enabled:
+            return
+        if self.shared is not None:
+            self.shared.set(self._signed_user_cache_key(user.id), user, self.timeout)
+        else:
+            self.users.set(user.id, user)
+
+    def invalidate(self, key):
+        self._ensure_configured()
+        if self.shared is not None:
+            self.shared.delete(self._cache_key(key))
+        else:
+            self.local.delete(key)
+
+    def invalidate_user(self, user_id):
+        self._ensure_configured()
+        if self.shared is not None:
+            key = self.shared.get(self._user_cache_key(user_id))
+            stale = [self._signed_user_cache_key(user_id)]
+            if key:
+                stale += [self._cache_key(key), self._user_cache_key(user_id)]
+            self.shared.delete_many(stale)
+        else:
+            self.users.delete(user_id)
+            key = self.user_keys.get(user_id)
+            if key:
+                self.user_keys.delete(user_id)
+                self.local.delete(key)
+
+    def clear(self):
+        self._ensure_configured()
+        if self.shared is None:
+            self.local.clear()
+            self.user_keys.clear()
+            self.users.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        self._ensure_configured()
+        lookups = self.hits + self.misses
+        stats = {
+            'backend': 'shared' if self.shared is not None else 'local',
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+        if self.shared is None:
+            local_stats = self.local.stats()
+            stats.update({'size': local_stats['size'], 'max_size': local_stats['max_size'],
+                          'evictions': local_stats['evictions']})
+        return stats
+
+
+class RevocationList:
+    """
+    In process copy of AccessTokenRevocation rows (user id -> revoked before, in ms), so checking a
+    signed token or a token cache entry is a dict lookup. Revocations done by other workers are pulled
+    incrementally every SIGNED_ACCESS_TOKEN['REVOCATION_REFRESH_INTERVAL'] seconds, entries older than
+    token lifetime (or token cache timeout, when longer) are dropped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.revoked_before = {}
+        self.synced_until = None
+        self.next_refresh = 0.0
+
+    def add(self, user_id, revoked_before):
+        with self._lock:
+            self.revoked_before[user_id] = max(self.revoked_before.get(user_id, 0), revoked_before)
+
+    def refresh(self):
+        # from the primary, a revocation must not wait for replicas.
+        with db_routing.primary():
+            self._refresh()
+
+    def _refresh(self):
+        config = commons_utils.get_config('SIGNED_ACCESS_TOKEN', commons_constants.SIGNED_ACCESS_TOKEN_DEFAULTS)
+        cache_config = commons_utils.get_config('TOKEN_AUTH_CACHE', commons_constants.TOKEN_AUTH_CACHE_DEFAULTS)
+        now = commons_signing.now_ms()
+        oldest_live_token = now - max(config['LIFETIME'], cache_config['TIMEOUT']) * 1000
+        if self.synced_until is None:
+            since = oldest_live_token
+        else:
+            # overlap a little with the last sync to tolerate clock skew between workers.
+            since = self.synced_until - config['REVOCATION_REFRESH_INTERVAL'] * 1000
+        revocations = users_models.AccessTokenRevocation.objects.filter(
+            revoked_before__gte=since
+        ).values_list('user_id', 'revoked_before')
+        for user_id, revoked_before in revocations:
+            self.add(user_id, revoked_before)
+        with self._lock:
+            self.revoked_before = {
+                user_id: revoked_before for user_id, revoked_before in self.revoked_before.items()
+                if revoked_before > oldest_live_token
+            }
+            self.synced_until = now
+            self.next_refresh = time.monotonic() + config['REVOCATION_REFRESH_INTERVAL']
+
+    def refresh_due(self):
+        return time.monotonic() >= self.next_refresh
+
+    def is_revoked(self, claims):
+        if self.refresh_due():
+            self.refresh()
+        return claims.issued_at <= self.revoked_before.get(claims.user_id, 0)
+
+    def is_user_revoked(self, user_id, since):
+        """
+        Whether tokens of the user were revoked at or after `since` (epoch milliseconds).
+        """
+        if self.refresh_due():
+            self.refresh()
+        return since <= self.revoked_before.get(user_id, 0)
+
+    def clear(self):
+        with self._lock:
+            self.revoked_before = {}
+            self.synced_until = None
+            self.next_refresh = 0.0
+
+
+token_cache = TokenCache()
+revocation_list = RevocationList()
+
 
 class CustomTokenAuthentication(TokenAuthentication):
     model = users_models.Token
 
+    def authenticate(self, request):
+        user_auth = super().authenticate(request)
+        if user_auth is not None:
+            db_routing.authenticated(user_auth[0].id)
+        return user_auth
+
     def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        return self.fetch_credentials(key)
+
+    def fetch_token(self, key):
         model = self.get_model()
         try:
-            token = model.objects.select_related('user').get(key=key)
+            return model.objects.select_related('user').get(key=key)
         except model.DoesNotExist:
+            return None
+
+    def fetch_credentials(self, key):
+        # before the read, a revocation committed meanwhile must drop the entry.
+        fetched_at = commons_signing.now_ms()
+        token = self.fetch_token(key)
+        if token is None and db_routing.reading_from_replica():
+            # may not have reached the replica yet, for Ex: a token of a login a moment ago.
+            with db_routing.primary():
+                token = self.fetch_token(key)
+        if token is None:
             raise exceptions.AuthenticationFailed('Invalid token.')
 
+        token_cache.set(key, token.user, token, fetched_at)
         return token.user, token
+
+
+class SignedTokenAuthentication(CustomTokenAuthentication):
+    """
+    Accepts signed access tokens, which are verified in CPU only, along with legacy Token keys.
+    request.user is a user instance with SIGNED_TOKEN_USER_FIELDS loaded, read with one query and kept in
+    the token cache, so requests of a user with a cached entry make no query. Other fields are deferred.
+    request.auth is AccessTokenClaims for signed tokens.
+    """
+
+    def authenticate_credentials(self, key):
+        if not commons_signing.is_access_token(key):
+            return super().authenticate_credentials(key)
+        claims = self.verify_access_token(key)
+        user = token_cache.get_user(claims.user_id)
+        if user is None:
+            user = self.fetch_user(claims.user_id)
+        return user, claims
+
+    @staticmethod
+    def verify_access_token(key):
+        try:
+            claims = commons_signing.unsign_access_token(key)
+        except commons_signing.InvalidAccessToken as e:
+            raise exceptions.AuthenticationFailed(str(e))
+        if revocation_list.is_revoked(claims):
+            raise exceptions.AuthenticationFailed('Token has been revoked.')
+        return claims
+
+    @staticmethod
+    def fetch_user(user_id):
+        users = users_models.SocialNetworkingUser.objects.only(*SIGNED_TOKEN_USER_FIELDS)
+        user = users.filter(id=user_id).first()
+        if user is None and db_routing.reading_from_replica():
+            # may not have reached the replica yet, for Ex: registered a moment ago.
+            with db_routing.primary():
+                user = users.filter(id=user_id).first()
+        if user is None:
+            raise exceptions.AuthenticationFailed('User not found.')
+        token_cache.set_user(user)
+        return user
+
+
+class AsyncSignedTokenAuthentication(SignedTokenAuthentication):
+    """
+    SignedTokenAuthentication for async views. Signed tokens and cached token keys are checked on
+    the event loop, only a token cache miss or a due revocation list refresh goes to a thread.
+    """
+
+    async def authenticate_async(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed('Invalid token header. No credentials provided.')
+        elif len(auth) > 2:
+            raise exceptions.AuthenticationFailed('Invalid token header. Token string should not contain spaces.')
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                'Invalid token header. Token string should not contain invalid characters.'
+            )
+
+        # signed tokens and cached token keys are both checked against revocations.
+        if revocation_list.refresh_due():
+            await commons_utils.run_in_thread(revocation_list.refresh)
+        if commons_signing.is_access_token(key):
+            claims = self.verify_access_token(key)
+            user = token_cache.get_user(claims.user_id)
+            if user is None:
+                user = await commons_utils.run_in_thread(self.fetch_user, claims.user_id)
+            return user, claims
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        return await commons_utils.run_in_thread(self.fetch_credentials, key)
@@ -0,0 +1,326 @@
+import functools
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.utils.http import parse_etags
+
+from rest_framework import response, status
+
+from social_networking.apps.commons import (
+    constants as commons_constants,
+    utils as commons_utils,
+)
+
+
+class LRUCache:
+    """
+    Thread safe in process cache bounded by number of entries (least recently used goes first)
+    and by age of entries (timeout in seconds, None means entries never expire).
+    """
+
+    def __init__(self, max_size, timeout=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class VersionedResponseCache:
+    """
+    Versions of users' data and responses built from it. A user's version is a random token replaced
+    (bump) after every committed change of the rows its responses are built from, so a response
+    cached or ETagged under a version is valid for as long as the version is current.
+    Like TokenCache, entries live in process (LRU with a timeout) unless LIST_CACHE['SHARED_CACHE_ALIAS']
+    names one of CACHES. In process versions are per worker, with several workers lists may be up to
+    TIMEOUT seconds stale, share a cache there.
+    """
+    key_prefix = 'list'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured = False
+        self.enabled = True
+        self.timeout = None
+        self.local = None
+        self.shared = None
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def configure(self):
+        config = commons_utils.get_config('LIST_CACHE', commons_constants.LIST_CACHE_DEFAULTS)
+        self.enabled = config['ENABLED']
+        self.timeout = config['TIMEOUT']
+        self.local = LRUCache(config['MAX_SIZE'], config['TIMEOUT'])
+        self.shared = caches[config['SHARED_CACHE_ALIAS']] if config['SHARED_CACHE_ALIAS'] else None
+        self._configured = True
+
+    def _ensure_configured(self):
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    self.configure()
+
+    def _version_key(self, user_id):
+        return f'{self.key_prefix}:version:{user_id}'
+
+    def _get(self, key):
+        return self.shared.get(key) if self.shared is not None else self.local.get(key)
+
+    def is_enabled(self):
+        self._ensure_configured()
+        return self.enabled
+
+    def get_version(self, user_id):
+        self._ensure_configured()
+        key = self._version_key(user_id)
+        version = self._get(key)
+        if version is None:
+            # random, a version lost to eviction or a restart never comes back and matches an old ETag.
+            version = secrets.token_hex(8)
+            if self.shared is not None:
+                # another worker may have been first.
+                self.shared.add(key, version, self.timeout)
+                version = self.shared.get(key, version)
+            else:
+                self.local.set(key, version)
+        return version
+
+    def bump(self, user_ids):
+        """
+        Give users new versions, call it once their changes are committed.
+        """
+        self._ensure_configured()
+        versions = {self._version_key(user_id): secrets.token_hex(8) for user_id in set(user_ids)}
+        if self.shared is not None:
+            self.shared.set_many(versions, self.timeout)
+        else:
+            for key, version in versions.items():
+                self.local.set(key, version)
+
+    def get(self, key):
+        data = self._get(f'{self.key_prefix}:page:{key}')
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def set(self, key, data):
+        if self.shared is not None:
+            self.shared.set(f'{self.key_prefix}:page:{key}', data, self.timeout)
+        else:
+            self.local.set(f'{self.key_prefix}:page:{key}', data)
+
+    def stats(self):
+        self._ensure_configured()
+        lookups = self.hits + self.misses
+        return {
+            'backend': 'shared' if self.shared is not None else 'local',
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+response_cache = VersionedResponseCache()
+
+
+class SearchResultCache:
+    """
+    Pages of search results shared by every user, keyed by (generation, normalized query, page).
+    The generation is one number for all searches, bumped once a change of any user's name or email
+    (or a new or deleted user) is committed, so a bump drops every cached page at once.
+    Entries live in process (LRU with a timeout) unless SEARCH_CACHE['SHARED_CACHE_ALIAS'] names one of CACHES.
+    In process generations are per worker, with several workers results may be up to TIMEOUT seconds stale.
+    """
+    key_prefix = 'search'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured = False
+        self.enabled = True
+        self.timeout = None
+        self.local = None
+        self.shared = None
+        self.local_generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self):
+        config = commons_utils.get_config('SEARCH_CACHE', commons_constants.SEARCH_CACHE_DEFAULTS)
+        self.enabled = config['ENABLED']
+        self.timeout = config['TIMEOUT']
+        self.local = LRUCache(config['MAX_SIZE'], config['TIMEOUT'])
+        self.shared = caches[config['SHARED_CACHE_ALIAS']] if config['SHARED_CACHE_ALIAS'] else None
+        self._configured = True
+
+    def _ensure_configured(self):
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    self.configure()
+
+    @property
+    def _generation_key(self):
+        return f'{self.key_prefix}:generation'
+
+    def get_generation(self):
+        self._ensure_configured()
+        if self.shared is None:
+            return self.local_generation
+        # starts from a random number, a generation lost to eviction never comes back and meets older pages.
+        self.shared.add(self._generation_key, secrets.randbelow(2 ** 62), None)
+        return self.shared.get(self._generation_key, 0)
+
+    def bump(self):
+        """
+        Start a new generation, call it once a change of users is committed.
+        """
+        self._ensure_configured()
+        if self.shared is None:
+            with self._lock:
+                self.local_generation += 1
+            # pages of older generations can't be reached anymore.
+            self.local.clear()
+            return
+        try:
+            self.shared.incr(self._generation_key)
+        except ValueError:
+            # evicted, the next get_generation starts a new one.
+            pass
+
+    def page_key(self, key):
+        """
+        Cache key of a page (key being the normalized query and page) in the current generation, None when
+        the cache is disabled. Take it before running the search, a page found under a generation bumped
+        meanwhile is never served.
+        """
+        self._ensure_configured()
+        if not self.enabled:
+            return None
+        digest = hashlib.sha1(repr((self.get_generation(), key)).encode()).hexdigest()
+        return f'{self.key_prefix}:page:{digest}'
+
+    def get(self, page_key):
+        if page_key is None:
+            return None
+        page = self.shared.get(page_key) if self.shared is not None else self.local.get(page_key)
+        if page is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return page
+
+    def set(self, page_key, page):
+        if page_key is None:
+            return
+        if self.shared is not None:
+            self.shared.set(page_key, page, self.timeout)
+        else:
+            self.local.set(page_key, page)
+
+    def stats(self):
+        self._ensure_configured()
+        lookups = self.hits + self.misses
+        return {
+            'backend': 'shared' if self.shared is not None else 'local',
+            'generation': self.get_generation(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+search_cache = SearchResultCache()
+
+
+def versioned_response(handler):
+    """
+    Decorator of GET handlers of DRF views whose response depends only on the logged in user's version in
+    response_cache and the URL. The response gets an ETag of (view, user, version, URL, format):
+    If-None-Match having it is answered 304 before the handler runs, and data of 200 responses is cached
+    under it, so a repeated request costs one version and one page lookup.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        if not response_cache.is_enabled():
+            return handler(view, request, *args, **kwargs)
+        version = response_cache.get_version(request.user.id)
+        key = hashlib.sha1(repr((
+            type(view).__name__, request.user.id, version, request.build_absolute_uri(request.path),
+            sorted(request.query_params.lists()), request.accepted_renderer.format,
+        )).encode()).hexdigest()
+        etag = f'"{key}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response_cache.not_modified += 1
+            return response.Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        data = response_cache.get(key)
+        if data is not None:
+            return response.Response(data, headers=headers)
+        handler_response = handler(view, request, *args, **kwargs)
+        if handler_response.status_code == status.HTTP_200_OK:
+            response_cache.set(key, handler_response.data)
+            for header, value in headers.items():
+                handler_response[header] = value
+        return handler_response
+    return wrapper
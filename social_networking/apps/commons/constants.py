@@ -3,3 +3,179 @@ TOKEN_LENGTH = 40
 
 NAME_LENGTH = 40
 MIN_PASSWORD_LENGTH = 6
+
+# Search index tokens hold either a name prefix or a full (lower cased) email address.
+SEARCH_TOKEN_LENGTH = 254
+SEARCH_INDEX_BATCH_SIZE = 1000
+
+# Streaming NDJSON exports, see users.exporting
+EXPORT_CHUNK_SIZE = 2000
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+# Bulk import of users, friendships and friend requests, see users.importing
+IMPORT_BATCH_SIZE = 1000
+
+# Pagination
+PAGINATION_QUERY_PARAM = 'pagination'
+PAGE_PAGINATION = 'page'
+CURSOR_PAGINATION = 'cursor'
+CURSOR_QUERY_PARAM = 'cursor'
+COUNT_QUERY_PARAM = 'count'
+
+# Token authentication cache, see settings.TOKEN_AUTH_CACHE
+TOKEN_AUTH_CACHE_DEFAULTS = {
+    'ENABLED': True,
+    'MAX_SIZE': 10000,
+    # seconds. In process entries of a logged out user or an old token are dropped by other workers within
+    # SIGNED_ACCESS_TOKEN['REVOCATION_REFRESH_INTERVAL'] seconds, not TIMEOUT.
+    'TIMEOUT': 300,
+    # alias from CACHES to share cached tokens between workers (revocation seen at once), None keeps them in process.
+    'SHARED_CACHE_ALIAS': None,
+}
+
+# Versioned cache of list responses, see settings.LIST_CACHE
+LIST_CACHE_DEFAULTS = {
+    'ENABLED': True,
+    # cached pages, versions count too.
+    'MAX_SIZE': 10000,
+    # seconds
+    'TIMEOUT': 60,
+    # alias from CACHES to share versions and pages between workers, None keeps them in process.
+    'SHARED_CACHE_ALIAS': None,
+}
+
+# Cache of user search pages, see settings.SEARCH_CACHE
+SEARCH_CACHE_DEFAULTS = {
+    'ENABLED': True,
+    # cached pages
+    'MAX_SIZE': 5000,
+    # seconds
+    'TIMEOUT': 30,
+    # alias from CACHES to share pages and the generation between workers, None keeps them in process.
+    'SHARED_CACHE_ALIAS': None,
+}
+
+# Signed access tokens, see settings.SIGNED_ACCESS_TOKEN
+ACCESS_TOKEN_PREFIX = 's1.'
+ACCESS_TOKEN_SALT = 'social_networking.access_token'
+SIGNED_ACCESS_TOKEN_DEFAULTS = {
+    # issue signed tokens on login/registration instead of Token rows, both are accepted either way.
+    'ENABLED': False,
+    # seconds
+    'LIFETIME': 24 * 60 * 60,
+    # seconds between syncs of revocations done by other workers.
+    'REVOCATION_REFRESH_INTERVAL': 5,
+}
+
+# Password hashing service, see settings.PASSWORD_HASHING
+PASSWORD_HASHING_PENDING_PER_WORKER = 4
+PASSWORD_HASHING_DEFAULTS = {
+    # hash inline on the calling thread when disabled.
+    'ENABLED': True,
+    # worker processes, None means one per CPU.
+    'MAX_WORKERS': None,
+    # jobs queued or running, more are rejected. None means PASSWORD_HASHING_PENDING_PER_WORKER per worker.
+    'MAX_PENDING': None,
+    # seconds to wait for a job.
+    'TIMEOUT': 10,
+}
+
+# DB connection pool, see POOL of settings.DATABASES
+DB_POOL_DEFAULTS = {
+    'ENABLED': True,
+    # connections per worker process.
+    'MAX_SIZE': 10,
+    # seconds to wait for a free connection.
+    'TIMEOUT': 10,
+    # seconds after which a connection is closed and replaced, None keeps it forever.
+    'RECYCLE': 60 * 60,
+    # check a connection with a round trip before handing it out.
+    'PRE_PING': True,
+    'HEALTH_CHECK_INTERVAL': 30,
+}
+
+# Read replicas, see settings.DATABASE_ROUTING
+DATABASE_ROUTING_DEFAULTS = {
+    # aliases from DATABASES which replicate default, reads of read only views go to one of them.
+    'REPLICAS': [],
+    # seconds a user's reads stay on the primary after a write.
+    'STICKY_SECONDS': 10,
+    # pinned users kept in process.
+    'MAX_SIZE': 100000,
+    # alias from CACHES to share pins between workers, None keeps them in process.
+    'SHARED_CACHE_ALIAS': None,
+}
+
+# SQL query instrumentation, see settings.QUERY_INSTRUMENTATION
+QUERY_SHAPES_PER_VIEW = 10
+QUERY_INSTRUMENTATION_DEFAULTS = {
+    'ENABLED': True,
+    # a query shape run this many times in one request counts as duplicated (N+1).
+    'DUPLICATE_THRESHOLD': 3,
+    # raise QueryBudgetExceeded instead of logging a warning, for tests.
+    'STRICT': False,
+}
+
+# Per request profiling, see settings.PROFILING
+PROFILING_DEFAULTS = {
+    'ENABLED': True,
+    # request header asking for a profile, e.g. `X-Profile: <TOKEN>`.
+    'HEADER': 'X-Profile',
+    # value the header must have. None ignores the header, only SAMPLE_RATE profiles requests.
+    'TOKEN': None,
+    # fraction of all requests profiled.
+    'SAMPLE_RATE': 0.0,
+    # directory for cProfile stats files of the slowest profiled requests, None runs no cProfile.
+    'CPROFILE_DIR': None,
+    'CPROFILE_SLOWEST': 10,
+}
+
+# Prometheus metrics, see settings.METRICS
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# seconds
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_DEFAULTS = {
+    'ENABLED': True,
+    # directory shared by the worker processes of a host, each one keeps a snapshot of its metrics there and
+    # /metrics adds all of them up. Empty it when the server starts. None exposes metrics of the serving process only.
+    'DIRECTORY': None,
+    # seconds between snapshots of a worker.
+    'FLUSH_INTERVAL': 5,
+    # scrapers send `Authorization: Bearer <TOKEN>`. Metrics are still collected with None, but /metrics is a 404.
+    'TOKEN': None,
+}
+
+# Rate limiting, see settings.RATE_LIMIT
+RATE_LIMIT_MAX_KEYS = 100000
+RATE_LIMIT_DEFAULTS = {
+    'BACKEND': 'social_networking.apps.commons.ratelimit.InMemoryRateLimitBackend',
+    'OPTIONS': {},
+}
+
+# In memory friend graph, see settings.FRIEND_GRAPH
+FRIEND_GRAPH_CHUNK_SIZE = 10000
+# binary search the longer list once it is this many times longer than the shorter one.
+GALLOP_RATIO = 16
+FRIEND_GRAPH_DEFAULTS = {
+    # seconds, None keeps the loaded graph (plus incremental edges) forever.
+    'MAX_AGE': 10 * 60,
+    'MAX_DELTA_EDGES': 100000,
+    'CHUNK_SIZE': FRIEND_GRAPH_CHUNK_SIZE,
+    # alias of a cache shared by workers to log changed friendships in, None keeps changes in the worker.
+    'SHARED_CACHE_ALIAS': None,
+    # seconds between checks of the shared log.
+    'SYNC_INTERVAL': 1,
+    # changes a worker may be behind before it reloads instead of replaying them.
+    'LOG_SIZE': 10000,
+    'LOG_TIMEOUT': 10 * 60,
+}
+
+# People you may know
+FRIEND_SUGGESTIONS_LIMIT = 50
+FRIEND_SUGGESTIONS_BATCH_SIZE = 500
+
+# Mutual friends
+MUTUAL_FRIENDS_BATCH_LIMIT = 100
+
+# Bulk friend requests, max items of a single call.
+BULK_FRIEND_REQUEST_LIMIT = 500
@@ -0,0 +1,44 @@
+from social_networking.apps.commons.db import pool as db_pool
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Takes DB API connections from the connection pool of the database and gives them back on close.
+    Pool options come from POOL of the database settings, see constants.DB_POOL_DEFAULTS.
+    """
+
+    def get_new_connection(self, conn_params):
+        pool = db_pool.get_pool(self.alias, conn_params, self.settings_dict.get('POOL'))
+        connection, self.connection_reused = pool.acquire(
+            lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params), self.ping_connection
+        )
+        self.pool = pool
+        return connection
+
+    def init_connection_state(self):
+        # session state set up on first use stays with a pooled connection.
+        if not self.connection_reused:
+            super().init_connection_state()
+
+    def ping_connection(self, connection):
+        """
+        Raise if the DB API connection is dead.
+        """
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # a connection closed in a transaction or after an error is not trusted again.
+        discard = self.in_atomic_block or self.errors_occurred
+        if not discard:
+            try:
+                if not self.get_autocommit():
+                    self.connection.rollback()
+            except Exception:
+                discard = True
+        self.pool.release(self.connection, discard)
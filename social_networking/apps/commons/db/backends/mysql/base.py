@@ -0,0 +1,14 @@
+from django.db.backends.mysql import base
+
+from social_networking.apps.commons.db.backends.base import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """
+    MySQL backend with pooled connections,
+    ENGINE = 'social_networking.apps.commons.db.backends.mysql'
+    """
+
+    def ping_connection(self, connection):
+        # no query, just a round trip.
+        connection.ping()
@@ -0,0 +1,30 @@
+from django.db.backends.sqlite3 import base
+
+from social_networking.apps.commons.db.backends.base import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """
+    SQLite backend with pooled connections, mostly as a local stand-in for MySQL.
+    ENGINE = 'social_networking.apps.commons.db.backends.sqlite3'
+    In memory databases are not pooled, they live and die with their only connection.
+    """
+
+    def get_new_connection(self, conn_params):
+        if self.is_in_memory_db():
+            self.connection_reused = False
+            return base.DatabaseWrapper.get_new_connection(self, conn_params)
+        return super().get_new_connection(conn_params)
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # OPTIONS['transaction_mode'] like in later Django versions, e.g. IMMEDIATE takes the write lock when
+        # a transaction starts, so concurrent writers wait (timeout) instead of failing with "database is locked".
+        self.transaction_mode = kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
+        else:
+            super()._start_transaction_under_autocommit()
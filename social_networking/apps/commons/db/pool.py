@@ -0,0 +1,197 @@
+import threading
+import time
+from collections import Counter
+
+from django.db.utils import OperationalError
+
+from social_networking.apps.commons import constants as commons_constants
+
+
+class ConnectionPool:
+    """
+    Per process pool of open DB API connections of one database.
+    Django still "opens" and "closes" a connection per request (CONN_MAX_AGE = 0), pooled backends
+    take it from here and give it back instead, so requests don't pay for connecting.
+    A connection is checked before reuse (pre-ping) and dropped when it failed, when an error
+    occurred while it was out, or once it is older than RECYCLE seconds.
+    Idle connections are swept every HEALTH_CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self, name, options=None):
+        options = {**commons_constants.DB_POOL_DEFAULTS, **(options or {})}
+        self.name = name
+        self.enabled = options['ENABLED']
+        self.max_size = options['MAX_SIZE']
+        self.timeout = options['TIMEOUT']
+        self.recycle = options['RECYCLE']
+        self.pre_ping = options['PRE_PING']
+        self.health_check_interval = options['HEALTH_CHECK_INTERVAL']
+        self._available = threading.Condition()
+        # (connection, created at) of idle connections, last returned on top.
+        self._idle = []
+        # id of pooled connection -> created at, for connections handed out.
+        self._in_use = {}
+        self._connecting = 0
+        self._next_health_check = time.monotonic() + self.health_check_interval
+        self.counters = Counter()
+
+    @property
+    def size(self):
+        return len(self._idle) + len(self._in_use) + self._connecting
+
+    def acquire(self, connect, ping):
+        """
+        Return (connection, reused). `connect()` opens a new connection, `ping(connection)` raises if it is dead.
+        Waits up to TIMEOUT seconds when MAX_SIZE connections are in use.
+        """
+        if not self.enabled:
+            self.counters['created'] += 1
+            return connect(), False
+        if time.monotonic() >= self._next_health_check:
+            self.health_check(ping)
+
+        deadline = time.monotonic() + self.timeout
+        with self._available:
+            waited = False
+            while not self._idle and self.size >= self.max_size:
+                waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise OperationalError(f'No free connection in pool of {self.name!r} after {self.timeout} seconds')
+                self._available.wait(remaining)
+            if waited:
+                self.counters['waits'] += 1
+            if self._idle:
+                connection, created_at = self._idle.pop()
+                self._in_use[id(connection)] = created_at
+            else:
+                connection = None
+                # slot is taken while connecting outside of lock.
+                self._connecting += 1
+
+        if connection is not None:
+            if self._usable(connection, created_at, ping):
+                self.counters['reused'] += 1
+                return connection, True
+            with self._available:
+                del self._in_use[id(connection)]
+                self._connecting += 1
+
+        try:
+            connection = connect()
+        except Exception:
+            with self._available:
+                self._connecting -= 1
+                self._available.notify()
+            raise
+        with self._available:
+            self._connecting -= 1
+            self._in_use[id(connection)] = time.monotonic()
+        self.counters['created'] += 1
+        return connection, False
+
+    def _usable(self, connection, created_at, ping):
+        if self.recycle is not None and time.monotonic() - created_at > self.recycle:
+            self.counters['recycled'] += 1
+            self._close(connection)
+            return False
+        if self.pre_ping:
+            try:
+                ping(connection)
+            except Exception:
+                self.counters['failed_pings'] += 1
+                self._close(connection)
+                return False
+        return True
+
+    def release(self, connection, discard=False):
+        """
+        Give a connection back, discard closes it for good (it saw an error or is in a broken state).
+        """
+        with self._available:
+            created_at = self._in_use.pop(id(connection), None)
+            if created_at is None:
+                # not from the pool (pool disabled when it was opened), just close it.
+                discard = True
+            elif discard:
+                self.counters['discarded'] += 1
+            else:
+                self._idle.append((connection, created_at))
+            self._available.notify()
+        if discard:
+            self._close(connection)
+
+    def health_check(self, ping):
+        """
+        Ping idle connections and drop dead or expired ones.
+        """
+        with self._available:
+            idle, self._idle = self._idle, []
+            # still counted in size while being checked.
+            self._connecting += len(idle)
+            self._next_health_check = time.monotonic() + self.health_check_interval
+        healthy = []
+        for connection, created_at in idle:
+            if self._usable(connection, created_at, ping):
+                healthy.append((connection, created_at))
+        with self._available:
+            self._connecting -= len(idle)
+            # checked ones go below connections returned meanwhile.
+            self._idle[:0] = healthy
+            self._available.notify_all()
+        self.counters['health_checks'] += 1
+
+    def close_all(self):
+        with self._available:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._available:
+            return {
+                'enabled': self.enabled,
+                'max_size': self.max_size,
+                'size': self.size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                **{key: self.counters[key] for key in (
+                    'created', 'reused', 'waits', 'timeouts', 'recycled', 'failed_pings', 'discarded', 'health_checks',
+                )},
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, conn_params, options=None):
+    """
+    Pool of the database, one per alias and connection parameters (test databases get their own).
+    """
+    key = (alias, repr(sorted(conn_params.items())))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(alias, options)
+    return pool
+
+
+def pool_stats():
+    return {pool.name: pool.stats() for pool in list(_pools.values())}
+
+
+def set_enabled(enabled):
+    for pool in list(_pools.values()):
+        pool.enabled = enabled
+        if not enabled:
+            pool.close_all()
@@ -0,0 +1,177 @@
+import contextvars
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from social_networking.apps.commons import constants as commons_constants
+
+# string and number literals, and placeholders, all become `?` in a query shape.
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+# `IN (?, ?, ?)` and multi row VALUES have the same shape whatever the number of items.
+_LISTS = re.compile(r'\?(?:\s*,\s*\?)+')
+_ROWS = re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+')
+
+# not counted: tests run every request in a transaction where each atomic() adds savepoints,
+# and only sqlite sends BEGIN as a query.
+_TRANSACTION_CONTROL = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+_recorder = contextvars.ContextVar('query_recorder', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_shape(sql):
+    """
+    SQL with values replaced, so the same query run for different rows (an N+1) has one shape.
+    """
+    return _ROWS.sub('(?)', _LISTS.sub('?', _LITERALS.sub('?', sql)))
+
+
+class QueryRecorder:
+    """
+    Queries run while recording, on any connection and thread of the same context
+    (async views run their DB work in threads which copy the context).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = []
+
+    def record(self, sql, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.queries.append((sql, seconds))
+
+    def shapes(self):
+        return Counter(query_shape(sql) for sql, _ in self.queries)
+
+    def duplicates(self, threshold=2):
+        """
+        Query shapes run at least threshold times, most repeated first.
+        """
+        return {shape: count for shape, count in self.shapes().most_common() if count >= threshold}
+
+    def report(self):
+        lines = [f'{self.count} queries in {self.seconds * 1000:.1f}ms']
+        lines.extend(f'{index}. {sql}' for index, (sql, _) in enumerate(self.queries, 1))
+        return '\n'.join(lines)
+
+
+def _record(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None or sql.startswith(_TRANSACTION_CONTROL):
+        return execute(sql, params, many, context)
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.record(sql, time.perf_counter() - started_at)
+
+
+def instrument(connection):
+    if _record not in connection.execute_wrappers:
+        # goes first, execute_wrapper() blocks pop the last wrapper when they exit.
+        connection.execute_wrappers.insert(0, _record)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    instrument(connection)
+
+
+@contextmanager
+def record_queries():
+    """
+    Record queries run in the block, for Ex:
+        with record_queries() as recorder:
+            ...
+        recorder.count, recorder.seconds, recorder.duplicates()
+    """
+    # connections opened before this module was loaded missed connection_created.
+    for connection in connections.all():
+        instrument(connection)
+    recorder = QueryRecorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+@contextmanager
+def measure_queries():
+    """
+    Number and DB time of queries run in the block, in .count and .seconds of the yielded recorder once
+    the block ends. An enclosing record_queries() block (e.g. of QueryCountMiddleware) is read, not nested.
+    """
+    measured = QueryRecorder()
+    recorder = _recorder.get()
+    if recorder is None:
+        with record_queries() as recorder:
+            yield measured
+        measured.count, measured.seconds = recorder.count, recorder.seconds
+        return
+    count, seconds = recorder.count, recorder.seconds
+    try:
+        yield measured
+    finally:
+        measured.count, measured.seconds = recorder.count - count, recorder.seconds - seconds
+
+
+class ViewQueryStats:
+    """
+    Queries per view of this process: requests, queries, DB time, requests over budget and
+    the query shapes most often duplicated within a request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def add(self, view_name, recorder, duplicates, over_budget):
+        with self._lock:
+            stats = self._views.get(view_name)
+            if stats is None:
+                stats = self._views[view_name] = {
+                    'requests': 0, 'queries': 0, 'max_queries': 0, 'db_seconds': 0.0,
+                    'over_budget': 0, 'with_duplicates': 0, 'duplicates': Counter(),
+                }
+            stats['requests'] += 1
+            stats['queries'] += recorder.count
+            stats['max_queries'] = max(stats['max_queries'], recorder.count)
+            stats['db_seconds'] += recorder.seconds
+            stats['over_budget'] += over_budget
+            if duplicates:
+                stats['with_duplicates'] += 1
+                stats['duplicates'].update(duplicates.keys())
+                if len(stats['duplicates']) > 2 * commons_constants.QUERY_SHAPES_PER_VIEW:
+                    stats['duplicates'] = Counter(
+                        dict(stats['duplicates'].most_common(commons_constants.QUERY_SHAPES_PER_VIEW))
+                    )
+
+    def stats(self):
+        with self._lock:
+            return {
+                view_name: {
+                    **{key: value for key, value in stats.items() if key != 'duplicates'},
+                    'avg_queries': stats['queries'] / stats['requests'],
+                    'duplicates': stats['duplicates'].most_common(commons_constants.QUERY_SHAPES_PER_VIEW),
+                }
+                for view_name, stats in self._views.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+
+view_query_stats = ViewQueryStats()
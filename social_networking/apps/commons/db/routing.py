@@ -0,0 +1,185 @@
+import contextvars
+import random
+import threading
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from social_networking.apps.commons import (
+    cache as commons_cache,
+    constants as commons_constants,
+    utils as commons_utils,
+)
+
+
+class RoutingState:
+    """
+    Where reads of the running request go: `replica` is the alias of a replica or None for the primary.
+    `user_id` is the authenticated user, set once authentication is done.
+    """
+    __slots__ = ('replica', 'user_id')
+
+    def __init__(self):
+        self.replica = None
+        self.user_id = None
+
+
+# set by ReadReplicaMiddleware for every request. A mutable object, so that process_view (which runs
+# in a copy of the context under ASGI) and threads of async views change the request's own state.
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+
+class ReplicaRouting:
+    """
+    Read replicas of DATABASE_ROUTING['REPLICAS'] and users pinned to the primary.
+    A user is pinned for STICKY_SECONDS after writing (read your writes): while pinned all of their
+    reads go to the primary, so a replica which is behind never shows them a list without their change.
+    Like TokenCache, pins live in process unless DATABASE_ROUTING['SHARED_CACHE_ALIAS'] names one of CACHES.
+    In process pins are per worker, with several workers share a cache or a user may read from a replica
+    on another worker right after writing.
+    """
+    key_prefix = 'primary-pin'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured = False
+        self.replicas = []
+        self.sticky_seconds = None
+        self.local = None
+        self.shared = None
+
+    def configure(self):
+        config = commons_utils.get_config('DATABASE_ROUTING', commons_constants.DATABASE_ROUTING_DEFAULTS)
+        self.replicas = list(config['REPLICAS'])
+        self.sticky_seconds = config['STICKY_SECONDS']
+        self.local = commons_cache.LRUCache(config['MAX_SIZE'], config['STICKY_SECONDS'])
+        self.shared = caches[config['SHARED_CACHE_ALIAS']] if config['SHARED_CACHE_ALIAS'] else None
+        self._configured = True
+
+    def _ensure_configured(self):
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    self.configure()
+
+    def _cache_key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+
+    def has_replicas(self):
+        self._ensure_configured()
+        return bool(self.replicas)
+
+    def choose_replica(self):
+        self._ensure_configured()
+        return random.choice(self.replicas) if self.replicas else None
+
+    def pin(self, user_ids):
+        self._ensure_configured()
+        if not self.replicas:
+            return
+        if self.shared is not None:
+            self.shared.set_many({self._cache_key(user_id): True for user_id in user_ids}, self.sticky_seconds)
+        else:
+            for user_id in user_ids:
+                self.local.set(user_id, True)
+
+    def is_pinned(self, user_id):
+        self._ensure_configured()
+        if self.shared is not None:
+            return bool(self.shared.get(self._cache_key(user_id)))
+        return bool(self.local.get(user_id))
+
+    def clear(self):
+        self._ensure_configured()
+        if self.shared is None:
+            self.local.clear()
+
+
+replica_routing = ReplicaRouting()
+
+
+def reading_from_replica():
+    state = _state.get()
+    return state is not None and state.replica is not None
+
+
+def pin_to_primary(*user_ids):
+    """
+    Send reads of users to the primary for STICKY_SECONDS, call it when they wrote (or were written for).
+    """
+    replica_routing.pin(user_ids)
+
+
+def authenticated(user_id):
+    """
+    Called by authentication once the user of the request is known, reads of pinned users go to the primary.
+    """
+    state = _state.get()
+    if state is None:
+        return
+    state.user_id = user_id
+    if state.replica is not None and replica_routing.is_pinned(user_id):
+        state.replica = None
+
+
+@contextmanager
+def request_routing():
+    """
+    Routing state of a request, reads go to the primary until use_replica() picks a replica.
+    """
+    token = _state.set(RoutingState())
+    try:
+        yield _state.get()
+    finally:
+        _state.reset(token)
+
+
+def use_replica():
+    """
+    Send the rest of the running request's reads to a replica, authenticated() takes pinned users back.
+    """
+    state = _state.get()
+    if state is not None:
+        state.replica = replica_routing.choose_replica()
+
+
+@contextmanager
+def primary():
+    """
+    Read from the primary in the block, for Ex: to look up a row that may not have reached the replica yet.
+    """
+    state = _state.get()
+    replica = state.replica if state is not None else None
+    if state is not None:
+        state.replica = None
+    try:
+        yield
+    finally:
+        if state is not None:
+            state.replica = replica
+
+
+class ReplicaRouter:
+    """
+    Database router sending writes to the primary (default) and reads of requests to read only views
+    (see ReadReplicaMiddleware) to a replica. Reads in a transaction on the primary stay there.
+    All databases hold the same data, so relations between their objects are allowed.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Django's default, the database of a related instance or default.
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in replica_routing.replicas:
+            # Django would save an object read from a replica back there.
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
@@ -0,0 +1,245 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from rest_framework import exceptions, status
+
+from social_networking.apps.commons import (
+    constants as commons_constants,
+    profiling as commons_profiling,
+    utils as commons_utils,
+)
+
+
+class PasswordHashingBusy(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server is busy, please try again in a moment.'
+    default_code = 'password_hashing_busy'
+
+
+def _init_worker(password_hashers):
+    # workers started by spawn (not fork) don't inherit configured settings.
+    if not settings.configured:
+        settings.configure(PASSWORD_HASHERS=password_hashers)
+
+
+def _make_password(password):
+    return hashers.make_password(password)
+
+
+def _check_password(password, encoded):
+    return hashers.check_password(password, encoded)
+
+
+class PasswordHashingService:
+    """
+    Runs password hashing and verification, which is CPU bound by design, in a bounded pool of
+    worker processes, so it scales with cores and doesn't hold the GIL of web workers.
+    At most PASSWORD_HASHING['MAX_PENDING'] jobs are queued or running. Callers beyond that wait for
+    a free slot and get PasswordHashingBusy (503) if none frees up within PASSWORD_HASHING['TIMEOUT'] seconds,
+    so a burst of logins can't queue up unbounded work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition()
+        self._configured = False
+        self._executor = None
+        self.enabled = True
+        self.max_workers = None
+        self.max_pending = None
+        self.timeout = None
+        self.pending = 0
+        self.waiting = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    def configure(self):
+        config = commons_utils.get_config('PASSWORD_HASHING', commons_constants.PASSWORD_HASHING_DEFAULTS)
+        self.enabled = config['ENABLED']
+        self.max_workers = config['MAX_WORKERS'] or os.cpu_count() or 1
+        self.max_pending = (
+            config['MAX_PENDING'] or self.max_workers * commons_constants.PASSWORD_HASHING_PENDING_PER_WORKER
+        )
+        self.timeout = config['TIMEOUT']
+        self._configured = True
+
+    def _ensure_configured(self):
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    self.configure()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, initializer=_init_worker, initargs=(settings.PASSWORD_HASHERS,)
+            )
+        return self._executor
+
+    def _acquire(self, blocking=True):
+        """
+        Take a pending slot, waiting up to TIMEOUT seconds for one when blocking.
+        """
+        with self._slot_freed:
+            if self.pending >= self.max_pending:
+                if not blocking:
+                    return False
+                self.waiting += 1
+                try:
+                    acquired = self._slot_freed.wait_for(lambda: self.pending < self.max_pending, self.timeout)
+                finally:
+                    self.waiting -= 1
+                if not acquired:
+                    self.rejected += 1
+                    raise PasswordHashingBusy()
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+            return True
+
+    def _submit(self, func, *args):
+        with self._lock:
+            try:
+                try:
+                    future = self._get_executor().submit(func, *args)
+                except BrokenProcessPool:
+                    # a worker died (e.g. OOM killed), start a new pool.
+                    self._executor = None
+                    future = self._get_executor().submit(func, *args)
+            except Exception:
+                self._release()
+                raise
+        submitted_at = time.monotonic()
+        future.add_done_callback(lambda done: self._finished(done, submitted_at))
+        return future
+
+    def _release(self):
+        with self._slot_freed:
+            self.pending -= 1
+            self._slot_freed.notify()
+
+    def _finished(self, future, submitted_at):
+        with self._lock:
+            self.busy_seconds += time.monotonic() - submitted_at
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+        self._release()
+
+    @commons_profiling.timed('hashing')
+    def run(self, func, *args):
+        self._ensure_configured()
+        if not self.enabled:
+            return func(*args)
+        self._acquire()
+        future = self._submit(func, *args)
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            raise PasswordHashingBusy()
+
+    @commons_profiling.timed('hashing')
+    async def arun(self, func, *args):
+        self._ensure_configured()
+        if not self.enabled:
+            return await commons_utils.run_in_thread(func, *args)
+        if not self._acquire(blocking=False):
+            # only a full pool makes us wait, in a thread as waiting blocks.
+            await commons_utils.run_in_thread(self._acquire)
+        future = self._submit(func, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise PasswordHashingBusy()
+
+    def make_password(self, password):
+        if password is None:
+            # unusable password, nothing to hash.
+            return hashers.make_password(None)
+        return self.run(_make_password, password)
+
+    def check_password(self, password, encoded):
+        if password is None or not hashers.is_password_usable(encoded):
+            return False
+        return self.run(_check_password, password, encoded)
+
+    def make_passwords(self, passwords):
+        """
+        Hash many passwords (e.g. an import batch) spread over all workers, returns hashes in the same order.
+        Jobs take pending slots like any other, so a bulk caller waits for the pool instead of flooding it.
+        """
+        self._ensure_configured()
+        if not self.enabled:
+            return [hashers.make_password(password) for password in passwords]
+        futures = []
+        for password in passwords:
+            if password is None:
+                futures.append(None)
+                continue
+            self._acquire()
+            futures.append(self._submit(_make_password, password))
+        try:
+            return [
+                hashers.make_password(None) if future is None else future.result(self.timeout) for future in futures
+            ]
+        except TimeoutError:
+            raise PasswordHashingBusy()
+
+    async def acheck_password(self, password, encoded):
+        if password is None or not hashers.is_password_usable(encoded):
+            return False
+        return await self.arun(_check_password, password, encoded)
+
+    def stats(self):
+        self._ensure_configured()
+        with self._lock, self._slot_freed:
+            finished = self.completed + self.failed
+            return {
+                'enabled': self.enabled,
+                'workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                # jobs waiting for a free worker plus callers waiting for a pending slot.
+                'queue_depth': max(0, self.pending - self.max_workers) + self.waiting,
+                'waiting': self.waiting,
+                'peak_pending': self.peak_pending,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'avg_seconds': self.busy_seconds / finished if finished else 0.0,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+hashing_service = PasswordHashingService()
+
+
+def make_password(password):
+    return hashing_service.make_password(password)
+
+
+def check_password(password, encoded):
+    return hashing_service.check_password(password, encoded)
+
+
+def make_passwords(passwords):
+    return hashing_service.make_passwords(passwords)
+
+
+async def acheck_password(password, encoded):
+    return await hashing_service.acheck_password(password, encoded)
@@ -0,0 +1,218 @@
+import atexit
+import bisect
+import json
+import math
+import os
+import threading
+import time
+
+from social_networking.apps.commons import (
+    authentication as commons_authentication,
+    constants as commons_constants,
+    utils as commons_utils,
+)
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# name -> (type, help), in the order they are exposed.
+METRICS = {
+    'http_requests_total': (COUNTER, 'Requests served, by route (URL name), method and status code.'),
+    'http_request_duration_seconds': (HISTOGRAM, 'Time to produce a response, by route and method.'),
+    'http_requests_in_flight': (GAUGE, 'Requests being served.'),
+    'db_queries_total': (COUNTER, 'SQL queries run by requests, by route.'),
+    'db_query_duration_seconds_total': (COUNTER, 'Time spent running SQL queries of requests, by route.'),
+    'auth_token_cache_hits_total': (COUNTER, 'Authentication token lookups served from the token cache.'),
+    'auth_token_cache_misses_total': (COUNTER, 'Authentication token lookups which went to the database.'),
+    'auth_token_cache_hit_ratio': (GAUGE, 'Share of authentication token lookups served from the token cache.'),
+}
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+UNRESOLVED_ROUTE = 'unresolved'
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and latency histograms of this process, exposed in the Prometheus text format.
+    With METRICS['DIRECTORY'] set, every worker process writes a snapshot of its metrics to <DIRECTORY>/<pid>.json
+    at most every FLUSH_INTERVAL seconds (and at exit), and render() adds up snapshots of all workers:
+    counters and histograms of every worker that ever wrote one, gauges of live workers only.
+    Series are keyed by (name, sorted label pairs), a histogram holds its bucket counts followed by the sum.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured = False
+        self.directory = None
+        self.flush_interval = None
+        self.buckets = commons_constants.METRICS_LATENCY_BUCKETS
+        self.last_flush = 0.0
+        self.series = {}
+
+    def configure(self):
+        config = commons_utils.get_config('METRICS', commons_constants.METRICS_DEFAULTS)
+        self.directory = config['DIRECTORY']
+        self.flush_interval = config['FLUSH_INTERVAL']
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            atexit.register(self.flush)
+        self._configured = True
+
+    def _ensure_configured(self):
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    self.configure()
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def set(self, name, labels=(), value=0):
+        with self._lock:
+            self.series[(name, tuple(labels))] = value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(labels))
+        with self._lock:
+            histogram = self.series.get(key)
+            if histogram is None:
+                # one count per bucket, +Inf last, then the sum.
+                histogram = self.series[key] = [0] * (len(self.buckets) + 2)
+            histogram[bisect.bisect_left(self.buckets, value)] += 1
+            histogram[-1] += value
+
+    def request_started(self):
+        self._ensure_configured()
+        self.inc('http_requests_in_flight')
+
+    def request_finished(self, route, method, status, seconds, queries, db_seconds):
+        method = method if method in METHODS else 'other'
+        self.inc('http_requests_in_flight', amount=-1)
+        self.inc('http_requests_total', (('method', method), ('route', route), ('status', str(status))))
+        self.observe('http_request_duration_seconds', (('method', method), ('route', route)), seconds)
+        if queries:
+            self.inc('db_queries_total', (('route', route),), queries)
+            self.inc('db_query_duration_seconds_total', (('route', route),), db_seconds)
+        if self.directory and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def snapshot(self):
+        # process wide counters kept elsewhere.
+        token_cache_stats = commons_authentication.token_cache.stats()
+        self.set('auth_token_cache_hits_total', value=token_cache_stats['hits'])
+        self.set('auth_token_cache_misses_total', value=token_cache_stats['misses'])
+        with self._lock:
+            return {key: list(value) if isinstance(value, list) else value for key, value in self.series.items()}
+
+    def flush(self):
+        """
+        Write the snapshot of this process to the shared directory.
+        """
+        if not self.directory:
+            return
+        self.last_flush = time.monotonic()
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump([[name, labels, value] for (name, labels), value in self.snapshot().items()], file)
+        os.replace(temporary_path, path)
+
+    def collect(self):
+        """
+        Series of all workers added up (just this process without a shared directory).
+        """
+        self._ensure_configured()
+        merged = self.snapshot()
+        if self.directory:
+            own_file = f'{os.getpid()}.json'
+            for file_name in os.listdir(self.directory):
+                if not file_name.endswith('.json') or file_name == own_file:
+                    continue
+                try:
+                    with open(os.path.join(self.directory, file_name), encoding='utf-8') as file:
+                        series = json.load(file)
+                except (OSError, ValueError):
+                    # removed meanwhile, or not a snapshot.
+                    continue
+                pid = file_name[:-len('.json')]
+                alive = pid.isdigit() and _is_alive(int(pid))
+                for name, labels, value in series:
+                    if METRICS.get(name, (None,))[0] == GAUGE and not alive:
+                        continue
+                    self._merge(merged, (name, tuple(tuple(pair) for pair in labels)), value)
+        hits = merged.get(('auth_token_cache_hits_total', ()), 0)
+        lookups = hits + merged.get(('auth_token_cache_misses_total', ()), 0)
+        merged[('auth_token_cache_hit_ratio', ())] = hits / lookups if lookups else 0.0
+        return merged
+
+    @staticmethod
+    def _merge(merged, key, value):
+        current = merged.get(key)
+        if current is None:
+            merged[key] = value
+        elif isinstance(current, list):
+            # histograms with other buckets (changed settings) can't be added up.
+            if isinstance(value, list) and len(value) == len(current):
+                merged[key] = [total + count for total, count in zip(current, value)]
+        else:
+            merged[key] = current + value
+
+    def render(self):
+        """
+        All series in the Prometheus text exposition format.
+        """
+        series = self.collect()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            samples = sorted((labels, value) for (series_name, labels), value in series.items() if series_name == name)
+            if not samples:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                if kind != HISTOGRAM:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip((*self.buckets, math.inf), value[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels, le=_number(bound))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(value[-1])}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self.series.clear()
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,277 @@
+import asyncio
+import cProfile
+import hmac
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.permissions import SAFE_METHODS
+
+from social_networking.apps.commons import (
+    constants as commons_constants,
+    metrics as commons_metrics,
+    profiling as commons_profiling,
+    utils as commons_utils,
+)
+from social_networking.apps.commons.db import (
+    queries as db_queries,
+    routing as db_routing,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_view_class(view_func):
+    # DRF views and commons.async_views.as_async_view both keep the view class here.
+    return getattr(view_func, 'view_class', None)
+
+
+class QueryCountMiddleware:
+    """
+    Records SQL queries of every request per view (see db_queries.view_query_stats): number of queries,
+    DB time and query shapes run DUPLICATE_THRESHOLD or more times, which is what an N+1 looks like.
+    Views declare `query_budget`, the most queries a request may take. Requests over budget or having
+    duplicated queries are logged, with STRICT (for tests) they raise QueryBudgetExceeded.
+    Recorder of a request is kept as request.query_recorder.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = commons_utils.get_config('QUERY_INSTRUMENTATION', commons_constants.QUERY_INSTRUMENTATION_DEFAULTS)
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.duplicate_threshold = config['DUPLICATE_THRESHOLD']
+        self.strict = config['STRICT']
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # makes Django call this middleware as a coroutine function.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with db_queries.record_queries() as recorder:
+            response = self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    async def __acall__(self, request):
+        with db_queries.record_queries() as recorder:
+            response = await self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    def check(self, request, recorder):
+        request.query_recorder = recorder
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is None:
+            # not routed to a view (404), nothing to account it to.
+            return
+        view_name = resolver_match.view_name
+        budget = getattr(get_view_class(resolver_match.func), 'query_budget', None)
+        over_budget = budget is not None and recorder.count > budget
+        duplicates = recorder.duplicates(self.duplicate_threshold)
+        db_queries.view_query_stats.add(view_name, recorder, duplicates, over_budget)
+
+        if not over_budget and not duplicates:
+            return
+        problems = []
+        if over_budget:
+            problems.append(f'{recorder.count} queries, budget is {budget}')
+        problems.extend(f'{count} times: {shape}' for shape, count in duplicates.items())
+        message = f'{request.method} {request.path} ({view_name}): ' + '; '.join(problems)
+        if self.strict:
+            raise db_queries.QueryBudgetExceeded(f'{message}\n{recorder.report()}')
+        logger.warning(message)
+
+
+class MetricsMiddleware:
+    """
+    Request metrics exposed at /metrics (see commons.metrics): latency histogram and status codes per route
+    (URL name) and method, SQL queries and their time per route and requests in flight.
+    Goes right after QueryCountMiddleware, whose recorder gives the DB time. Streaming responses are
+    timed till their first byte.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = commons_utils.get_config('METRICS', commons_constants.METRICS_DEFAULTS)
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        commons_metrics.registry.request_started()
+        started_at = time.perf_counter()
+        response = None
+        try:
+            with db_queries.measure_queries() as measured:
+                response = self.get_response(request)
+        finally:
+            self.finish(request, response, time.perf_counter() - started_at, measured)
+        return response
+
+    async def __acall__(self, request):
+        commons_metrics.registry.request_started()
+        started_at = time.perf_counter()
+        response = None
+        try:
+            with db_queries.measure_queries() as measured:
+                response = await self.get_response(request)
+        finally:
+            self.finish(request, response, time.perf_counter() - started_at, measured)
+        return response
+
+    def finish(self, request, response, seconds, measured):
+        resolver_match = getattr(request, 'resolver_match', None)
+        commons_metrics.registry.request_finished(
+            resolver_match.view_name if resolver_match else commons_metrics.UNRESOLVED_ROUTE,
+            request.method,
+            response.status_code if response is not None else 500,
+            seconds,
+            measured.count,
+            measured.seconds,
+        )
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in profiling of single requests. A request sending the PROFILING['HEADER'] header with the value
+    PROFILING['TOKEN'] (ignored while no TOKEN is set) or picked at PROFILING['SAMPLE_RATE'] gets a Server-Timing header
+    telling time spent in phases: auth, throttle, validation, hashing, token, db, serialization, render,
+    handler and total (see commons.profiling, phases may nest).
+    With PROFILING['CPROFILE_DIR'] set, profiled sync requests also run under cProfile, one at a time,
+    and pstats files of the CPROFILE_SLOWEST slowest ones of every process are kept there.
+    Goes right after QueryCountMiddleware, whose recorder gives the DB time.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = commons_utils.get_config('PROFILING', commons_constants.PROFILING_DEFAULTS)
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.header = 'HTTP_' + config['HEADER'].upper().replace('-', '_')
+        self.token = config['TOKEN']
+        self.sample_rate = config['SAMPLE_RATE']
+        self.cprofile_dir = config['CPROFILE_DIR']
+        self.cprofile_slowest = config['CPROFILE_SLOWEST']
+        # cProfile sees one thread only and profilers of concurrent requests would mix up.
+        self._cprofile_lock = threading.Lock()
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def should_profile(self, request):
+        # anyone could ask for timings without a token, for Ex: telling registered emails from login timings.
+        if self.token and request.META.get(self.header) is not None:
+            return hmac.compare_digest(request.META[self.header], self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profiler = None
+        if self.cprofile_dir and self._cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+        started_at = time.perf_counter()
+        try:
+            with commons_profiling.profile_request() as profile, self.database_time(profile):
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+            seconds = time.perf_counter() - started_at
+            if profiler is not None:
+                commons_profiling.slowest_profiles.add(
+                    profiler, seconds, self.label(request), self.cprofile_dir, self.cprofile_slowest
+                )
+        finally:
+            if profiler is not None:
+                self._cprofile_lock.release()
+        return self.finish(response, profile, seconds)
+
+    async def __acall__(self, request):
+        if not self.should_profile(request):
+            return await self.get_response(request)
+        started_at = time.perf_counter()
+        with commons_profiling.profile_request() as profile, self.database_time(profile):
+            response = await self.get_response(request)
+        return self.finish(response, profile, time.perf_counter() - started_at)
+
+    @contextmanager
+    def database_time(self, profile):
+        with db_queries.measure_queries() as measured:
+            yield
+        if measured.count:
+            profile.add('db', measured.seconds, measured.count)
+
+    def finish(self, response, profile, seconds):
+        profile.add('total', seconds)
+        server_timing = profile.server_timing()
+        if response.has_header('Server-Timing'):
+            server_timing = f'{response["Server-Timing"]}, {server_timing}'
+        response['Server-Timing'] = server_timing
+        return response
+
+    @staticmethod
+    def label(request):
+        resolver_match = getattr(request, 'resolver_match', None)
+        view_name = resolver_match.view_name if resolver_match else 'unresolved'
+        return re.sub(r'[^\w.-]', '_', f'{request.method}-{view_name}')
+
+
+class ReadReplicaMiddleware:
+    """
+    Sends reads of GET (HEAD, OPTIONS) requests to views having `read_replica = True` to one of
+    DATABASE_ROUTING['REPLICAS'], all other requests read from the primary. Users pinned to the primary
+    (see commons.db.routing) read from it anyway, and a successful write request pins its user.
+    Not used while there are no replicas.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not db_routing.replica_routing.has_replicas():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with db_routing.request_routing() as state:
+            response = self.get_response(request)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        with db_routing.request_routing() as state:
+            response = await self.get_response(request)
+        return self.finish(request, response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in SAFE_METHODS and getattr(get_view_class(view_func), 'read_replica', False):
+            db_routing.use_replica()
+
+    @staticmethod
+    def finish(request, response, state):
+        if request.method not in SAFE_METHODS and response.status_code < 400 and state.user_id is not None:
+            db_routing.pin_to_primary(state.user_id)
+        return response
@@ -0,0 +1,172 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+
+from rest_framework import exceptions, pagination, response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from social_networking.apps.commons import constants as commons_constants
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Keyset (seek) pagination. Every page is fetched with `WHERE <ordering> < <last row of previous page>`
+    instead of an OFFSET, so page N costs the same as page 1. Cursors are opaque base64 strings and
+    total count is computed only when asked for with `?count=true`.
+    """
+    cursor_query_param = commons_constants.CURSOR_QUERY_PARAM
+    count_query_param = commons_constants.COUNT_QUERY_PARAM
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=('-id',)):
+        self.ordering = tuple(ordering)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.count = None
+        self.next_position = None
+        self.previous_position = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        position, reverse = self.decode_cursor(request)
+
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+
+        ordering = self.ordering
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(position, reverse))
+        if reverse:
+            ordering = tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+        # fetch one extra row to know whether there is anything beyond this page.
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        if rows:
+            # moving forward we came from a page before this one, moving backward we came from a page after it.
+            has_next = True if reverse else has_more
+            has_previous = has_more if reverse else position is not None
+            self.next_position = self.get_position(rows[-1]) if has_next else None
+            self.previous_position = self.get_position(rows[0]) if has_previous else None
+        return rows
+
+    def seek_filter(self, position, reverse):
+        """
+        Build lexicographic comparison `(a, b) < (x, y)` as `a < x OR (a = x AND b < y)`.
+        """
+        seek = Q()
+        for index, field in enumerate(self.ordering):
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            condition = Q(**{f'{self.fields[index]}__{lookup}': position[index]})
+            for previous_index in range(index):
+                condition &= Q(**{self.fields[previous_index]: position[previous_index]})
+            seek |= condition
+        return seek
+
+    def get_position(self, row):
+        if isinstance(row, dict):
+            return [row[field] for field in self.fields]
+        return [getattr(row, field) for field in self.fields]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            position = cursor['p']
+            reverse = bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise exceptions.NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.fields):
+            raise exceptions.NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position, reverse=False):
+        cursor = {'p': position}
+        if reverse:
+            cursor['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('ascii')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict()
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['next'] = self.get_next_link()
+        payload['previous'] = self.get_previous_link()
+        payload['results'] = data
+        return response.Response(payload)
+
+
+class PaginationMixin:
+    """
+    Lets a view pick between page number and keyset pagination.
+    `pagination_mode` is the endpoint default, clients can override it with `?pagination=page|cursor`
+    and passing a `cursor` always means keyset pagination.
+    """
+    pagination_mode = commons_constants.PAGE_PAGINATION
+    keyset_ordering = ('-id',)
+
+    def get_paginator(self, request, keyset_ordering=None):
+        mode = request.query_params.get(commons_constants.PAGINATION_QUERY_PARAM, self.pagination_mode)
+        if commons_constants.CURSOR_QUERY_PARAM in request.query_params:
+            mode = commons_constants.CURSOR_PAGINATION
+        if mode == commons_constants.CURSOR_PAGINATION:
+            return KeysetPagination(ordering=keyset_ordering or self.keyset_ordering)
+        return pagination.PageNumberPagination()
+
+    @staticmethod
+    def pagination_key(request, paginator):
+        """
+        Query params picking the page, to cache pages of a result by.
+        """
+        if isinstance(paginator, KeysetPagination):
+            params = (paginator.cursor_query_param, paginator.count_query_param)
+        else:
+            params = (paginator.page_query_param, paginator.page_size_query_param)
+        return (type(paginator).__name__, *(request.query_params.get(param) for param in params if param))
+
+    @staticmethod
+    def paginator_state(paginator):
+        """
+        What the response of a paginated page is built from besides its rows, see restore_paginator.
+        """
+        if isinstance(paginator, KeysetPagination):
+            return {'count': paginator.count, 'next': paginator.next_position, 'previous': paginator.previous_position}
+        return {'count': paginator.page.paginator.count, 'number': paginator.page.number}
+
+    @staticmethod
+    def restore_paginator(paginator, state, request):
+        """
+        Bring a fresh paginator to the state it had after paginating a page, without the queryset,
+        so get_paginated_response builds links to neighbour pages for this request's URL.
+        """
+        paginator.request = request
+        if isinstance(paginator, KeysetPagination):
+            paginator.count = state['count']
+            paginator.next_position = state['next']
+            paginator.previous_position = state['previous']
+        else:
+            page_size = paginator.get_page_size(request)
+            paginator.page = paginator.django_paginator_class(range(state['count']), page_size).page(state['number'])
+        return paginator
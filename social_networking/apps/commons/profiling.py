@@ -0,0 +1,176 @@
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# set for requests being profiled only, phases of other requests cost a context variable lookup.
+_profile = contextvars.ContextVar('request_profile', default=None)
+
+# DRF APIView methods timed by the profiled class decorator.
+VIEW_PHASES = (
+    ('perform_authentication', 'auth'),
+    ('check_permissions', 'permissions'),
+    ('check_throttles', 'throttle'),
+)
+
+
+class RequestProfile:
+    """
+    Wall time spent in named phases of one request, in the order phases were first entered.
+    Phases may nest (e.g. token inside serialization), each one is timed on its own.
+    """
+
+    def __init__(self):
+        self.phases = {}
+
+    def add(self, name, seconds, count=1):
+        total, calls = self.phases.get(name, (0.0, 0))
+        self.phases[name] = (total + seconds, calls + count)
+
+    def server_timing(self):
+        """
+        Value of a Server-Timing header, for Ex: auth;dur=0.4, validation;dur=12.1, db;dur=2.3;desc="5 calls"
+        """
+        metrics = []
+        for name, (seconds, calls) in self.phases.items():
+            metric = f'{name};dur={seconds * 1000:.2f}'
+            if calls > 1:
+                metric += f';desc="{calls} calls"'
+            metrics.append(metric)
+        return ', '.join(metrics)
+
+
+def is_profiling():
+    return _profile.get() is not None
+
+
+@contextmanager
+def profile_request():
+    """
+    Profile phases run in the block (and in threads started from its context, like async views' DB work).
+    """
+    profile = RequestProfile()
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+
+@contextmanager
+def phase(name):
+    """
+    Time the block as phase `name` of the request being profiled, for Ex:
+        with commons_profiling.phase('validation'):
+            serializer.is_valid(raise_exception=True)
+    """
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - started_at)
+
+
+def discard(*names):
+    """
+    Leave phases out of the profile of the running request, for Ex: hashing of a failed login,
+    which only shows up when the email exists.
+    """
+    profile = _profile.get()
+    if profile is not None:
+        for name in names:
+            profile.phases.pop(name, None)
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function (sync or async) as phase `name`.
+    """
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with phase(name):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with phase(name):
+                    return func(*args, **kwargs)
+        wrapper.profiled_phase = name
+        return wrapper
+    return decorator
+
+
+def profiled(view_class):
+    """
+    Class decorator of DRF views timing authentication, permission and throttle checks, the handler
+    and rendering of profiled requests, see ProfilingMiddleware. Views time finer phases of their
+    handlers (validation, serialization) with `phase`.
+    """
+    methods = [(method_name, name) for method_name, name in VIEW_PHASES]
+    methods += [(method_name, 'handler') for method_name in view_class.http_method_names]
+    for method_name, name in methods:
+        method = getattr(view_class, method_name, None)
+        # methods inherited from a profiled view are timed already.
+        if method is not None and not hasattr(method, 'profiled_phase'):
+            setattr(view_class, method_name, timed(name)(method))
+
+    finalize_response = view_class.finalize_response
+    if not hasattr(finalize_response, 'profiled_phase'):
+        @functools.wraps(finalize_response)
+        def finalize_and_render(self, request, response, *args, **kwargs):
+            response = finalize_response(self, request, response, *args, **kwargs)
+            if is_profiling() and not getattr(response, 'is_rendered', True):
+                # rendered here to be timed, Django won't render it again.
+                with phase('render'):
+                    response.render()
+            return response
+        finalize_and_render.profiled_phase = 'render'
+        view_class.finalize_response = finalize_and_render
+    return view_class
+
+
+class SlowestProfiles:
+    """
+    Keeps cProfile stats files (pstats) of the `size` slowest profiled requests of this process in a directory,
+    files of requests pushed out by slower ones are deleted. Load one with pstats.Stats(path).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slowest = []
+        self._sequence = itertools.count()
+
+    def add(self, profiler, seconds, label, directory, size):
+        with self._lock:
+            if len(self._slowest) >= size and seconds <= self._slowest[0][0]:
+                return None
+            os.makedirs(directory, exist_ok=True)
+            file_name = f'{seconds * 1000:010.2f}ms-{label}-{os.getpid()}-{next(self._sequence)}.prof'
+            path = os.path.join(directory, file_name)
+            profiler.dump_stats(path)
+            heapq.heappush(self._slowest, (seconds, path))
+            if len(self._slowest) > size:
+                try:
+                    os.remove(heapq.heappop(self._slowest)[1])
+                except FileNotFoundError:
+                    pass
+            return path
+
+    def paths(self):
+        with self._lock:
+            return [path for _, path in sorted(self._slowest, reverse=True)]
+
+
+slowest_profiles = SlowestProfiles()
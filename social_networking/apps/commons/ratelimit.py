@@ -0,0 +1,203 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from rest_framework import throttling
+from rest_framework.settings import api_settings
+
+from social_networking.apps.commons import (
+    constants as commons_constants,
+    utils as commons_utils,
+)
+
+
+class InMemoryRateLimitBackend:
+    """
+    Exact sliding window kept in process: a deque of hit times per key.
+    Keys are bounded with LRU eviction so memory can't grow with number of callers.
+    Good for a single worker or as a per worker limit.
+    """
+
+    def __init__(self, max_keys=commons_constants.RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._hits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, cost=1):
+        """
+        Record `cost` hits for key if allowed. Return (allowed, seconds to wait before they would be allowed).
+        """
+        if cost > limit:
+            return False, float(window)
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                hits = self._hits[key] = deque()
+            self._hits.move_to_end(key)
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) + cost > limit:
+                return False, hits[len(hits) + cost - limit - 1] + window - now
+            hits.extend([now] * cost)
+            while len(self._hits) > self.max_keys:
+                self._hits.popitem(last=False)
+            return True, 0.0
+
+    def refund(self, key, window, cost=1):
+        """
+        Give back `cost` recorded hits of key, for Ex: of an attempt which turned out to do nothing.
+        """
+        with self._lock:
+            hits = self._hits.get(key)
+            for _ in range(min(cost, len(hits or ()))):
+                hits.pop()
+
+    def clear(self):
+        with self._lock:
+            self._hits.clear()
+
+
+class CacheRateLimitBackend:
+    """
+    Sliding window counter shared by all workers through a Django cache (redis/memcached, or
+    locmem as local stand-in). Hits of current and previous fixed windows are kept as two counters and
+    previous window is weighted by how much of it still overlaps the sliding window.
+    Counter is incremented before it is checked, so concurrent hits can't all slip through.
+    """
+
+    def __init__(self, cache_alias='default', key_prefix='ratelimit'):
+        self.cache = caches[cache_alias]
+        self.key_prefix = key_prefix
+
+    def hit(self, key, limit, window, cost=1):
+        if cost > limit:
+            return False, float(window)
+        now = time.time()
+        current_window = int(now // window)
+        elapsed = now - current_window * window
+        current_key = f'{self.key_prefix}:{key}:{current_window}'
+        previous_key = f'{self.key_prefix}:{key}:{current_window - 1}'
+
+        previous = self.cache.get(previous_key, 0)
+        self.cache.add(current_key, 0, timeout=window * 2)
+        try:
+            current = self.cache.incr(current_key, cost)
+        except ValueError:
+            # expired between add and incr
+            self.cache.set(current_key, cost, timeout=window * 2)
+            current = cost
+
+        weight = (window - elapsed) / window
+        if previous * weight + current <= limit:
+            return True, 0.0
+
+        # rejected hits are not counted.
+        self.cache.decr(current_key, cost)
+        if current > limit or not previous:
+            return False, window - elapsed
+        # wait till enough of the previous window slides out.
+        return False, max(0.0, (window - elapsed) - (limit - current) * window / previous)
+
+    def refund(self, key, window, cost=1):
+        current_key = f'{self.key_prefix}:{key}:{int(time.time() // window)}'
+        try:
+            if self.cache.decr(current_key, cost) < 0:
+                self.cache.set(current_key, 0, timeout=window * 2)
+        except ValueError:
+            # hit in a window which is gone, it no longer counts anyway.
+            pass
+
+    def clear(self):
+        self.cache.clear()
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Backend configured by settings.RATE_LIMIT, created once per process.
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                config = commons_utils.get_config('RATE_LIMIT', commons_constants.RATE_LIMIT_DEFAULTS)
+                _rate_limiter = import_string(config['BACKEND'])(**config['OPTIONS'])
+    return _rate_limiter
+
+
+def reset_rate_limiter():
+    global _rate_limiter
+    _rate_limiter = None
+
+
+def hit(key, limit, window, cost=1):
+    """
+    Shortcut to rate limit anything outside of DRF views.
+    """
+    return get_rate_limiter().hit(key, limit, window, cost)
+
+
+def refund(request, cost=None):
+    """
+    Give back hits SlidingWindowThrottle recorded for a request, all of them or at most `cost`,
+    for Ex: a view limiting created friend requests refunds attempts which failed validation.
+    """
+    for key, window, charged in getattr(request, 'throttle_charges', ()):
+        amount = charged if cost is None else min(cost, charged)
+        if amount:
+            get_rate_limiter().refund(key, window, amount)
+
+
+class SlidingWindowThrottle(throttling.SimpleRateThrottle):
+    """
+    DRF throttle backed by the rate limiter backend, so rejected requests never reach the DB.
+    Like ScopedRateThrottle, scope comes from `throttle_scope` of the view and rate from DEFAULT_THROTTLE_RATES.
+    Authenticated requests are keyed by user id and anonymous requests by client IP.
+    Views doing many things per request (bulk endpoints) can define `get_throttle_cost(request)`.
+    Hits are recorded on the request, so a view counting only what it did can give them back, see refund().
+    """
+    scope_attr = 'throttle_scope'
+
+    def __init__(self):
+        # rate is known only when we know the view.
+        self.wait_time = None
+
+    def get_rate(self):
+        try:
+            return api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured(f"No default throttle rate set for '{self.scope}' scope")
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        cost = view.get_throttle_cost(request) if hasattr(view, 'get_throttle_cost') else 1
+        allowed, self.wait_time = get_rate_limiter().hit(self.key, self.num_requests, self.duration, cost)
+        if allowed:
+            request.throttle_charges = [*getattr(request, 'throttle_charges', ()), (self.key, self.duration, cost)]
+        return allowed
+
+    def wait(self):
+        return self.wait_time
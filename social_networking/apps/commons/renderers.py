@@ -0,0 +1,31 @@
+from rest_framework import renderers
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.utils import encoders
+
+_encoder = encoders.JSONEncoder(
+    ensure_ascii=renderers.JSONRenderer.ensure_ascii, allow_nan=not renderers.JSONRenderer.strict,
+    separators=SHORT_SEPARATORS if renderers.JSONRenderer.compact else LONG_SEPARATORS
+)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer with the same bytes out, minus the per response overhead: one encoder is built
+    at import and reused, and media type parameters are parsed only when there are some.
+    Indented output (e.g. `Accept: application/json; indent=4` or the browsable API) goes through JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (accepted_media_type and ';' in accepted_media_type) or (renderer_context or {}).get('indent'):
+            return super().render(data, accepted_media_type, renderer_context)
+        # same escaping as JSONRenderer, output must be a strict javascript subset.
+        return _encoder.encode(data).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def render_ndjson(items):
+    """
+    Items as newline delimited JSON (one compact JSON document per line), encoded like FastJSONRenderer.
+    """
+    return ''.join(f'{_encoder.encode(item)}\n' for item in items).encode()
@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+
+from social_networking.apps.commons import (
+    constants as commons_constants,
+    middleware as commons_middleware,
+    utils as commons_utils,
+)
+from social_networking.apps.commons.db import queries as db_queries
+
+
+def _check(recorder, max_queries, max_duplicates, label):
+    config = commons_utils.get_config('QUERY_INSTRUMENTATION', commons_constants.QUERY_INSTRUMENTATION_DEFAULTS)
+    problems = []
+    if max_queries is not None and recorder.count > max_queries:
+        problems.append(f'{recorder.count} queries, budget is {max_queries}')
+    duplicates = recorder.duplicates(config['DUPLICATE_THRESHOLD'])
+    if len(duplicates) > max_duplicates:
+        problems.extend(f'{count} times: {shape}' for shape, count in duplicates.items())
+    if problems:
+        raise AssertionError(f'{label}: ' + '; '.join(problems) + f'\n{recorder.report()}')
+
+
+@contextmanager
+def assert_max_queries(max_queries, max_duplicates=0):
+    """
+    Fail when code in the block runs more than max_queries queries, or duplicated query shapes, for Ex:
+        with assert_max_queries(2):
+            users_search.user_rows_for_ids(user_ids)
+    """
+    with db_queries.record_queries() as recorder:
+        yield recorder
+    _check(recorder, max_queries, max_duplicates, 'Query budget exceeded')
+
+
+def assert_query_budget(response, max_queries=None, max_duplicates=0):
+    """
+    Fail when the request of a test client response took more queries than `query_budget` of its view
+    (or max_queries), or ran duplicated query shapes. Needs QueryCountMiddleware, for Ex:
+        response = self.client.get(reverse('list-friends'), HTTP_AUTHORIZATION=f'Token {token}')
+        assert_query_budget(response)
+    """
+    request = getattr(response, 'wsgi_request', None) or getattr(response, 'asgi_request', None)
+    recorder = getattr(request, 'query_recorder', None)
+    if recorder is None:
+        raise AssertionError('Queries were not recorded, is QueryCountMiddleware enabled?')
+    if max_queries is None:
+        view_class = commons_middleware.get_view_class(response.resolver_match.func)
+        max_queries = getattr(view_class, 'query_budget', None)
+        if max_queries is None:
+            raise AssertionError(f'{response.resolver_match.view_name} declares no query_budget')
+    _check(recorder, max_queries, max_duplicates, response.resolver_match.view_name)
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin checking query budgets, see assert_query_budget and assert_max_queries.
+    """
+
+    def assertQueryBudget(self, response, max_queries=None, max_duplicates=0):
+        assert_query_budget(response, max_queries, max_duplicates)
+
+    def assertMaxQueries(self, max_queries, max_duplicates=0):
+        return assert_max_queries(max_queries, max_duplicates)
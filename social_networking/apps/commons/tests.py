@@ -1,3 +1,299 @@
-from django.test import TestCase
+import time
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from social_networking.apps.users import models as users_models
+from social_networking.apps.commons import (
+    authentication as commons_authentication,
+    cache as commons_cache,
+    ratelimit as commons_ratelimit,
+    serializers as commons_serializers,
+    signing as commons_signing,
+    testing as commons_testing,
+)
+
+LOCAL_CACHE = {'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'commons-tests'}}
+
+
+class RateLimitTests(SimpleTestCase):
+
+    def test_in_memory_refund(self):
+        backend = commons_ratelimit.InMemoryRateLimitBackend()
+        self.assertEqual(backend.hit('user', 3, 60, cost=2), (True, 0.0))
+        self.assertFalse(backend.hit('user', 3, 60, cost=2)[0])
+        backend.refund('user', 60)
+        self.assertTrue(backend.hit('user', 3, 60, cost=2)[0])
+        # refunds never go below nothing.
+        backend.refund('user', 60, cost=10)
+        self.assertTrue(backend.hit('user', 3, 60, cost=3)[0])
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_cache_refund(self):
+        backend = commons_ratelimit.CacheRateLimitBackend('shared', key_prefix='test-ratelimit')
+        backend.clear()
+        self.assertTrue(backend.hit('user', 2, 60, cost=2)[0])
+        self.assertFalse(backend.hit('user', 2, 60)[0])
+        backend.refund('user', 60)
+        self.assertTrue(backend.hit('user', 2, 60)[0])
+        backend.refund('user', 60, cost=10)
+        self.assertTrue(backend.hit('user', 2, 60, cost=2)[0])
+
+
+@override_settings(PROFILING={'TOKEN': 'profiler-token', 'SAMPLE_RATE': 0.0})
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        commons_ratelimit.reset_rate_limiter()
+        users_models.SocialNetworkingUser.objects.create(email='user@example.com', name='User', password='Secret123')
+
+    def login(self, email, password, **headers):
+        return APIClient().post(reverse('login'), {'email': email, 'password': password}, format='json', **headers)
+
+    def test_profiled_only_with_token(self):
+        self.assertNotIn('Server-Timing', self.login('user@example.com', 'Secret123', HTTP_X_PROFILE='1'))
+        response = self.login('user@example.com', 'Secret123', HTTP_X_PROFILE='profiler-token')
+        self.assertEqual(response.status_code, 202)
+        self.assertIn('Server-Timing', response)
+
+    def test_failed_logins_look_alike(self):
+        # timings must not tell registered emails (password hashed) from unknown ones.
+        for email in ('user@example.com', 'nobody@example.com'):
+            response = self.login(email, 'Wrong123', HTTP_X_PROFILE='profiler-token')
+            self.assertNotIn('hashing', response['Server-Timing'])
+
+
+@override_settings(METRICS={'TOKEN': 'scraper-token'})
+class MetricsViewTests(TestCase):
+
+    def test_served_to_scrapers_with_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.assertEqual(
+            self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong-token').status_code, 401
+        )
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scraper-token')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS={'TOKEN': None})
+    def test_not_served_without_token(self):
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer None').status_code, 404)
+
+
+class TokenCacheTests(TestCase):
+
+    def setUp(self):
+        commons_authentication.token_cache.configure()
+        commons_authentication.revocation_list.clear()
+        self.user = users_models.SocialNetworkingUser.objects.create(
+            email='user@example.com', name='User', password='Secret123'
+        )
+        self.token = users_models.Token.objects.create(user=self.user)
+
+    def tearDown(self):
+        commons_authentication.token_cache.clear()
+        commons_authentication.revocation_list.clear()
+
+    def test_entries_fetched_before_a_revocation_are_dropped(self):
+        token_cache = commons_authentication.token_cache
+        fetched_at = commons_signing.now_ms()
+        token_cache.set(self.token.key, self.user, self.token, fetched_at)
+        self.assertEqual(token_cache.get(self.token.key)[0].id, self.user.id)
+
+        # seen by this worker's revocation list, whichever worker revoked.
+        commons_authentication.revocation_list.add(self.user.id, fetched_at)
+        self.assertIsNone(token_cache.get(self.token.key))
+
+        token_cache.set(self.token.key, self.user, self.token, fetched_at + 1)
+        self.assertIsNotNone(token_cache.get(self.token.key))
+
+    def test_revocations_of_other_workers_are_pulled(self):
+        revocation_list = commons_authentication.revocation_list
+        revoked_before = commons_signing.now_ms()
+        users_models.AccessTokenRevocation.objects.bulk_create([
+            users_models.AccessTokenRevocation(user_id=self.user.id, revoked_before=revoked_before)
+        ])
+        self.assertTrue(revocation_list.is_user_revoked(self.user.id, revoked_before))
+        self.assertFalse(revocation_list.is_user_revoked(self.user.id, revoked_before + 1))
+
+    def test_cached_instances_are_copies(self):
+        token_cache = commons_authentication.token_cache
+        token_cache.set(self.token.key, self.user, self.token)
+        user, _ = token_cache.get(self.token.key)
+        user.name = 'Changed'
+        self.assertEqual(token_cache.get(self.token.key)[0].name, 'User')
+
+
+def double(value):
+    return value * 2
+
+
+class Prefixed:
+    """
+    Converter with bind(), called once per serialization.
+    """
+
+    def __init__(self):
+        self.binds = 0
+
+    def bind(self):
+        self.binds += 1
+        return lambda value: f'#{value}'
+
+
+class ItemValuesSerializer(commons_serializers.ValuesSerializer):
+    fields = (
+        ('id', 'id'),
+        ('owner.id', 'owner_id'),
+        ('count', 'count', double),
+        ('owner.name', 'owner__name'),
+        ('code', 'id', Prefixed()),
+    )
+
+
+class ValuesSerializerTests(SimpleTestCase):
+
+    def test_rows_are_built_in_declaration_order(self):
+        rows = [
+            {'id': 1, 'owner_id': 7, 'owner__name': 'Seven', 'count': 2},
+            {'id': 2, 'owner_id': 8, 'owner__name': 'Eight', 'count': 0},
+        ]
+        items = ItemValuesSerializer().to_representation(rows)
+        self.assertEqual(items, [
+            {'id': 1, 'owner': {'id': 7, 'name': 'Seven'}, 'count': 4, 'code': '#1'},
+            {'id': 2, 'owner': {'id': 8, 'name': 'Eight'}, 'count': 0, 'code': '#2'},
+        ])
+        self.assertEqual([list(item) for item in items], [['id', 'owner', 'count', 'code']] * 2)
+        self.assertEqual(ItemValuesSerializer.lookups, ['id', 'owner_id', 'count', 'owner__name'])
+
+    def test_converters_are_bound_once_per_serialization(self):
+        converter = ItemValuesSerializer.fields[-1][2]
+        binds = converter.binds
+        ItemValuesSerializer().to_representation(
+            [{'id': index, 'owner_id': 1, 'owner__name': '', 'count': 0} for index in range(3)]
+        )
+        self.assertEqual(converter.binds, binds + 1)
+
+    def test_field_values_are_not_evaluated(self):
+        class QuotedValuesSerializer(commons_serializers.ValuesSerializer):
+            fields = (("it's \"quoted\"", 'id'), ('lookup', "__import__('os')"))
+
+        self.assertEqual(
+            QuotedValuesSerializer().to_representation([{'id': 1, "__import__('os')": 2}]),
+            [{"it's \"quoted\"": 1, 'lookup': 2}],
+        )
+
+
+class SigningTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        token = commons_signing.sign_access_token(42, 60)
+        self.assertTrue(commons_signing.is_access_token(token))
+        self.assertEqual(commons_signing.unsign_access_token(token).user_id, 42)
+
+    def test_tampered_and_expired_tokens(self):
+        payload, _, signature = commons_signing.sign_access_token(42, 60).rpartition('.')
+        with self.assertRaises(commons_signing.InvalidAccessToken):
+            commons_signing.unsign_access_token(payload.replace('42', '43', 1) + '.' + signature)
+        with self.assertRaises(commons_signing.InvalidAccessToken):
+            commons_signing.unsign_access_token(commons_signing.sign_access_token(42, -1))
+
+
+class SearchCacheTests(SimpleTestCase):
+
+    def tearDown(self):
+        commons_cache.search_cache.configure()
+
+    def check_generations(self):
+        search_cache = commons_cache.search_cache
+        search_cache.configure()
+        page_key = search_cache.page_key(('sumit', None, 1))
+        search_cache.set(page_key, {'results': []})
+        self.assertEqual(search_cache.get(search_cache.page_key(('sumit', None, 1))), {'results': []})
+        self.assertIsNone(search_cache.get(search_cache.page_key(('sumit', 4, 1))))
+        search_cache.bump()
+        self.assertIsNone(search_cache.get(search_cache.page_key(('sumit', None, 1))))
+        # a page built while the generation changed is stored under the old one.
+        search_cache.set(page_key, {'results': [1]})
+        self.assertIsNone(search_cache.get(search_cache.page_key(('sumit', None, 1))))
+
+    def test_local_generations(self):
+        self.check_generations()
+
+    @override_settings(CACHES=LOCAL_CACHE, SEARCH_CACHE={'SHARED_CACHE_ALIAS': 'shared'})
+    def test_shared_generations(self):
+        self.check_generations()
+
+    @override_settings(SEARCH_CACHE={'ENABLED': False})
+    def test_disabled(self):
+        search_cache = commons_cache.search_cache
+        search_cache.configure()
+        self.assertIsNone(search_cache.page_key(('sumit', None, 1)))
+        search_cache.set(None, {'results': []})
+        self.assertIsNone(search_cache.get(None))
+
+
+class LRUCacheTests(SimpleTestCase):
+
+    def test_least_recently_used_goes_first(self):
+        cache = commons_cache.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_entries_expire(self):
+        cache = commons_cache.LRUCache(2, timeout=0.01)
+        cache.set('a', 1)
+        cache.set('b', 2, timeout=60)
+        time.sleep(0.02)
+        self.assertEqual((cache.get('a'), cache.get('b')), (None, 2))
+
+
+class ResponseCacheTests(SimpleTestCase):
+
+    def tearDown(self):
+        commons_cache.response_cache.configure()
+
+    def check_versions(self):
+        response_cache = commons_cache.response_cache
+        response_cache.configure()
+        version = response_cache.get_version(1)
+        self.assertEqual(response_cache.get_version(1), version)
+        response_cache.bump([1])
+        self.assertNotEqual(response_cache.get_version(1), version)
+
+    def test_local_versions(self):
+        self.check_versions()
+
+    @override_settings(CACHES=LOCAL_CACHE, LIST_CACHE={'SHARED_CACHE_ALIAS': 'shared'})
+    def test_shared_versions(self):
+        self.check_versions()
+
+    @override_settings(LIST_CACHE={'ENABLED': False})
+    def test_disabled(self):
+        commons_cache.response_cache.configure()
+        self.assertFalse(commons_cache.response_cache.is_enabled())
+
+
+class QueryBudgetTests(commons_testing.QueryBudgetTestMixin, TestCase):
+
+    def test_budget_and_duplicates(self):
+        with self.assertMaxQueries(1):
+            users_models.SocialNetworkingUser.objects.count()
+        with self.assertRaisesMessage(AssertionError, '2 queries, budget is 1'):
+            with self.assertMaxQueries(1):
+                users_models.SocialNetworkingUser.objects.count()
+                users_models.Token.objects.count()
+        with self.assertRaisesMessage(AssertionError, '3 times'):
+            with self.assertMaxQueries(None):
+                for user_id in range(3):
+                    users_models.SocialNetworkingUser.objects.filter(id=user_id).exists()
+
+    @override_settings(QUERY_INSTRUMENTATION={'STRICT': True})
+    def test_views_declare_budgets(self):
+        response = APIClient().get(reverse('user-search'))
+        self.assertEqual(response.status_code, 401)
+        self.assertQueryBudget(response)
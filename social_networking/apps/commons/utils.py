@@ -1,9 +1,38 @@
 import os
 import binascii
 
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import close_old_connections
+
 from social_networking.apps.commons import constants as common_constants
 
 
 def generate_key():
     # hex return here will be twice the length we pass in urandom
     return binascii.hexlify(os.urandom(int(common_constants.TOKEN_LENGTH/2))).decode()
+
+
+def get_config(name, defaults):
+    """
+    Read a dict setting and fill missing keys from defaults.
+    """
+    return {**defaults, **getattr(settings, name, {})}
+
+
+def _call_and_release_connections(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # worker threads are shared by requests, so the request_finished handling of connections is done here.
+        close_old_connections()
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """
+    Run blocking (DB) code from async code in the event loop's thread pool.
+    Unlike Django's default thread sensitive sync_to_async, calls of different requests don't queue up
+    behind each other on one thread, a slow client waiting on the loop holds no thread at all.
+    """
+    return await sync_to_async(_call_and_release_connections, thread_sensitive=False)(func, *args, **kwargs)
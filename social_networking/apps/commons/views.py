@@ -1,3 +1,25 @@
-from django.shortcuts import render
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from social_networking.apps.commons import (
+    constants as commons_constants,
+    metrics as commons_metrics,
+    utils as commons_utils,
+)
+
+
+@require_GET
+def metrics(request):
+    """
+    Metrics of all worker processes in the Prometheus text format, see commons.metrics.
+    Served to scrapers sending METRICS['TOKEN'] only, not at all while no TOKEN is set.
+    """
+    config = commons_utils.get_config('METRICS', commons_constants.METRICS_DEFAULTS)
+    if not config['ENABLED'] or not config['TOKEN']:
+        raise Http404()
+    if not constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {config["TOKEN"]}'
+    ):
+        return HttpResponse(status=401)
+    return HttpResponse(commons_metrics.registry.render(), content_type=commons_constants.METRICS_CONTENT_TYPE)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'social_networking.apps.users'
+
+    def ready(self):
+        # connect signal receivers
+        from social_networking.apps.users import receivers  # noqa: F401
@@ -0,0 +1,21 @@
+from django.urls import path
+
+from social_networking.apps.users import views as users_views
+from social_networking.apps.commons.async_views import as_async_view
+
+# Same API as users.urls, served by async views. Mounted at async/accounts/, meant for ASGI deployments.
+urlpatterns = [
+    path('login/', as_async_view(users_views.LoginView), name='async-login'),
+    path('logout/', as_async_view(users_views.LogoutView), name='async-logout'),
+    path('user/', as_async_view(users_views.UserRegisterView), name='async-user'),
+    path('search/', as_async_view(users_views.UserSearchAPIView), name='async-user-search'),
+    path('friend-request/bulk/send/', as_async_view(users_views.BulkSendFriendRequestAPIView), name='async-bulk-send-friend-request'),
+    path('friend-request/bulk/', as_async_view(users_views.BulkAcceptRejectFriendRequestAPIView), name='async-bulk-accept-reject-friend-request'),
+    path('friend-request/<int:request_id>/', as_async_view(users_views.AcceptRejectFriendRequestAPIView), name='async-accept-reject-friend-request'),
+    path('friend-request/send/', as_async_view(users_views.SendFriendRequestAPIView), name='async-send-friend-request'),
+    path('friends/mutual/<int:user_id>/', as_async_view(users_views.MutualFriendsAPIView), name='async-mutual-friends'),
+    path('friends/mutual/', as_async_view(users_views.MutualFriendsCountAPIView), name='async-mutual-friends-count'),
+    path('friends/suggestions/', as_async_view(users_views.FriendSuggestionsAPIView), name='async-friend-suggestions'),
+    path('friends/', as_async_view(users_views.ListFriendsAPIView), name='async-list-friends'),
+    path('pending-friend-requests/', as_async_view(users_views.ListPendingFriendRequestsAPIView), name='async-list-pending-friend-requests'),
+]
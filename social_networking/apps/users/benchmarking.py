@@ -0,0 +1,225 @@
+import io
+import math
+import random
+import uuid
+from contextlib import contextmanager
+
+from django.contrib.auth import hashers
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from social_networking.apps.users import (
+    graph as users_graph,
+    models as users_models,
+    search as users_search,
+    serializers as users_serializers,
+    suggestions as users_suggestions,
+)
+from social_networking.apps.commons import (
+    constants as commons_constants,
+    utils as commons_utils,
+)
+
+SQLITE_ENGINE = 'social_networking.apps.commons.db.backends.sqlite3'
+SQLITE_TIMEOUT = 30
+POPULATION_PASSWORD = 'Benchmark123'
+POPULATION_EMAIL_DOMAIN = 'benchmark.example.com'
+FIRST_NAMES = [
+    'Aarav', 'Maya', 'Rohan', 'Sara', 'Kabir', 'Anya', 'Vivaan', 'Isha', 'Arjun', 'Diya',
+    'Liam', 'Emma', 'Noah', 'Olivia', 'Lucas', 'Mia', 'Ethan', 'Zoe', 'Omar', 'Lena',
+]
+LAST_NAMES = [
+    'Sharma', 'Lohan', 'Mehta', 'Kapoor', 'Singh', 'Rao', 'Iyer', 'Das', 'Nair', 'Gupta',
+    'Smith', 'Jones', 'Brown', 'Garcia', 'Miller', 'Wilson', 'Moore', 'Clark', 'Lopez', 'Young',
+]
+
+
+@contextmanager
+def benchmark_user():
+    """
+    Throwaway user and its auth token for benchmark commands, deleted afterwards.
+    """
+    user = users_models.SocialNetworkingUser.objects.create(
+        email=f'benchmark-{uuid.uuid4().hex}@example.com', name='Benchmark', password=uuid.uuid4().hex
+    )
+    try:
+        yield user, users_serializers.UserTokenSerializer(user).data['token']
+    finally:
+        user.delete()
+
+
+def wsgi_environ(path, token, query_string=''):
+    """
+    Environ of an authenticated GET request, to call a WSGIHandler directly.
+    """
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query_string, 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost', 'HTTP_AUTHORIZATION': f'Token {token}', 'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+
+
+def call_wsgi(handler, environ):
+    """
+    Run a request through a WSGIHandler like a server would, return the status code.
+    """
+    statuses = []
+    response = handler(environ, lambda status, headers: statuses.append(status))
+    b''.join(response)
+    response.close()
+    return int(statuses[0].split()[0])
+
+
+@contextmanager
+def sqlite_database(path):
+    """
+    Point the default database to a migrated SQLite file (pooled backend) for the block,
+    so that a benchmark population never ends up in the real database.
+    """
+    connections.close_all()
+    settings_dict = connections.settings[DEFAULT_DB_ALIAS]
+    original = dict(settings_dict)
+    settings_dict.update(
+        ENGINE=SQLITE_ENGINE, NAME=str(path), USER='', PASSWORD='', HOST='', PORT='',
+        # concurrent writers queue up for the database lock instead of failing.
+        OPTIONS={'timeout': SQLITE_TIMEOUT, 'transaction_mode': 'IMMEDIATE'},
+    )
+    _drop_connection(DEFAULT_DB_ALIAS)
+    try:
+        call_command('migrate', verbosity=0, interactive=False)
+        yield
+    finally:
+        connections.close_all()
+        settings_dict.clear()
+        settings_dict.update(original)
+        _drop_connection(DEFAULT_DB_ALIAS)
+
+
+def _drop_connection(alias):
+    # next use in this thread creates a connection from the current settings.
+    try:
+        del connections[alias]
+    except AttributeError:
+        pass
+
+
+def power_law_friendships(users, edges_per_user, rng):
+    """
+    Friend pairs (as user indexes) of a Barabasi-Albert graph: every new user befriends edges_per_user
+    existing users picked with probability proportional to their degree, so few users get very many
+    friends and most get few (power law degree distribution), like in real social networks.
+    """
+    targets = list(range(min(edges_per_user, users)))
+    # every user appears once per friendship it has, picking from it is picking by degree.
+    by_degree = []
+    pairs = []
+    for source in range(len(targets), users):
+        pairs.extend((source, target) for target in targets)
+        by_degree.extend(targets)
+        by_degree.extend([source] * len(targets))
+        picked = set()
+        while len(picked) < min(edges_per_user, source + 1):
+            picked.add(rng.choice(by_degree))
+        targets = sorted(picked)
+    return pairs
+
+
+def generate_population(users, edges_per_user, pending_per_user, seed, batch_size=1000):
+    """
+    Create a reproducible population (same arguments give same users, friendships and requests):
+    users having a power law friend degree distribution, pending friend requests, an auth token for
+    every user, the search index and friend suggestions. All users have POPULATION_PASSWORD.
+    Rows are bulk inserted, so no post_save or friendship signals fire, indexes are built at the end.
+    Returns a dict describing the population, see population_summary.
+    """
+    rng = random.Random(seed)
+    password = hashers.make_password(POPULATION_PASSWORD)
+    with transaction.atomic():
+        users_models.SocialNetworkingUser.objects.bulk_create(
+            [
+                users_models.SocialNetworkingUser(
+                    email=population_email(index), password=password,
+                    name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                )
+                for index in range(users)
+            ],
+            batch_size=batch_size,
+        )
+        # sqlite doesn't return ids of bulk inserted rows.
+        user_ids = [None] * users
+        for user_id, email in users_models.SocialNetworkingUser.objects.filter(
+            email__endswith=f'@{POPULATION_EMAIL_DOMAIN}'
+        ).values_list('id', 'email').iterator():
+            user_ids[int(email.split('@')[0][len('user'):])] = user_id
+
+        pairs = power_law_friendships(users, edges_per_user, rng)
+        users_models.Friend.objects.bulk_create(
+            [
+                users_models.Friend(user_id=user_ids[source], friend_id=user_ids[target])
+                for first, second in pairs
+                for source, target in ((first, second), (second, first))
+            ],
+            batch_size=batch_size,
+        )
+
+        friendships = set(pairs) | {(second, first) for first, second in pairs}
+        requests = []
+        for receiver in range(users):
+            for _ in range(pending_per_user):
+                sender = rng.randrange(users)
+                if sender != receiver and (sender, receiver) not in friendships:
+                    # one pending request per pair, either way.
+                    friendships.update(((sender, receiver), (receiver, sender)))
+                    requests.append(users_models.FriendshipRequest(
+                        sender_id=user_ids[sender], receiver_id=user_ids[receiver]
+                    ))
+        users_models.FriendshipRequest.objects.bulk_create(requests, batch_size=batch_size)
+        users_models.Token.objects.bulk_create(
+            [users_models.Token(user_id=user_id, key=commons_utils.generate_key()) for user_id in user_ids],
+            batch_size=batch_size,
+        )
+
+    users_search.rebuild_index(batch_size=batch_size)
+    graph = users_graph.FriendGraph.load()
+    for start in range(0, users, commons_constants.FRIEND_SUGGESTIONS_BATCH_SIZE):
+        users_suggestions.refresh_suggestions(
+            user_ids[start:start + commons_constants.FRIEND_SUGGESTIONS_BATCH_SIZE], graph
+        )
+    return population_summary(users, edges_per_user, pending_per_user, seed, pairs, len(requests))
+
+
+def population_email(index):
+    return f'user{index}@{POPULATION_EMAIL_DOMAIN}'
+
+
+def population_summary(users, edges_per_user, pending_per_user, seed, pairs, pending_requests):
+    degrees = [0] * users
+    for first, second in pairs:
+        degrees[first] += 1
+        degrees[second] += 1
+    degrees.sort()
+    return {
+        'users': users,
+        'edges_per_user': edges_per_user,
+        'pending_per_user': pending_per_user,
+        'seed': seed,
+        'friendships': len(pairs),
+        'pending_requests': pending_requests,
+        'degree': {
+            'min': degrees[0] if degrees else 0,
+            'p50': percentile(degrees, 50),
+            'p99': percentile(degrees, 99),
+            'max': degrees[-1] if degrees else 0,
+        },
+    }
+
+
+def percentile(sorted_values, percent):
+    """
+    Nearest rank percentile of an ascending list.
+    """
+    if not sorted_values:
+        return 0
+    return sorted_values[max(0, math.ceil(len(sorted_values) * percent / 100) - 1)]
@@ -0,0 +1,68 @@
+from django.db.models import Q
+
+from social_networking.apps.users import (
+    models as users_models,
+    serializers as users_serializers,
+)
+from social_networking.apps.commons import (
+    constants as commons_constants,
+    renderers as commons_renderers,
+)
+
+FRIENDS = 'friends'
+REQUESTS = 'requests'
+
+
+def keyset_chunks(queryset, lookups, chunk_size=commons_constants.EXPORT_CHUNK_SIZE):
+    """
+    Yield .values() rows of queryset in lists of at most chunk_size, walking primary keys in order.
+    Every chunk is its own `id > last id` query read with iterator(), so neither memory nor the cost
+    of a chunk depends on how many rows there are, and the first chunk is ready as soon as its query is.
+    """
+    lookups = list(dict.fromkeys(['id', *lookups]))
+    last_id = 0
+    while True:
+        chunk = list(
+            queryset.filter(id__gt=last_id).order_by('id').values(*lookups)[:chunk_size].iterator(chunk_size=chunk_size)
+        )
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1]['id']
+
+
+def export_lines(queryset, serializer, chunk_size=commons_constants.EXPORT_CHUNK_SIZE):
+    """
+    Queryset rows as output of a ValuesSerializer in NDJSON, one bytes block per chunk.
+    """
+    for chunk in keyset_chunks(queryset, serializer.lookups, chunk_size):
+        yield commons_renderers.render_ndjson(serializer.to_representation(chunk))
+
+
+def export_friends(user_id, chunk_size=commons_constants.EXPORT_CHUNK_SIZE):
+    """
+    Every friend of a user as an NDJSON line, oldest friendship first.
+    """
+    return export_lines(
+        users_models.Friend.objects.filter(user_id=user_id),
+        users_serializers.FriendExportValuesSerializer(),
+        chunk_size,
+    )
+
+
+def export_friend_requests(user_id, chunk_size=commons_constants.EXPORT_CHUNK_SIZE):
+    """
+    Every friend request a user sent or received, in any status, as an NDJSON line, oldest first.
+    """
+    return export_lines(
+        users_models.FriendshipRequest.objects.filter(Q(sender_id=user_id) | Q(receiver_id=user_id)),
+        users_serializers.FriendshipRequestExportValuesSerializer(),
+        chunk_size,
+    )
+
+
+EXPORTS = {
+    FRIENDS: export_friends,
+    REQUESTS: export_friend_requests,
+}
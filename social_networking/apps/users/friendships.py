@@ -0,0 +1,196 @@
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+
+from social_networking.apps.users import (
+    models as users_models,
+    signals as users_signals,
+)
+
+CREATED = 'created'
+ACCEPTED = 'accepted'
+REJECTED = 'rejected'
+ERROR = 'error'
+
+SELF_REQUEST_ERROR = 'You cannot send friend request to yourself!!'
+PENDING_REQUEST_ERROR = 'One request is already pending with same receiver!!'
+ALREADY_FRIENDS_ERROR = 'You both are already friends!!'
+NO_SUCH_USER_ERROR = 'No such user'
+DUPLICATE_ITEM_ERROR = 'Duplicate in this batch'
+NO_SUCH_REQUEST_ERROR = 'No such pending friend request for this user'
+
+# user loaded with id, name and email; pending_sent: user_id asked them, pending_received: they asked user_id.
+Relationship = namedtuple('Relationship', ['user', 'pending_sent', 'pending_received', 'friends'])
+
+
+def resolve_relationships(user_id, other_ids):
+    """
+    Relationship of a user with every other user (existing ones only) of other_ids, in one query:
+    dict of other user id -> Relationship.
+    """
+    pending = users_models.FriendshipRequest.objects.filter(status=users_models.FriendshipRequest.PENDING)
+    rows = users_models.SocialNetworkingUser.objects.filter(id__in=set(other_ids)).annotate(
+        is_pending_sent=Exists(pending.filter(sender_id=user_id, receiver_id=OuterRef('id'))),
+        is_pending_received=Exists(pending.filter(sender_id=OuterRef('id'), receiver_id=user_id)),
+        is_friend=Exists(users_models.Friend.objects.filter(user_id=user_id, friend_id=OuterRef('id'))),
+    ).values_list('id', 'name', 'email', 'is_pending_sent', 'is_pending_received', 'is_friend')
+    return {
+        other_id: Relationship(
+            users_models.SocialNetworkingUser.from_db(None, ['id', 'name', 'email'], [other_id, name, email]),
+            pending_sent, pending_received, friends,
+        )
+        for other_id, name, email, pending_sent, pending_received, friends in rows
+    }
+
+
+def send_friend_requests(sender_id, receiver_ids):
+    """
+    Send friend requests to many users at once. The whole batch is validated with one query
+    and written with one insert (and a select of pending request ids before and after it). Receivers of the signal
+    sent on commit add queries of their own, see users.receivers. Returns one result per receiver, in the given order.
+    """
+    relationships = resolve_relationships(sender_id, receiver_ids)
+
+    results = []
+    seen = set()
+    to_create = []
+    for receiver_id in receiver_ids:
+        error = None
+        if receiver_id in seen:
+            error = DUPLICATE_ITEM_ERROR
+        elif receiver_id not in relationships:
+            error = NO_SUCH_USER_ERROR
+        elif receiver_id == sender_id:
+            error = SELF_REQUEST_ERROR
+        elif relationships[receiver_id].pending_sent:
+            error = PENDING_REQUEST_ERROR
+        elif relationships[receiver_id].friends:
+            error = ALREADY_FRIENDS_ERROR
+        seen.add(receiver_id)
+        if error:
+            results.append({'receiver': receiver_id, 'status': ERROR, 'error': error})
+        else:
+            results.append({'receiver': receiver_id, 'status': CREATED})
+            to_create.append(users_models.FriendshipRequest(sender_id=sender_id, receiver_id=receiver_id))
+
+    if to_create:
+        pending = users_models.FriendshipRequest.objects.filter(
+            sender_id=sender_id, receiver_id__in=[request.receiver_id for request in to_create],
+            status=users_models.FriendshipRequest.PENDING
+        ).values_list('receiver_id', 'id')
+        with transaction.atomic():
+            # requests sent meanwhile by a concurrent call are there once and skip ours, see
+            # unique_pending_friend_request. Those committed before the first select are told apart by id, MySQL's
+            # repeatable read keeps later ones out of both selects.
+            sent_meanwhile = dict(pending.all())
+            users_models.FriendshipRequest.objects.bulk_create(to_create, ignore_conflicts=True)
+            # MySQL doesn't hand back ids of bulk inserted rows.
+            request_ids = {
+                receiver_id: request_id for receiver_id, request_id in pending.all()
+                if sent_meanwhile.get(receiver_id) != request_id
+            }
+        for result in results:
+            if result['status'] != CREATED:
+                continue
+            if result['receiver'] in request_ids:
+                result['request_id'] = request_ids[result['receiver']]
+            else:
+                result.update(status=ERROR, error=PENDING_REQUEST_ERROR)
+        pairs = [(sender_id, receiver_id) for receiver_id in request_ids]
+        if pairs:
+            transaction.on_commit(lambda: users_signals.friend_requests_created.send(
+                sender=users_models.FriendshipRequest, pairs=pairs
+            ))
+    return results
+
+
+def respond_to_friend_request(receiver_id, request_id, action):
+    """
+    Accept or reject one pending request received by a user. Safe under concurrent answers (double taps):
+    a conditional update picks the one answer which finds the request pending, the others find none.
+    Accepting also accepts a pending request the other way round, both users asked each other.
+    One select, one or two updates and on accept an insert of the friendship, which exists at most once.
+    On accept, receivers of the signals sent on commit add four queries (friend suggestions, see users.receivers).
+    Returns ACCEPTED or REJECTED, None when there is no such pending request.
+    """
+    pending = users_models.FriendshipRequest.PENDING
+    lookup = Q(id=request_id, receiver_id=receiver_id)
+    if action == 'accept':
+        lookup |= Q(sender_id=receiver_id, receiver_id=Subquery(
+            users_models.FriendshipRequest.objects.filter(id=request_id).values('sender_id')[:1]
+        ))
+    if action == 'accept':
+        new_status, result_status = users_models.FriendshipRequest.ACCEPTED, ACCEPTED
+    else:
+        new_status, result_status = users_models.FriendshipRequest.REJECTED, REJECTED
+    with transaction.atomic():
+        senders = dict(
+            users_models.FriendshipRequest.objects.filter(lookup, status=pending).values_list('id', 'sender_id')
+        )
+        sender_id = senders.pop(request_id, None)
+        if sender_id is None:
+            return None
+        if not users_models.FriendshipRequest.objects.filter(id=request_id, status=pending).answer(new_status):
+            # answered meanwhile.
+            return None
+        if senders:
+            users_models.FriendshipRequest.objects.filter(id__in=senders, status=pending).answer(new_status)
+        if action == 'accept':
+            users_models.Friend.objects.create_friendships([(sender_id, receiver_id)])
+    transaction.on_commit(lambda: users_signals.friend_requests_answered.send(
+        sender=users_models.FriendshipRequest, pairs=[(sender_id, receiver_id)]
+    ))
+    return result_status
+
+
+def respond_to_friend_requests(receiver_id, action, request_ids=None):
+    """
+    Accept or reject many pending requests received by a user, all of them when request_ids is None.
+    Pending requests are selected for update in the transaction answering them, so a request answered
+    concurrently is either answered by this call or left out of it (no friendship, reported as not found).
+    One select, one update and, on accept, one more update accepting requests the other way round
+    (both users asked each other) and one insert of friendships. On accept, receivers of the signals sent on
+    commit add four queries (friend suggestions, see users.receivers). Returns one result per request.
+    """
+    pending = users_models.FriendshipRequest.objects.filter(
+        receiver_id=receiver_id, status=users_models.FriendshipRequest.PENDING
+    )
+    if request_ids is not None:
+        pending = pending.filter(id__in=set(request_ids))
+
+    if action == 'accept':
+        new_status, result_status = users_models.FriendshipRequest.ACCEPTED, ACCEPTED
+    else:
+        new_status, result_status = users_models.FriendshipRequest.REJECTED, REJECTED
+
+    with transaction.atomic():
+        senders = dict(pending.select_for_update().values_list('id', 'sender_id'))
+        if senders:
+            users_models.FriendshipRequest.objects.filter(id__in=senders).answer(new_status)
+        if action == 'accept' and senders:
+            users_models.FriendshipRequest.objects.filter(
+                sender_id=receiver_id, receiver_id__in=set(senders.values()),
+                status=users_models.FriendshipRequest.PENDING,
+            ).answer(new_status)
+            users_models.Friend.objects.create_friendships(
+                [(sender_id, receiver_id) for sender_id in set(senders.values())]
+            )
+    if senders:
+        pairs = [(sender_id, receiver_id) for sender_id in set(senders.values())]
+        transaction.on_commit(lambda: users_signals.friend_requests_answered.send(
+            sender=users_models.FriendshipRequest, pairs=pairs
+        ))
+
+    if request_ids is None:
+        request_ids = sorted(senders, reverse=True)
+    results = []
+    seen = set()
+    for request_id in request_ids:
+        if request_id in senders and request_id not in seen:
+            results.append({'request_id': request_id, 'status': result_status})
+        else:
+            error = DUPLICATE_ITEM_ERROR if request_id in seen else NO_SUCH_REQUEST_ERROR
+            results.append({'request_id': request_id, 'status': ERROR, 'error': error})
+        seen.add(request_id)
+    return results
@@ -0,0 +1,361 @@
+import secrets
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.core.cache import caches
+from django.db import connection
+
+from social_networking.apps.users import models as users_models
+from social_networking.apps.commons import (
+    constants as commons_constants,
+    utils as commons_utils,
+)
+
+
+def intersect_sorted(first, second):
+    """
+    Intersection of two ascending sequences. Walks both when they are of similar size and
+    binary searches the longer one when one side is much shorter.
+    """
+    if len(first) > len(second):
+        first, second = second, first
+    if not first:
+        return []
+    result = []
+    if len(first) * commons_constants.GALLOP_RATIO < len(second):
+        low = 0
+        for value in first:
+            low = bisect_left(second, value, low)
+            if low == len(second):
+                break
+            if second[low] == value:
+                result.append(value)
+        return result
+    i = j = 0
+    while i < len(first) and j < len(second):
+        if first[i] < second[j]:
+            i += 1
+        elif first[i] > second[j]:
+            j += 1
+        else:
+            result.append(first[i])
+            i += 1
+            j += 1
+    return result
+
+
+class FriendGraph:
+    """
+    Friend edges kept in compressed sparse row form:
+    `node_ids` holds sorted user ids, neighbors of node i are `targets[offsets[i]:offsets[i + 1]]` stored as
+    node indexes (4 bytes an edge), ascending, so they map back to ascending user ids.
+    Friendships added or removed after loading live in small per user delta sets till next reload.
+    Public methods take and return user ids.
+    """
+
+    def __init__(self, node_ids, offsets, targets):
+        self.node_ids = node_ids
+        self.offsets = offsets
+        self.targets = targets
+        self.added = {}
+        self.removed = {}
+        self.delta_size = 0
+        self.loaded_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, chunk_size=commons_constants.FRIEND_GRAPH_CHUNK_SIZE):
+        """
+        Build graph from Friend table. Rows are streamed in (user, friend) order, which is the order of
+        the unique index, so memory needed is just the arrays.
+        """
+        node_ids = array('q', users_models.Friend.objects.order_by('user_id').values_list(
+            'user_id', flat=True
+        ).distinct().iterator(chunk_size=chunk_size))
+        offsets = array('q', bytes(8 * (len(node_ids) + 1)))
+        targets = array('I')
+        graph = cls(node_ids, offsets, targets)
+
+        for user_id, friend_id in users_models.Friend.objects.order_by('user_id', 'friend_id').values_list(
+            'user_id', 'friend_id'
+        ).iterator(chunk_size=chunk_size):
+            user_index = graph._index(user_id)
+            friend_index = graph._index(friend_id)
+            # rows written while loading may refer to users we haven't seen, next reload picks them up.
+            if user_index is None or friend_index is None:
+                continue
+            targets.append(friend_index)
+            offsets[user_index + 1] += 1
+        for index in range(1, len(offsets)):
+            offsets[index] += offsets[index - 1]
+        return graph
+
+    def _index(self, user_id):
+        index = bisect_left(self.node_ids, user_id)
+        if index < len(self.node_ids) and self.node_ids[index] == user_id:
+            return index
+        return None
+
+    def _base_neighbors(self, user_id):
+        index = self._index(user_id)
+        if index is None:
+            return []
+        node_ids = self.node_ids
+        return [node_ids[target] for target in self.targets[self.offsets[index]:self.offsets[index + 1]]]
+
+    def add_edge(self, user_id, friend_id):
+        with self._lock:
+            for source, target in ((user_id, friend_id), (friend_id, user_id)):
+                self.removed.get(source, set()).discard(target)
+                self.added.setdefault(source, set()).add(target)
+            self.delta_size += 2
+
+    def remove_edge(self, user_id, friend_id):
+        with self._lock:
+            for source, target in ((user_id, friend_id), (friend_id, user_id)):
+                self.added.get(source, set()).discard(target)
+                self.removed.setdefault(source, set()).add(target)
+            self.delta_size += 2
+
+    def neighbors(self, user_id):
+        """
+        Ascending user ids of friends of user.
+        """
+        base = self._base_neighbors(user_id)
+        added = self.added.get(user_id)
+        removed = self.removed.get(user_id)
+        if not added and not removed:
+            return base
+        with self._lock:
+            return sorted((set(base) - (removed or set())) | (added or set()))
+
+    def degree(self, user_id):
+        if user_id not in self.added and user_id not in self.removed:
+            index = self._index(user_id)
+            return 0 if index is None else self.offsets[index + 1] - self.offsets[index]
+        return len(self.neighbors(user_id))
+
+    def are_friends(self, user_id, friend_id):
+        if friend_id in self.added.get(user_id, ()):
+            return True
+        if friend_id in self.removed.get(user_id, ()):
+            return False
+        index = self._index(user_id)
+        friend_index = self._index(friend_id)
+        if index is None or friend_index is None:
+            return False
+        low, high = self.offsets[index], self.offsets[index + 1]
+        position = bisect_left(self.targets, friend_index, low, high)
+        return position < high and self.targets[position] == friend_index
+
+    def mutual_friends(self, user_id, other_user_id):
+        """
+        Ascending user ids of friends common to both users.
+        """
+        return intersect_sorted(self.neighbors(user_id), self.neighbors(other_user_id))
+
+    def friends_of_friends(self, user_id):
+        """
+        Counter of users two hops away (not self, not already a friend) -> number of mutual friends.
+        """
+        friends = self.neighbors(user_id)
+        friend_set = set(friends)
+        candidates = Counter()
+        for friend_id in friends:
+            candidates.update(self.neighbors(friend_id))
+        candidates.pop(user_id, None)
+        for friend_id in friend_set:
+            candidates.pop(friend_id, None)
+        return candidates
+
+    def within_two_hops(self, user_id, other_user_id):
+        return self.are_friends(user_id, other_user_id) or bool(self.mutual_friends(user_id, other_user_id))
+
+    def stats(self):
+        array_bytes = sum(
+            values.itemsize * len(values) for values in (self.node_ids, self.offsets, self.targets)
+        )
+        return {
+            'nodes': len(self.node_ids),
+            'edges': len(self.targets),
+            'delta_edges': self.delta_size,
+            'array_bytes': array_bytes,
+            'bytes_per_edge': array_bytes / len(self.targets) if self.targets else 0.0,
+            'age_seconds': time.monotonic() - self.loaded_at,
+        }
+
+
+class FriendGraphHolder:
+    """
+    Process wide graph. Loaded on first use, reloaded in a background thread once it is older than
+    FRIEND_GRAPH['MAX_AGE'] seconds or carries more than FRIEND_GRAPH['MAX_DELTA_EDGES'] delta edges.
+    The old graph keeps serving while a reload runs and edges recorded meanwhile are replayed on the new one.
+    Friendships changed by a worker reach its graph at once. Other workers see them after their next reload,
+    unless FRIEND_GRAPH['SHARED_CACHE_ALIAS'] names one of CACHES: changes are then numbered by a shared
+    generation and logged there, and every worker replays the ones it hasn't seen within SYNC_INTERVAL seconds
+    (reloading when the log was evicted or it fell more than LOG_SIZE changes behind).
+    Loading is a scan of the whole Friend table, paid by the first request of each worker which needs the graph.
+    """
+    key_prefix = 'friend_graph'
+
+    def __init__(self):
+        self.graph = None
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._pending = []
+        # shared generation the graph is synced to, None without a shared cache.
+        self.generation = None
+        self.synced_at = 0
+        self._missing = None
+
+    @property
+    def _generation_key(self):
+        return f'{self.key_prefix}:generation'
+
+    def _edge_key(self, generation):
+        return f'{self.key_prefix}:edge:{generation}'
+
+    @staticmethod
+    def _shared(config):
+        return caches[config['SHARED_CACHE_ALIAS']] if config['SHARED_CACHE_ALIAS'] else None
+
+    def _get_generation(self, shared):
+        if shared is None:
+            return None
+        # starts from a random number, a generation lost to eviction never comes back and meets an older graph.
+        shared.add(self._generation_key, secrets.randbelow(2 ** 62), None)
+        return shared.get(self._generation_key)
+
+    def get(self):
+        config = commons_utils.get_config('FRIEND_GRAPH', commons_constants.FRIEND_GRAPH_DEFAULTS)
+        shared = self._shared(config)
+        if self.graph is None:
+            with self._lock:
+                if self.graph is None:
+                    # taken before loading, changes logged meanwhile are replayed by the next sync.
+                    self.generation = self._get_generation(shared)
+                    self.synced_at = time.monotonic()
+                    self.graph = FriendGraph.load(config['CHUNK_SIZE'])
+        elif shared is not None and time.monotonic() - self.synced_at > config['SYNC_INTERVAL']:
+            self.sync(shared, config)
+        if not self._reloading and (
+            (config['MAX_AGE'] is not None and time.monotonic() - self.graph.loaded_at > config['MAX_AGE'])
+            or self.graph.delta_size > config['MAX_DELTA_EDGES']
+        ):
+            self.reload_in_background(config['CHUNK_SIZE'])
+        return self.graph
+
+    def sync(self, shared, config):
+        """
+        Replay friendships changed by all workers since the generation of the graph.
+        """
+        self.synced_at = time.monotonic()
+        if self._reloading:
+            # the new graph comes with its own generation.
+            return
+        generation = shared.get(self._generation_key)
+        applied = self.generation
+        if generation == applied:
+            return
+        if generation is None or applied is None or not 0 < generation - applied <= config['LOG_SIZE']:
+            self.reload_in_background(config['CHUNK_SIZE'])
+            return
+        numbers = range(applied + 1, generation + 1)
+        edges = shared.get_many([self._edge_key(number) for number in numbers])
+        with self._lock:
+            if self.generation != applied or self._reloading:
+                return
+            for number in numbers:
+                edge = edges.get(self._edge_key(number))
+                if edge is None:
+                    # its worker may not have logged it yet, still missing on the next sync it was evicted.
+                    if self._missing == number:
+                        self._missing = None
+                        break
+                    self._missing = number
+                    return
+                method, user_id, friend_id = edge
+                getattr(self.graph, method)(user_id, friend_id)
+                self.generation = number
+            else:
+                return
+        self.reload_in_background(config['CHUNK_SIZE'])
+
+    def reload_in_background(self, chunk_size=commons_constants.FRIEND_GRAPH_CHUNK_SIZE):
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+            self._pending = []
+        thread = threading.Thread(target=self._reload, args=(chunk_size,), daemon=True)
+        thread.start()
+        return thread
+
+    def _reload(self, chunk_size):
+        try:
+            config = commons_utils.get_config('FRIEND_GRAPH', commons_constants.FRIEND_GRAPH_DEFAULTS)
+            generation = self._get_generation(self._shared(config))
+            graph = FriendGraph.load(chunk_size)
+            with self._lock:
+                for method, user_id, friend_id in self._pending:
+                    getattr(graph, method)(user_id, friend_id)
+                self.graph = graph
+                self.generation = generation
+                self._missing = None
+        finally:
+            with self._lock:
+                self._reloading = False
+                self._pending = []
+            # connections are per thread, don't leak this one.
+            connection.close()
+
+    def _apply(self, method, pairs):
+        # nothing to do locally if this process never loaded the graph, it will be read fresh from DB.
+        with self._lock:
+            for user_id, friend_id in pairs:
+                if self.graph is not None:
+                    getattr(self.graph, method)(user_id, friend_id)
+                if self._reloading:
+                    self._pending.append((method, user_id, friend_id))
+        config = commons_utils.get_config('FRIEND_GRAPH', commons_constants.FRIEND_GRAPH_DEFAULTS)
+        shared = self._shared(config)
+        if shared is None or not pairs:
+            return
+        self._get_generation(shared)
+        try:
+            last = shared.incr(self._generation_key, len(pairs))
+        except ValueError:
+            # evicted, workers find a new generation and reload.
+            return
+        shared.set_many({
+            self._edge_key(number): (method, user_id, friend_id)
+            for number, (user_id, friend_id) in enumerate(pairs, last - len(pairs) + 1)
+        }, config['LOG_TIMEOUT'])
+
+    def add_friendships(self, pairs):
+        self._apply('add_edge', list(pairs))
+
+    def remove_friendships(self, pairs):
+        self._apply('remove_edge', list(pairs))
+
+    def add_friendship(self, user_id, friend_id):
+        self.add_friendships([(user_id, friend_id)])
+
+    def remove_friendship(self, user_id, friend_id):
+        self.remove_friendships([(user_id, friend_id)])
+
+    def clear(self):
+        with self._lock:
+            self.graph = None
+            self.generation = None
+            self._missing = None
+
+
+friend_graph = FriendGraphHolder()
+
+
+def get_friend_graph():
+    return friend_graph.get()
@@ -0,0 +1,357 @@
+import csv
+import json
+import os
+from collections import deque
+from itertools import islice
+
+from django.contrib.auth import hashers
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from social_networking.apps.users import (
+    models as users_models,
+    search as users_search,
+    signals as users_signals,
+)
+from social_networking.apps.commons import (
+    constants as commons_constants,
+    hashing as commons_hashing,
+)
+
+CSV = 'csv'
+JSONL = 'jsonl'
+FORMATS = (CSV, JSONL)
+JSONL_EXTENSIONS = ('.jsonl', '.ndjson', '.json')
+
+USERS = 'users'
+FRIENDSHIPS = 'friendships'
+REQUESTS = 'requests'
+
+REQUEST_STATUSES = {label.lower(): status for status, label in users_models.FriendshipRequest.REQUEST_STATUS_CHOICES}
+
+
+class RecordError(ValueError):
+    pass
+
+
+class CheckpointMismatch(Exception):
+    pass
+
+
+def detect_format(path):
+    return JSONL if os.path.splitext(path)[1].lower() in JSONL_EXTENSIONS else CSV
+
+
+def read_records(path, file_format):
+    """
+    Yield records of a CSV file (having a header row) or a JSON lines file one by one, so memory use
+    doesn't depend on file size. Empty cells are left out, a line which is not a JSON object gives None.
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == CSV:
+            for row in csv.DictReader(file):
+                yield {key: value for key, value in row.items() if key is not None and value not in ('', None)}
+        else:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield record if isinstance(record, dict) else None
+
+
+def _value(record, field):
+    value = record.get(field)
+    if value is None:
+        raise RecordError(f'{field} is missing')
+    return str(value).strip()
+
+
+def clean_email(record, field):
+    email = users_models.SocialNetworkingUser.objects.normalize_email(_value(record, field))
+    try:
+        validate_email(email)
+    except ValidationError:
+        raise RecordError(f'{field} is not a valid email address')
+    return email
+
+
+def resolve_emails(emails):
+    """
+    Map emails to user ids with one query, unknown emails are left out.
+    """
+    return dict(users_models.SocialNetworkingUser.objects.filter(email__in=set(emails)).values_list('email', 'id'))
+
+
+class Importer:
+    """
+    Streams records through clean() and, a batch at a time, write(). Every batch is written in its own
+    transaction and leaves out rows which already exist, so writing a batch again (after a crash) changes nothing.
+    Stats count records read, rows created, rows skipped as already present and invalid records.
+    """
+
+    def __init__(self, batch_size=commons_constants.IMPORT_BATCH_SIZE, stats=None):
+        self.batch_size = batch_size
+        self.stats = {'records': 0, 'created': 0, 'skipped': 0, 'invalid': 0, **(stats or {})}
+        self.on_error = None
+
+    def clean(self, record):
+        raise NotImplementedError
+
+    def write(self, rows):
+        """
+        Store cleaned rows given as (record number, row) pairs.
+        """
+        raise NotImplementedError
+
+    def reject(self, number, message):
+        self.stats['invalid'] += 1
+        if self.on_error:
+            self.on_error(number, message)
+
+    def run(self, records, skip=0, on_batch=None, on_error=None):
+        """
+        Import records leaving out the first `skip`, done by an earlier run. on_error(record number, message) is
+        called for every invalid record and on_batch(records done, stats) after every committed batch.
+        """
+        self.on_error = on_error
+        numbered = enumerate(records, 1)
+        # read through, not kept.
+        deque(islice(numbered, skip), maxlen=0)
+        while True:
+            batch = list(islice(numbered, self.batch_size))
+            if not batch:
+                break
+            rows = []
+            for number, record in batch:
+                try:
+                    if record is None:
+                        raise RecordError('not a JSON object')
+                    rows.append((number, self.clean(record)))
+                except RecordError as error:
+                    self.reject(number, str(error))
+            with transaction.atomic():
+                self.write(rows)
+            self.stats['records'] = batch[-1][0]
+            if on_batch:
+                on_batch(self.stats['records'], dict(self.stats))
+        return self.stats
+
+
+class UserImporter(Importer):
+    """
+    Records having email, name and either password or password_hash (already hashed by a configured hasher,
+    e.g. from another Django site). Raw passwords are hashed in parallel by the hashing service.
+    Rows are bulk inserted so no post_save receivers run, search tokens of new users are written here.
+    """
+
+    def clean(self, record):
+        email = clean_email(record, 'email')
+        name = _value(record, 'name')
+        if not name:
+            raise RecordError('name is missing')
+        if len(name) > commons_constants.NAME_LENGTH:
+            raise RecordError(f'name is longer than {commons_constants.NAME_LENGTH} characters')
+        password_hash = record.get('password_hash')
+        if password_hash:
+            try:
+                hashers.identify_hasher(password_hash)
+            except ValueError:
+                raise RecordError('password_hash is not in the format of a configured hasher')
+            return email, name, password_hash, None
+        password = record.get('password')
+        if not password:
+            raise RecordError('password or password_hash is missing')
+        if len(str(password)) < commons_constants.MIN_PASSWORD_LENGTH:
+            raise RecordError(f'password is shorter than {commons_constants.MIN_PASSWORD_LENGTH} characters')
+        return email, name, None, str(password)
+
+    def write(self, rows):
+        unique = {}
+        for _, row in rows:
+            unique.setdefault(row[0], row)
+        existing = set(users_models.SocialNetworkingUser.objects.filter(
+            email__in=unique
+        ).values_list('email', flat=True))
+        new = [row for email, row in unique.items() if email not in existing]
+        self.stats['skipped'] += len(rows) - len(new)
+        if not new:
+            return
+
+        # only users not imported yet cost a hash.
+        hashes = iter(commons_hashing.make_passwords(
+            [password for _, _, password_hash, password in new if not password_hash]
+        ))
+        users_models.SocialNetworkingUser.objects.bulk_create(
+            [
+                users_models.SocialNetworkingUser(email=email, name=name, password=password_hash or next(hashes))
+                for email, name, password_hash, _ in new
+            ],
+            ignore_conflicts=True,
+        )
+        # sqlite and MySQL don't hand back ids of bulk inserted rows.
+        user_ids = resolve_emails(email for email, *_ in new)
+        users_models.UserSearchToken.objects.bulk_create(
+            [
+                users_models.UserSearchToken(user_id=user_ids[email], kind=kind, token=token)
+                for email, name, _, _ in new
+                for kind, token in users_search.build_tokens(name, email)
+            ],
+            ignore_conflicts=True,
+        )
+        users_search.invalidate_search_cache()
+        self.stats['created'] += len(new)
+
+
+class FriendshipImporter(Importer):
+    """
+    Records having email and friend_email of two imported users. Friendships are created the usual way
+    (Friend.objects.create_friendships), so friend suggestions of affected users are marked stale.
+    """
+
+    def clean(self, record):
+        email, friend_email = clean_email(record, 'email'), clean_email(record, 'friend_email')
+        if email == friend_email:
+            raise RecordError('a user cannot be friends with itself')
+        return email, friend_email
+
+    def write(self, rows):
+        user_ids = resolve_emails(email for _, pair in rows for email in pair)
+        pairs = set()
+        resolved = 0
+        for number, (email, friend_email) in rows:
+            if email not in user_ids or friend_email not in user_ids:
+                self.reject(number, f'no user with email {email if email not in user_ids else friend_email}')
+                continue
+            resolved += 1
+            user_id, friend_id = user_ids[email], user_ids[friend_email]
+            # either way round is the same friendship.
+            pairs.add((min(user_id, friend_id), max(user_id, friend_id)))
+        existing = set(users_models.Friend.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs}, friend_id__in={friend_id for _, friend_id in pairs}
+        ).values_list('user_id', 'friend_id'))
+        new = [pair for pair in pairs if pair not in existing]
+        self.stats['skipped'] += resolved - len(new)
+        if new:
+            users_models.Friend.objects.create_friendships(new)
+        self.stats['created'] += len(new)
+
+
+class FriendRequestImporter(Importer):
+    """
+    Records having sender_email, receiver_email and optionally status (pending, accepted or rejected, pending
+    by default). Only requests are stored, friendships of accepted ones are imported as friendships.
+    """
+
+    def clean(self, record):
+        sender_email, receiver_email = clean_email(record, 'sender_email'), clean_email(record, 'receiver_email')
+        if sender_email == receiver_email:
+            raise RecordError('a user cannot send friend request to itself')
+        status = str(record.get('status') or 'pending').strip().lower()
+        if status not in REQUEST_STATUSES:
+            raise RecordError(f'status must be one of {", ".join(REQUEST_STATUSES)}')
+        return sender_email, receiver_email, REQUEST_STATUSES[status]
+
+    def write(self, rows):
+        user_ids = resolve_emails(email for _, row in rows for email in row[:2])
+        requests = set()
+        resolved = 0
+        for number, (sender_email, receiver_email, status) in rows:
+            if sender_email not in user_ids or receiver_email not in user_ids:
+                self.reject(
+                    number, f'no user with email {sender_email if sender_email not in user_ids else receiver_email}'
+                )
+                continue
+            resolved += 1
+            requests.add((user_ids[sender_email], user_ids[receiver_email], status))
+        existing = set(users_models.FriendshipRequest.objects.filter(
+            sender_id__in={sender_id for sender_id, _, _ in requests},
+            receiver_id__in={receiver_id for _, receiver_id, _ in requests},
+        ).values_list('sender_id', 'receiver_id', 'status'))
+        new = [request for request in requests if request not in existing]
+        self.stats['skipped'] += resolved - len(new)
+        if not new:
+            return
+        users_models.FriendshipRequest.objects.bulk_create([
+            users_models.FriendshipRequest(
+                sender_id=sender_id, receiver_id=receiver_id, status=status,
+                pending=users_models.FriendshipRequest.pending_marker(status),
+            )
+            for sender_id, receiver_id, status in new
+        ])
+        pending = [
+            (sender_id, receiver_id) for sender_id, receiver_id, status in new
+            if status == users_models.FriendshipRequest.PENDING
+        ]
+        if pending:
+            transaction.on_commit(lambda: users_signals.friend_requests_created.send(
+                sender=users_models.FriendshipRequest, pairs=pending
+            ))
+        self.stats['created'] += len(new)
+
+
+IMPORTERS = {
+    USERS: UserImporter,
+    FRIENDSHIPS: FriendshipImporter,
+    REQUESTS: FriendRequestImporter,
+}
+
+
+class Checkpoint:
+    """
+    Progress of an import (records done and stats) in a JSON file, replaced atomically after every batch.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, state):
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(temporary_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def import_file(path, kind, file_format=None, batch_size=commons_constants.IMPORT_BATCH_SIZE,
+                checkpoint_path=None, restart=False, on_batch=None, on_error=None):
+    """
+    Import users, friendships or friend requests (kind) from a CSV or JSON lines file, for Ex:
+        import_file('users.jsonl', USERS)
+    Progress is checkpointed to checkpoint_path (default: next to the file) after every batch, so running
+    the same import again after it stopped resumes after the last committed batch, unless restart.
+    The checkpoint is removed once the whole file is imported. Returns stats, see Importer.
+    """
+    checkpoint = Checkpoint(checkpoint_path or f'{path}.checkpoint')
+    state = None if restart else checkpoint.load()
+    identity = {'input': os.path.abspath(path), 'kind': kind}
+    if state is not None and {key: state.get(key) for key in identity} != identity:
+        raise CheckpointMismatch(
+            f'Checkpoint {checkpoint.path} belongs to the {state.get("kind")} import of {state.get("input")}'
+        )
+    importer = IMPORTERS[kind](batch_size=batch_size, stats=state and state['stats'])
+
+    def save_progress(records, stats):
+        checkpoint.save({**identity, 'records': records, 'stats': stats})
+        if on_batch:
+            on_batch(records, stats)
+
+    records = read_records(path, file_format or detect_format(path))
+    stats = importer.run(records, skip=state['records'] if state else 0, on_batch=save_progress, on_error=on_error)
+    checkpoint.clear()
+    return stats
@@ -0,0 +1,128 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+
+from social_networking.apps.users import benchmarking as users_benchmarking
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve the same slow clients through the sync WSGI path (a pool of worker threads) and the async ASGI path '
+        '(async/accounts/), in this process, and compare throughput, latency and threads used'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000, help='Concurrent clients, each sending one request')
+        parser.add_argument(
+            '--client-delay', type=float, default=0.5, help='Seconds every client takes to send its request'
+        )
+        parser.add_argument('--threads', type=int, default=8, help='Worker threads of the WSGI path')
+        parser.add_argument('--path', default='friends/', help='Endpoint to call, relative to accounts/')
+
+    def handle(self, *args, **options):
+        with users_benchmarking.benchmark_user() as (_, token):
+            wsgi = self.run_wsgi(f'/accounts/{options["path"]}', token, options)
+            asgi = self.run_asgi(f'/async/accounts/{options["path"]}', token, options)
+
+        self.stdout.write(f'{options["clients"]} clients, {options["client_delay"]}s to send a request each')
+        self.stdout.write(f'{"path":<6}{"seconds":>10}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"threads":>9}{"errors":>8}')
+        for name, result in (('wsgi', wsgi), ('asgi', asgi)):
+            self.stdout.write(
+                f'{name:<6}{result["seconds"]:>10.2f}{result["throughput"]:>10.1f}{result["p50"]:>10.1f}'
+                f'{result["p99"]:>10.1f}{result["peak_threads"]:>9}{result["errors"]:>8}'
+            )
+
+    def run_wsgi(self, path, token, options):
+        handler = WSGIHandler()
+        delay = options['client_delay']
+
+        def serve(started_at):
+            # a slow client holds its worker thread while the request is being read.
+            time.sleep(delay)
+            status = users_benchmarking.call_wsgi(handler, users_benchmarking.wsgi_environ(path, token))
+            return status, time.perf_counter() - started_at
+
+        with _ThreadCounter() as counter:
+            started_at = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+                results = list(executor.map(serve, [started_at] * options['clients']))
+            seconds = time.perf_counter() - started_at
+        return _summary(results, seconds, counter.peak)
+
+    def run_asgi(self, path, token, options):
+        handler = ASGIHandler()
+        delay = options['client_delay']
+
+        async def serve():
+            started_at = time.perf_counter()
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+                'headers': [(b'host', b'localhost'), (b'authorization', f'Token {token}'.encode())],
+                'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            }
+            statuses = []
+
+            async def receive():
+                # a slow client only costs a pending timer here.
+                await asyncio.sleep(delay)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            await handler(scope, receive, send)
+            return statuses[0], time.perf_counter() - started_at
+
+        async def serve_all():
+            return await asyncio.gather(*[serve() for _ in range(options['clients'])])
+
+        with _ThreadCounter() as counter:
+            started_at = time.perf_counter()
+            results = asyncio.run(serve_all())
+            seconds = time.perf_counter() - started_at
+        return _summary(results, seconds, counter.peak)
+
+
+class _ThreadCounter:
+    """
+    Samples number of live threads of this process while the block runs.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            # not counting the sampler itself.
+            self.peak = max(self.peak, threading.active_count() - 1)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._done.set()
+        self._thread.join()
+
+
+def _summary(results, seconds, peak_threads):
+    latencies = sorted(latency * 1000 for _, latency in results)
+    return {
+        'seconds': seconds,
+        'throughput': len(results) / seconds,
+        'p50': statistics.median(latencies),
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'peak_threads': peak_threads,
+        'errors': sum(1 for status, _ in results if status >= 400),
+    }
@@ -0,0 +1,51 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from social_networking.apps.users import benchmarking as users_benchmarking
+from social_networking.apps.commons.db import pool as db_pool
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests per second of the WSGI path with and without the DB connection pool. '
+        'Needs a pooled ENGINE (commons.db.backends.*) for the default database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=4, help='Worker threads serving requests')
+        parser.add_argument('--path', default='friends/', help='Endpoint to call, relative to accounts/')
+
+    def handle(self, *args, **options):
+        handler = WSGIHandler()
+        path = f'/accounts/{options["path"]}'
+        results = []
+        with users_benchmarking.benchmark_user() as (_, token):
+            for pooled in (False, True):
+                db_pool.set_enabled(pooled)
+                # the connection of this thread was opened before the switch.
+                connections.close_all()
+                results.append((pooled, self.run(handler, path, token, options)))
+            db_pool.set_enabled(True)
+
+        self.stdout.write(f'{options["requests"]} requests of {path} on {options["threads"]} threads')
+        self.stdout.write(f'{"pool":<6}{"seconds":>10}{"req/s":>10}{"errors":>8}')
+        for pooled, (seconds, errors) in results:
+            self.stdout.write(
+                f'{"on" if pooled else "off":<6}{seconds:>10.2f}{options["requests"] / seconds:>10.1f}{errors:>8}'
+            )
+        for alias, stats in db_pool.pool_stats().items():
+            self.stdout.write(f'pool {alias}: {stats}')
+
+    def run(self, handler, path, token, options):
+        def serve(_):
+            return users_benchmarking.call_wsgi(handler, users_benchmarking.wsgi_environ(path, token))
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            statuses = list(executor.map(serve, range(options['requests'])))
+        return time.perf_counter() - started_at, sum(1 for status in statuses if status >= 400)
@@ -0,0 +1,306 @@
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import Client
+from django.utils import timezone
+
+from social_networking.apps.users import (
+    benchmarking as users_benchmarking,
+    graph as users_graph,
+    models as users_models,
+    urls as users_urls,
+)
+from social_networking.apps.commons import ratelimit as commons_ratelimit
+
+READ_ENDPOINTS = [
+    'user-search', 'list-friends', 'list-pending-friend-requests', 'friend-suggestions', 'mutual-friends',
+    'mutual-friends-count', 'export-friends', 'export-friend-requests',
+]
+# run after reads as they change the population, login and logout last as they replace or drop tokens.
+WRITE_ENDPOINTS = [
+    'send-friend-request', 'bulk-send-friend-request', 'accept-reject-friend-request',
+    'bulk-accept-reject-friend-request', 'user', 'login', 'logout',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a reproducible population with a power law friend degree distribution in a throwaway SQLite '
+        'database, drive every users endpoint through the Django test client at given concurrency and report '
+        'latency percentiles, throughput and queries per endpoint as JSON (sorted keys, to diff runs)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument(
+            '--edges-per-user', type=int, default=5, help='Friendships every new user makes (Barabasi-Albert m)'
+        )
+        parser.add_argument('--pending-per-user', type=int, default=2, help='Pending friend requests per user')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=4, help='Threads sending requests')
+        parser.add_argument('--endpoints', default='', help='Comma separated URL names, all when empty')
+        parser.add_argument(
+            '--database-file', default=None, help='SQLite file to (re)create and keep, a temporary one by default'
+        )
+        parser.add_argument('--output', default='-', help='File to write the JSON report to, - for stdout')
+
+    def handle(self, *args, **options):
+        endpoints = self.get_endpoints(options['endpoints'])
+        if options['database_file']:
+            path, temp_dir = options['database_file'], None
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            temp_dir = tempfile.mkdtemp(prefix='benchmark-')
+            path = os.path.join(temp_dir, 'benchmark.sqlite3')
+
+        try:
+            with users_benchmarking.sqlite_database(path):
+                population = users_benchmarking.generate_population(
+                    options['users'], options['edges_per_user'], options['pending_per_user'], options['seed']
+                )
+                users_graph.friend_graph.clear()
+                # loaded up front, so the first request of mutual friends endpoints doesn't pay for it.
+                users_graph.get_friend_graph()
+                scenarios = Scenarios(options['seed'], options['requests'])
+                results = {}
+                for name in endpoints:
+                    # actors are shared by endpoints, sends and bulk sends have one friend request rate limit.
+                    commons_ratelimit.reset_rate_limiter()
+                    results[name] = self.run(scenarios.build(name), options['concurrency'])
+        finally:
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+        report = {
+            'meta': {
+                'generated_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': 'sqlite3',
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+            },
+            'population': population,
+            'endpoints': results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output'] == '-':
+            self.stdout.write(output)
+            return
+        with open(options['output'], 'w') as report_file:
+            report_file.write(output + '\n')
+        self.write_table(results)
+        self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+
+    def get_endpoints(self, names):
+        url_names = [pattern.name for pattern in users_urls.urlpatterns]
+        missing = set(url_names) - set(READ_ENDPOINTS) - set(WRITE_ENDPOINTS)
+        if missing:
+            raise CommandError(f'No benchmark scenario for {", ".join(sorted(missing))}')
+        endpoints = READ_ENDPOINTS + WRITE_ENDPOINTS
+        if names:
+            selected = names.split(',')
+            unknown = set(selected) - set(endpoints)
+            if unknown:
+                raise CommandError(f'Unknown endpoints {", ".join(sorted(unknown))}')
+            endpoints = [name for name in endpoints if name in selected]
+        return endpoints
+
+    def run(self, specs, concurrency):
+        local = threading.local()
+
+        def call(spec):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client(raise_request_exception=False, HTTP_HOST='localhost')
+            method, path, body, extra = spec
+            started_at = time.perf_counter()
+            response = client.generic(
+                method, path, json.dumps(body) if body is not None else '', content_type='application/json', **extra
+            )
+            if response.streaming:
+                # streamed rows are read while the body is sent.
+                b''.join(response.streaming_content)
+            latency = time.perf_counter() - started_at
+            # test client leaves connections open, a server closes them (or gives them back to the pool).
+            close_old_connections()
+            recorder = getattr(response.wsgi_request, 'query_recorder', None)
+            return response.status_code, latency, recorder
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            calls = list(executor.map(call, specs))
+        seconds = time.perf_counter() - started_at
+
+        latencies = sorted(latency * 1000 for _, latency, _ in calls)
+        recorders = [recorder for _, _, recorder in calls if recorder is not None]
+        queries = sorted(recorder.count for recorder in recorders)
+        statuses = Counter(str(status) for status, _, _ in calls)
+        return {
+            'method': specs[0][0],
+            'requests': len(calls),
+            'errors': sum(1 for status, _, _ in calls if status >= 400),
+            'statuses': dict(statuses),
+            'seconds': round(seconds, 4),
+            'throughput': round(len(calls) / seconds, 2),
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies), 3),
+                'p50': round(users_benchmarking.percentile(latencies, 50), 3),
+                'p95': round(users_benchmarking.percentile(latencies, 95), 3),
+                'p99': round(users_benchmarking.percentile(latencies, 99), 3),
+                'max': round(latencies[-1], 3),
+            },
+            'queries': {
+                'mean': round(sum(queries) / len(queries), 2) if queries else None,
+                'max': queries[-1] if queries else None,
+                'db_ms_mean': (
+                    round(sum(recorder.seconds for recorder in recorders) * 1000 / len(recorders), 3)
+                    if recorders else None
+                ),
+            },
+        }
+
+    def write_table(self, results):
+        self.stdout.write(
+            f'{"endpoint":<36}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"errors":>8}'
+        )
+        for name, result in results.items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f'{name:<36}{result["throughput"]:>9.1f}{latency["p50"]:>9.2f}{latency["p95"]:>9.2f}'
+                f'{latency["p99"]:>9.2f}{result["queries"]["mean"] or 0:>9.1f}{result["errors"]:>8}'
+            )
+
+
+class Scenarios:
+    """
+    Requests of every endpoint as (method, path, body, extra) specs, built up front from the seed so that
+    a run sends the same requests whatever the concurrency.
+    Users are split in three: most act in read and friend request endpoints, one tenth logs in (which
+    replaces their token) and one tenth logs out (which drops it), so that those don't break the others.
+    """
+
+    def __init__(self, seed, requests):
+        self.rng = random.Random(seed)
+        self.requests = requests
+        self.tokens = dict(users_models.Token.objects.values_list('user_id', 'key'))
+        user_ids = sorted(self.tokens)
+        self.rng.shuffle(user_ids)
+        tenth = max(1, len(user_ids) // 10)
+        self.logout_ids = user_ids[:tenth]
+        self.login_ids = user_ids[tenth:2 * tenth]
+        self.actor_ids = user_ids[2 * tenth:] or user_ids
+        self.all_ids = sorted(user_ids)
+        actors = set(self.actor_ids)
+        by_receiver = defaultdict(list)
+        for request_id, receiver_id in users_models.FriendshipRequest.objects.filter(
+            status=users_models.FriendshipRequest.PENDING
+        ).order_by('id').values_list('id', 'receiver_id'):
+            if receiver_id in actors:
+                by_receiver[receiver_id].append(request_id)
+        receivers = sorted(by_receiver)
+        self.rng.shuffle(receivers)
+        # receivers answering one request and those answering all of theirs at once don't overlap.
+        half = len(receivers) // 2
+        self.single_requests = [(receiver_id, by_receiver[receiver_id][0]) for receiver_id in receivers[:half]]
+        self.bulk_receivers = receivers[half:]
+        self.emails = dict(users_models.SocialNetworkingUser.objects.filter(
+            id__in=self.login_ids
+        ).values_list('id', 'email'))
+
+    def build(self, name):
+        build = getattr(self, name.replace('-', '_'))
+        return [build(index) for index in range(self.requests)]
+
+    def auth(self, user_id):
+        return {'HTTP_AUTHORIZATION': f'Token {self.tokens[user_id]}'}
+
+    def actor(self, index):
+        return self.actor_ids[index % len(self.actor_ids)]
+
+    def user_search(self, index):
+        kind = index % 3
+        if kind == 0:
+            keyword = users_benchmarking.population_email(self.rng.randrange(len(self.all_ids)))
+        elif kind == 1:
+            keyword = self.rng.choice(users_benchmarking.FIRST_NAMES)[:3]
+        else:
+            keyword = f'{self.rng.choice(users_benchmarking.FIRST_NAMES)} {self.rng.choice(users_benchmarking.LAST_NAMES)}'
+        return 'GET', f'/accounts/search/?q={keyword.replace(" ", "+")}', None, self.auth(self.actor(index))
+
+    def list_friends(self, index):
+        return 'GET', '/accounts/friends/', None, self.auth(self.actor(index))
+
+    def list_pending_friend_requests(self, index):
+        return 'GET', '/accounts/pending-friend-requests/', None, self.auth(self.actor(index))
+
+    def friend_suggestions(self, index):
+        return 'GET', '/accounts/friends/suggestions/', None, self.auth(self.actor(index))
+
+    def export_friends(self, index):
+        return 'GET', '/accounts/friends/export/', None, self.auth(self.actor(index))
+
+    def export_friend_requests(self, index):
+        return 'GET', '/accounts/friend-request/export/', None, self.auth(self.actor(index))
+
+    def mutual_friends(self, index):
+        other_id = self.rng.choice(self.all_ids)
+        return 'GET', f'/accounts/friends/mutual/{other_id}/', None, self.auth(self.actor(index))
+
+    def mutual_friends_count(self, index):
+        user_ids = ','.join(str(user_id) for user_id in self.rng.sample(self.all_ids, min(10, len(self.all_ids))))
+        return 'GET', f'/accounts/friends/mutual/?user_ids={user_ids}', None, self.auth(self.actor(index))
+
+    def send_friend_request(self, index):
+        body = {'receiver': self.rng.choice(self.all_ids)}
+        return 'POST', '/accounts/friend-request/send/', body, self.auth(self.actor(index))
+
+    def bulk_send_friend_request(self, index):
+        # every receiver counts against the friend_request rate limit (3/min).
+        body = {'receivers': self.rng.sample(self.all_ids, min(3, len(self.all_ids)))}
+        return 'POST', '/accounts/friend-request/bulk/send/', body, self.auth(self.actor(index))
+
+    def accept_reject_friend_request(self, index):
+        if not self.single_requests:
+            raise CommandError('Population has no pending friend requests, raise --pending-per-user')
+        receiver_id, request_id = self.single_requests[index % len(self.single_requests)]
+        body = {'action': 'accept' if index % 2 == 0 else 'reject'}
+        return 'PATCH', f'/accounts/friend-request/{request_id}/', body, self.auth(receiver_id)
+
+    def bulk_accept_reject_friend_request(self, index):
+        if not self.bulk_receivers:
+            raise CommandError('Population has no pending friend requests, raise --pending-per-user')
+        receiver_id = self.bulk_receivers[index % len(self.bulk_receivers)]
+        body = {'action': 'accept' if index % 2 == 0 else 'reject', 'all': True}
+        return 'PATCH', '/accounts/friend-request/bulk/', body, self.auth(receiver_id)
+
+    def user(self, index):
+        body = {
+            'email': f'registered{index}@{users_benchmarking.POPULATION_EMAIL_DOMAIN}',
+            'name': self.rng.choice(users_benchmarking.FIRST_NAMES),
+            'password': users_benchmarking.POPULATION_PASSWORD,
+        }
+        return 'POST', '/accounts/user/', body, {}
+
+    def login(self, index):
+        user_id = self.login_ids[index % len(self.login_ids)]
+        body = {'email': self.emails[user_id], 'password': users_benchmarking.POPULATION_PASSWORD}
+        # login is rate limited per client IP.
+        remote_addr = f'10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}'
+        return 'POST', '/accounts/login/', body, {'REMOTE_ADDR': remote_addr}
+
+    def logout(self, index):
+        return 'POST', '/accounts/logout/', None, self.auth(self.logout_ids[index % len(self.logout_ids)])
@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from social_networking.apps.users import (
+    exporting as users_exporting,
+    models as users_models,
+)
+from social_networking.apps.commons import constants as commons_constants
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream all friends or all friend requests (sent and received, any status) of a user as NDJSON, '
+        'same output as the export endpoints'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='Id or email of the user')
+        parser.add_argument('--kind', choices=list(users_exporting.EXPORTS), default=users_exporting.FRIENDS)
+        parser.add_argument('--output', default='-', help='File to write, - for stdout')
+        parser.add_argument('--chunk-size', type=int, default=commons_constants.EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        lookup = {'id': options['user']} if options['user'].isdigit() else {'email': options['user']}
+        user_id = users_models.SocialNetworkingUser.objects.filter(**lookup).values_list('id', flat=True).first()
+        if user_id is None:
+            raise CommandError(f'No such user {options["user"]}')
+
+        blocks = users_exporting.EXPORTS[options['kind']](user_id, options['chunk_size'])
+        if options['output'] == '-':
+            for block in blocks:
+                sys.stdout.buffer.write(block)
+            sys.stdout.flush()
+            return
+        lines = 0
+        with open(options['output'], 'wb') as file:
+            for block in blocks:
+                file.write(block)
+                lines += block.count(b'\n')
+        self.stderr.write(self.style.SUCCESS(f'Exported {lines} {options["kind"]} to {options["output"]}'))
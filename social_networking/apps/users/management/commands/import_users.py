@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from social_networking.apps.users import importing as users_importing
+from social_networking.apps.commons import constants as commons_constants
+
+
+class Command(BaseCommand):
+    help = (
+        'Import users, friendships or friend requests from a CSV (with a header row) or JSON lines file, '
+        'streaming it in batches. Stopped imports resume from the last committed batch when run again. '
+        'Fields: users - email, name, password or password_hash; friendships - email, friend_email; '
+        'requests - sender_email, receiver_email, status (pending, accepted or rejected)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument(
+            '--kind', choices=list(users_importing.IMPORTERS), default=users_importing.USERS,
+            help='What the file holds, import users before their friendships and requests'
+        )
+        parser.add_argument(
+            '--format', choices=users_importing.FORMATS, default=None,
+            help='File format, by default jsonl for .jsonl/.ndjson/.json files and csv otherwise'
+        )
+        parser.add_argument('--batch-size', type=int, default=commons_constants.IMPORT_BATCH_SIZE)
+        parser.add_argument('--checkpoint', default=None, help='Progress file, PATH.checkpoint by default')
+        parser.add_argument('--restart', action='store_true', help='Ignore progress of an earlier run')
+
+    def handle(self, *args, **options):
+        def report_batch(records, stats):
+            if options['verbosity'] > 1:
+                self.stdout.write(self.format_stats(records, stats))
+
+        def report_error(number, message):
+            if options['verbosity'] > 0:
+                self.stderr.write(f'Record {number}: {message}')
+
+        try:
+            stats = users_importing.import_file(
+                options['path'], options['kind'], file_format=options['format'], batch_size=options['batch_size'],
+                checkpoint_path=options['checkpoint'], restart=options['restart'],
+                on_batch=report_batch, on_error=report_error,
+            )
+        except FileNotFoundError as error:
+            raise CommandError(error)
+        except users_importing.CheckpointMismatch as error:
+            raise CommandError(f'{error}, pass --checkpoint or --restart')
+        self.stdout.write(self.style.SUCCESS(f'Imported {options["kind"]}: {self.format_stats(stats["records"], stats)}'))
+
+    @staticmethod
+    def format_stats(records, stats):
+        return f'{records} records, {stats["created"]} created, {stats["skipped"]} skipped, {stats["invalid"]} invalid'
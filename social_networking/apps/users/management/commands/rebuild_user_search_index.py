@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from social_networking.apps.users import search as users_search
+from social_networking.apps.commons import constants as commons_constants
+
+
+class Command(BaseCommand):
+    help = 'Rebuild search tokens of all users from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=commons_constants.SEARCH_INDEX_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        indexed = users_search.rebuild_index(batch_size=options['batch_size'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt for {indexed} users'))
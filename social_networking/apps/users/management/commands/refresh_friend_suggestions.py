@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from social_networking.apps.users import (
+    graph as users_graph,
+    models as users_models,
+    suggestions as users_suggestions,
+)
+from social_networking.apps.commons import constants as commons_constants
+
+
+class Command(BaseCommand):
+    help = 'Recompute "people you may know" suggestions, only stale ones unless --all is passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute suggestions of every user having friends')
+        parser.add_argument('--batch-size', type=int, default=commons_constants.FRIEND_SUGGESTIONS_BATCH_SIZE)
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help='Keep running as a worker, looking for stale suggestions every INTERVAL seconds'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            refreshed = self.refresh(options['all'], options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Refreshed suggestions of {refreshed} users'))
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
+
+    def refresh(self, refresh_all, batch_size):
+        if refresh_all:
+            users = users_models.Friend.objects.values_list('user_id', flat=True).distinct()
+        else:
+            users = users_models.FriendSuggestion.objects.filter(stale=True).values_list('user_id', flat=True)
+        if not users.exists():
+            return 0
+
+        # fresh graph for every pass, edges added by web workers since our last pass must be seen.
+        graph = users_graph.FriendGraph.load()
+        refreshed = 0
+        last_id = 0
+        while True:
+            user_ids = list(users.filter(user_id__gt=last_id).order_by('user_id')[:batch_size])
+            if not user_ids:
+                break
+            refreshed += users_suggestions.refresh_suggestions(user_ids, graph)
+            last_id = user_ids[-1]
+        return refreshed
@@ -0,0 +1,177 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.db.models import Count
+from django.test import Client
+
+from social_networking.apps.users import (
+    benchmarking as users_benchmarking,
+    models as users_models,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Answer pending friend requests of a generated population from many threads at once, in a throwaway '
+        'SQLite database: every request gets several concurrent accepts or rejects (double taps) and some pairs '
+        'of users asked each other, answered from both sides at once. Checks that every request was answered '
+        'once, no friendship is stored twice and friendships match accepted requests, reports throughput as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--pending-per-user', type=int, default=2, help='Pending friend requests per user')
+        parser.add_argument('--mutual-share', type=float, default=0.3, help='Share of requests also sent back')
+        parser.add_argument('--taps', type=int, default=3, help='Concurrent answers sent for every request')
+        parser.add_argument('--reject-share', type=float, default=0.2, help='Share of answers which reject')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='-', help='File to write the JSON report to, - for stdout')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        temp_dir = tempfile.mkdtemp(prefix='stress-')
+        try:
+            with users_benchmarking.sqlite_database(os.path.join(temp_dir, 'stress.sqlite3')):
+                population = users_benchmarking.generate_population(
+                    options['users'], 1, options['pending_per_user'], options['seed']
+                )
+                requests = self.add_mutual_requests(rng, options['mutual_share'])
+                specs = self.build_specs(rng, requests, options['taps'], options['reject_share'])
+                started_at = time.perf_counter()
+                calls = self.run(specs, options['threads'])
+                seconds = time.perf_counter() - started_at
+                checks = self.verify(requests, specs, calls)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        latencies = sorted(latency * 1000 for _, latency in calls)
+        report = {
+            'population': population,
+            'requests': len(requests),
+            'answers': len(calls),
+            'threads': options['threads'],
+            'statuses': dict(Counter(str(status) for status, _ in calls)),
+            'seconds': round(seconds, 4),
+            'throughput': round(len(calls) / seconds, 2),
+            'latency_ms': {
+                'p50': round(users_benchmarking.percentile(latencies, 50), 3),
+                'p95': round(users_benchmarking.percentile(latencies, 95), 3),
+                'p99': round(users_benchmarking.percentile(latencies, 99), 3),
+                'max': round(latencies[-1], 3),
+            },
+            'checks': checks,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output'] == '-':
+            self.stdout.write(output)
+        else:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output + '\n')
+        failed = [name for name, count in checks.items() if count]
+        if failed:
+            raise CommandError(f'Checks failed: {", ".join(failed)}')
+        self.stderr.write(self.style.SUCCESS(
+            f'{len(calls)} answers to {len(requests)} requests at {report["throughput"]} req/s, all checks passed'
+        ))
+
+    @staticmethod
+    def add_mutual_requests(rng, share):
+        """
+        Send a share of the pending requests back, returns (id, sender id, receiver id) of all of them.
+        """
+        requests = list(users_models.FriendshipRequest.objects.filter(
+            status=users_models.FriendshipRequest.PENDING
+        ).values_list('id', 'sender_id', 'receiver_id'))
+        users_models.FriendshipRequest.objects.bulk_create([
+            users_models.FriendshipRequest(sender_id=receiver_id, receiver_id=sender_id)
+            for _, sender_id, receiver_id in requests if rng.random() < share
+        ])
+        return list(users_models.FriendshipRequest.objects.filter(
+            status=users_models.FriendshipRequest.PENDING
+        ).values_list('id', 'sender_id', 'receiver_id'))
+
+    @staticmethod
+    def build_specs(rng, requests, taps, reject_share):
+        """
+        (request id, action, token of the receiver) of every answer, shuffled so taps on a request
+        and answers of both users of a pair run at the same time.
+        """
+        tokens = dict(users_models.Token.objects.values_list('user_id', 'key'))
+        specs = [
+            (request_id, 'reject' if rng.random() < reject_share else 'accept', tokens[receiver_id])
+            for request_id, _, receiver_id in requests
+            for _ in range(taps)
+        ]
+        rng.shuffle(specs)
+        return specs
+
+    @staticmethod
+    def run(specs, threads):
+        local = threading.local()
+
+        def call(spec):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client(raise_request_exception=False, HTTP_HOST='localhost')
+            request_id, action, token = spec
+            started_at = time.perf_counter()
+            response = client.patch(
+                f'/accounts/friend-request/{request_id}/', json.dumps({'action': action}),
+                content_type='application/json', HTTP_AUTHORIZATION=f'Token {token}',
+            )
+            latency = time.perf_counter() - started_at
+            close_old_connections()
+            return response.status_code, latency
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return list(executor.map(call, specs))
+
+    @staticmethod
+    def verify(requests, specs, calls):
+        """
+        Number of violations of every invariant, all 0 when answering is safe under concurrency.
+        """
+        answers = defaultdict(list)
+        for (request_id, action, _), (status, _) in zip(specs, calls):
+            if status == 204:
+                answers[request_id].append(action)
+        statuses = dict(users_models.FriendshipRequest.objects.filter(
+            id__in=[request_id for request_id, _, _ in requests]
+        ).values_list('id', 'status'))
+        expected_status = {
+            'accept': users_models.FriendshipRequest.ACCEPTED,
+            'reject': users_models.FriendshipRequest.REJECTED,
+        }
+        friends = set(users_models.Friend.objects.values_list('user_id', 'friend_id'))
+        accepted_pairs = {
+            frozenset((sender_id, receiver_id)) for request_id, sender_id, receiver_id in requests
+            if statuses[request_id] == users_models.FriendshipRequest.ACCEPTED
+        }
+        pairs = {frozenset((sender_id, receiver_id)) for _, sender_id, receiver_id in requests}
+        return {
+            # two answers succeeding for one request is what a race looks like.
+            'answered_more_than_once': sum(1 for actions in answers.values() if len(actions) > 1),
+            'status_not_of_answer': sum(
+                1 for request_id, actions in answers.items()
+                if len(actions) == 1 and statuses[request_id] != expected_status[actions[0]]
+            ),
+            'left_pending': sum(1 for status in statuses.values() if status == users_models.FriendshipRequest.PENDING),
+            'duplicate_friend_rows': users_models.Friend.objects.values('user_id', 'friend_id').annotate(
+                rows=Count('id')
+            ).filter(rows__gt=1).count(),
+            'friendships_not_accepted': sum(
+                1 for pair in pairs
+                if ((min(pair), max(pair)) in friends) != (pair in accepted_pairs)
+            ),
+            'one_sided_friendships': sum(1 for user_id, friend_id in friends if (friend_id, user_id) not in friends),
+        }
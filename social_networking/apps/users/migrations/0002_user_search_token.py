@@ -0,0 +1,53 @@
+# Generated by Django 3.2 on 2026-10-18 12:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from social_networking.apps.commons import constants as commons_constants
+
+
+def build_search_index(apps, schema_editor):
+    # imported here so that only the pure tokenizer is used, models come from migration state.
+    from social_networking.apps.users.search import build_tokens
+
+    SocialNetworkingUser = apps.get_model('users', 'SocialNetworkingUser')
+    UserSearchToken = apps.get_model('users', 'UserSearchToken')
+    batch_size = commons_constants.SEARCH_INDEX_BATCH_SIZE
+    last_id = 0
+    while True:
+        users = list(
+            SocialNetworkingUser.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'name', 'email')[:batch_size]
+        )
+        if not users:
+            break
+        UserSearchToken.objects.bulk_create([
+            UserSearchToken(user_id=user_id, kind=kind, token=token)
+            for user_id, name, email in users
+            for kind, token in build_tokens(name, email)
+        ], batch_size=batch_size)
+        last_id = users[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=254)),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Name'), (2, 'Email')])),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='usersearchtoken',
+            constraint=models.UniqueConstraint(fields=('token', 'kind', 'user'), name='unique_user_search_token'),
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
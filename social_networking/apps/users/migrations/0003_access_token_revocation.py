@@ -0,0 +1,21 @@
+# Generated by Django 3.2 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_search_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessTokenRevocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField(unique=True)),
+                ('revoked_before', models.BigIntegerField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 3.2 on 2026-10-18 12:33
+
+from django.db import migrations, models, transaction
+from django.db.models import Max
+
+BATCH_SIZE = 1000
+
+
+def mirror_friendships(apps, schema_editor):
+    """
+    Store every friendship in both directions and drop duplicate rows of the same pair.
+    Each batch commits on its own and is idempotent, so an interrupted run can simply be started again.
+    """
+    Friend = apps.get_model('users', 'Friend')
+    max_id = Friend.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    last_id = 0
+    while last_id < max_id:
+        with transaction.atomic():
+            rows = list(
+                Friend.objects.filter(id__gt=last_id, id__lte=max_id).order_by('id').values_list(
+                    'id', 'user_id', 'friend_id'
+                )[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+            pairs = set()
+            for _, user_id, friend_id in rows:
+                pairs.update(((user_id, friend_id), (friend_id, user_id)))
+            user_ids = {user_id for user_id, _ in pairs}
+
+            # rows between users of the batch hold every row of its pairs, first row of every pair is the one we keep.
+            first_ids = {}
+            for pk, user_id, friend_id in Friend.objects.filter(
+                user_id__in=user_ids, friend_id__in=user_ids
+            ).order_by('id').values_list('id', 'user_id', 'friend_id'):
+                if (user_id, friend_id) in pairs:
+                    first_ids.setdefault((user_id, friend_id), pk)
+
+            duplicate_ids = {pk for pk, user_id, friend_id in rows if first_ids[(user_id, friend_id)] != pk}
+            if duplicate_ids:
+                Friend.objects.filter(id__in=duplicate_ids).delete()
+
+            mirrors = {
+                (friend_id, user_id) for pk, user_id, friend_id in rows
+                if pk not in duplicate_ids and (friend_id, user_id) not in first_ids
+            }
+            Friend.objects.bulk_create([Friend(user_id=user_id, friend_id=friend_id) for user_id, friend_id in mirrors])
+            last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+    # batches of the backfill commit one by one. The index and constraint are added after it, so a run that
+    # fails midway leaves the schema untouched and migrating again resumes the backfill.
+    atomic = False
+
+    dependencies = [
+        ('users', '0003_access_token_revocation'),
+    ]
+
+    operations = [
+        migrations.RunPython(mirror_friendships, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='friend',
+            index=models.Index(fields=['user', 'id', 'friend'], name='friend_user_id_friend_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='friend',
+            constraint=models.UniqueConstraint(fields=('user', 'friend'), name='unique_friend_pair'),
+        ),
+    ]
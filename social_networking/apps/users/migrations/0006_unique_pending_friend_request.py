@@ -0,0 +1,44 @@
+# Generated by Django 3.2 on 2026-10-18 13:40
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+PENDING = 1
+
+
+def mark_pending_requests(apps, schema_editor):
+    """
+    Clear the pending marker of answered requests and drop duplicate pending requests of a pair
+    (sent concurrently before the constraint), keeping the oldest one.
+    """
+    FriendshipRequest = apps.get_model('users', 'FriendshipRequest')
+    FriendshipRequest.objects.exclude(status=PENDING).update(pending=None)
+    duplicated = FriendshipRequest.objects.filter(status=PENDING).values('sender_id', 'receiver_id').annotate(
+        requests=Count('id'), first_id=Min('id')
+    ).filter(requests__gt=1)
+    for pair in duplicated.iterator():
+        FriendshipRequest.objects.filter(
+            sender_id=pair['sender_id'], receiver_id=pair['receiver_id'], status=PENDING
+        ).exclude(id=pair['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_friend_suggestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='friendshiprequest',
+            name='pending',
+            field=models.BooleanField(default=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_pending_requests, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='friendshiprequest',
+            constraint=models.UniqueConstraint(
+                fields=('sender', 'receiver', 'pending'), name='unique_pending_friend_request'
+            ),
+        ),
+    ]
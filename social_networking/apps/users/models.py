@@ -1,10 +1,15 @@
 
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
+from social_networking.apps.users import signals as users_signals
 from social_networking.apps.commons import (
     constants as commons_constants,
+    hashing as commons_hashing,
     models as commons_models,
+    profiling as commons_profiling,
+    signing as commons_signing,
     utils as commons_utils
 )
 
@@ -55,6 +60,7 @@ class SocialNetworkingUser(AbstractBaseUser, PermissionsMixin, commons_models.Ti
         return f'{self.name}'
 
     @property
+    @commons_profiling.timed('token')
     def get_token(self):
         token, created = Token.objects.get_or_create(user=self)
         if created:
@@ -62,14 +68,41 @@ class SocialNetworkingUser(AbstractBaseUser, PermissionsMixin, commons_models.Ti
         else:
             '''delete already existing token and generate a new one and return'''
             token.delete()
+            # other workers drop the old token from their token caches, see commons.authentication.TokenCache.
+            self.revoke_access_tokens()
             return Token.objects.create(user=self).key
 
+    @property
+    @commons_profiling.timed('token')
+    def get_access_token(self):
+        """
+        Signed access token, verified without any DB hit. See commons.authentication.SignedTokenAuthentication
+        """
+        config = commons_utils.get_config('SIGNED_ACCESS_TOKEN', commons_constants.SIGNED_ACCESS_TOKEN_DEFAULTS)
+        return commons_signing.sign_access_token(self.id, config['LIFETIME'])
+
+    def revoke_access_tokens(self):
+        """
+        Reject all signed access tokens issued to this user till now, and Token keys cached by any worker.
+        """
+        return AccessTokenRevocation.revoke(self.id)
+
+    def set_password(self, raw_password):
+        # hashed in the hashing service's process pool, not on the request thread.
+        self.password = commons_hashing.make_password(raw_password)
+        self._password = raw_password
+
     def save(self, *args, **kwargs):
         # set password will come into action only if password changed
         # we are setting password here because this is the common place for all flows including django admin.
         if not self.id or 'password' in kwargs.get('update_fields', []):
             self.set_password(self.password)
-        return super().save(*args, **kwargs)
+        # set_password keeps raw password in _password till the save completes.
+        password_changed = self.id is not None and self._password is not None
+        super().save(*args, **kwargs)
+        if password_changed:
+            # signed access tokens issued with old password should stop working.
+            self.revoke_access_tokens()
 
 
 class Token(commons_models.TimeStamp):
@@ -89,6 +122,37 @@ class Token(commons_models.TimeStamp):
         return super().save(*args, **kwargs)
 
 
+class AccessTokenRevocation(models.Model):
+    """
+    Signed access tokens of a user issued before revoked_before (epoch milliseconds) are rejected.
+    One row per user is enough to handle logout and password changes, tokens are short lived anyway.
+    user_id is not a foreign key so that revocation survives deletion of the user.
+    """
+    user_id = models.BigIntegerField(unique=True)
+    revoked_before = models.BigIntegerField(db_index=True)
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.revoked_before}'
+
+    @classmethod
+    def revoke(cls, user_id):
+        revocation, _ = cls.objects.update_or_create(
+            user_id=user_id, defaults={'revoked_before': commons_signing.now_ms()}
+        )
+        return revocation
+
+
+class FriendshipRequestQuerySet(models.QuerySet):
+    def answer(self, status):
+        """
+        Set status of the requests with one update and return how many changed. Filtered on PENDING it's a
+        conditional update, of concurrent answers to a request only one changes it.
+        """
+        return self.update(
+            status=status, pending=self.model.pending_marker(status), updated_at=timezone.now()
+        )
+
+
 class FriendshipRequest(commons_models.TimeStamp):
     PENDING = 1
     ACCEPTED = 2
@@ -98,18 +162,118 @@ class FriendshipRequest(commons_models.TimeStamp):
         (ACCEPTED, 'Accepted'),
         (REJECTED, 'Rejected')
     ]
+    STATUS_LABELS = dict(REQUEST_STATUS_CHOICES)
     sender = models.ForeignKey(SocialNetworkingUser, related_name='sent_requests', on_delete=models.CASCADE)
     receiver = models.ForeignKey(SocialNetworkingUser, related_name='received_requests', on_delete=models.CASCADE)
     status = models.PositiveSmallIntegerField(default=PENDING, choices=REQUEST_STATUS_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
+    # True while status is PENDING and NULL after, see unique_pending_friend_request.
+    pending = models.BooleanField(null=True, default=True, editable=False)
+
+    objects = FriendshipRequestQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # at most one pending request from a sender to a receiver, also under concurrent sends. In effect a
+            # unique index on (sender, receiver) WHERE status = PENDING, which MySQL lacks: NULLs never collide.
+            models.UniqueConstraint(fields=['sender', 'receiver', 'pending'], name='unique_pending_friend_request'),
+        ]
 
     def __str__(self):
-        return f'{self.sender} -> {self.receiver} -> {dict(self.REQUEST_STATUS_CHOICES).get(self.status)}'
+        return f'{self.sender} -> {self.receiver} -> {self.STATUS_LABELS.get(self.status)}'
+
+    @classmethod
+    def pending_marker(cls, status):
+        return True if status == cls.PENDING else None
+
+    def save(self, *args, **kwargs):
+        self.pending = self.pending_marker(self.status)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'pending'}
+        return super().save(*args, **kwargs)
+
+
+class FriendManager(models.Manager):
+    def create_friendship(self, user, friend):
+        """
+        Friendship is stored as mirrored rows (user -> friend and friend -> user), so that listing friends
+        of a user and checking whether two users are friends are both single index lookups on user.
+        """
+        return self.create_friendships([(getattr(user, 'pk', user), getattr(friend, 'pk', friend))])
+
+    def create_friendships(self, pairs):
+        """
+        Store many (user_id, friend_id) friendships with a single insert, existing ones are left alone.
+        """
+        pairs = list(pairs)
+        friends = self.bulk_create(
+            [
+                self.model(user_id=source, friend_id=target)
+                for user_id, friend_id in pairs
+                for source, target in ((user_id, friend_id), (friend_id, user_id))
+            ],
+            ignore_conflicts=True
+        )
+        transaction.on_commit(lambda: users_signals.friendships_created.send(sender=self.model, pairs=pairs))
+        return friends
+
+    def are_friends(self, user, friend):
+        return self.filter(user=user, friend=friend).exists()
 
 
 class Friend(commons_models.TimeStamp):
     user = models.ForeignKey(SocialNetworkingUser, related_name='friends', on_delete=models.CASCADE)
     friend = models.ForeignKey(SocialNetworkingUser, related_name='user_friends', on_delete=models.CASCADE)
 
+    objects = FriendManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'friend'], name='unique_friend_pair'),
+        ]
+        indexes = [
+            # covers "friends of user, latest first" without touching the table.
+            models.Index(fields=['user', 'id', 'friend'], name='friend_user_id_friend_idx'),
+        ]
+
     def __str__(self):
         return f'{self.user} -> {self.friend}'
+
+
+class UserSearchToken(models.Model):
+    """
+    Inverted index used by user search. Every user gets one row per prefix of each word in the name
+    and one row holding the full lower cased email, so a search is an index range lookup on token.
+    """
+    NAME = 1
+    EMAIL = 2
+    TOKEN_KIND_CHOICES = [
+        (NAME, 'Name'),
+        (EMAIL, 'Email'),
+    ]
+    user = models.ForeignKey(SocialNetworkingUser, related_name='search_tokens', on_delete=models.CASCADE)
+    token = models.CharField(max_length=commons_constants.SEARCH_TOKEN_LENGTH)
+    kind = models.PositiveSmallIntegerField(choices=TOKEN_KIND_CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['token', 'kind', 'user'], name='unique_user_search_token'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.token}'
+
+
+class FriendSuggestion(commons_models.TimeStamp):
+    """
+    Precomputed "people you may know" list of a user, ranked by number of mutual friends.
+    suggestions holds [{'id', 'name', 'email', 'mutual_friends'}, ...] so a read is a single row lookup.
+    stale rows are recomputed by `refresh_friend_suggestions` management command.
+    """
+    user = models.OneToOneField(SocialNetworkingUser, related_name='friend_suggestion', on_delete=models.CASCADE)
+    suggestions = models.JSONField(default=list)
+    stale = models.BooleanField(default=False, db_index=True)
+
+    def __str__(self):
+        return f'{self.user_id} -> {len(self.suggestions)}'
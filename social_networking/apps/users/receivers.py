@@ -0,0 +1,142 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from social_networking.apps.users import (
+    graph as users_graph,
+    models as users_models,
+    search as users_search,
+    signals as users_signals,
+    suggestions as users_suggestions,
+)
+from social_networking.apps.commons import (
+    authentication as commons_authentication,
+    cache as commons_cache,
+)
+from social_networking.apps.commons.db import routing as db_routing
+
+SEARCHABLE_FIELDS = {'name', 'email'}
+
+
+@receiver(post_save, sender=users_models.SocialNetworkingUser)
+def update_user_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    # tokens are removed by cascade when user is deleted, so only saves need to be handled here.
+    if raw or (update_fields is not None and not SEARCHABLE_FIELDS & set(update_fields)):
+        return
+    users_search.index_user(instance)
+
+
+@receiver(post_save, sender=users_models.SocialNetworkingUser)
+@receiver(post_delete, sender=users_models.SocialNetworkingUser)
+def invalidate_user_search_cache(sender, instance, raw=False, update_fields=None, **kwargs):
+    # cached pages show names and emails and are built without a caller, any searchable change drops them.
+    if raw or (update_fields is not None and not SEARCHABLE_FIELDS & set(update_fields)):
+        return
+    users_search.invalidate_search_cache()
+
+
+@receiver(post_save, sender=users_models.SocialNetworkingUser)
+@receiver(post_delete, sender=users_models.SocialNetworkingUser)
+def invalidate_user_auth_cache(sender, instance, **kwargs):
+    # cached user object would be stale now.
+    commons_authentication.token_cache.invalidate_user(instance.id)
+
+
+@receiver(post_save, sender=users_models.Token)
+@receiver(post_delete, sender=users_models.Token)
+def invalidate_token_auth_cache(sender, instance, **kwargs):
+    # covers SocialNetworkingUser.get_token too, which deletes the old token before creating a new one.
+    commons_authentication.token_cache.invalidate(instance.key)
+    commons_authentication.token_cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_delete, sender=users_models.SocialNetworkingUser)
+def revoke_deleted_user_access_tokens(sender, instance, **kwargs):
+    users_models.AccessTokenRevocation.revoke(instance.id)
+
+
+@receiver(post_save, sender=users_models.AccessTokenRevocation)
+def update_revocation_list(sender, instance, **kwargs):
+    # other workers pick it up on their next refresh.
+    commons_authentication.revocation_list.add(instance.user_id, instance.revoked_before)
+
+
+@receiver(post_save, sender=users_models.Friend)
+def create_mirror_friend(sender, instance, created, raw=False, **kwargs):
+    # Friend rows saved one by one (e.g. from admin) get their mirrored row, create_friendship writes both itself.
+    if created and not raw:
+        users_models.Friend.objects.create_friendship(instance.user_id, instance.friend_id)
+
+
+@receiver(post_delete, sender=users_models.Friend)
+def delete_mirror_friend(sender, instance, **kwargs):
+    users_models.Friend.objects.filter(user_id=instance.friend_id, friend_id=instance.user_id).delete()
+    pairs = [(instance.user_id, instance.friend_id)]
+    transaction.on_commit(lambda: users_signals.friendships_removed.send(sender=sender, pairs=pairs))
+
+
+@receiver(users_signals.friendships_created)
+def add_friend_graph_edges(sender, pairs, **kwargs):
+    users_graph.friend_graph.add_friendships(pairs)
+
+
+@receiver(users_signals.friendships_removed)
+def remove_friend_graph_edges(sender, pairs, **kwargs):
+    users_graph.friend_graph.remove_friendships(pairs)
+
+
+@receiver(users_signals.friendships_created)
+@receiver(users_signals.friendships_removed)
+def mark_friend_suggestions_stale(sender, pairs, **kwargs):
+    users_suggestions.mark_friendships_changed(pairs)
+
+
+@receiver(post_save, sender=users_models.FriendshipRequest)
+def discard_requested_suggestions(sender, instance, created, raw=False, **kwargs):
+    # users with a pending request between them are not suggested to each other.
+    if created and not raw:
+        users_suggestions.discard_suggestions([(instance.sender_id, instance.receiver_id)])
+
+
+@receiver(users_signals.friend_requests_created)
+def discard_bulk_requested_suggestions(sender, pairs, **kwargs):
+    users_suggestions.discard_suggestions(pairs)
+
+
+def bump_list_versions(user_ids):
+    # after commit, a list read before it must not be cached under the new version.
+    # users read from the primary for a while, a replica behind would cache their old lists under the new one.
+    user_ids = set(user_ids)
+
+    def bump():
+        db_routing.pin_to_primary(*user_ids)
+        commons_cache.response_cache.bump(user_ids)
+    transaction.on_commit(bump)
+
+
+@receiver(users_signals.friendships_created)
+@receiver(users_signals.friendships_removed)
+@receiver(users_signals.friend_requests_created)
+@receiver(users_signals.friend_requests_answered)
+def bump_pairs_list_versions(sender, pairs, **kwargs):
+    bump_list_versions(user_id for pair in pairs for user_id in pair)
+
+
+@receiver(post_save, sender=users_models.FriendshipRequest)
+@receiver(post_delete, sender=users_models.FriendshipRequest)
+def bump_friend_request_list_versions(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_list_versions([instance.sender_id, instance.receiver_id])
+
+
+@receiver(post_save, sender=users_models.SocialNetworkingUser)
+def bump_related_list_versions(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # lists of friends and of receivers of pending requests show name and email of this user.
+    if created or raw or (update_fields is not None and not SEARCHABLE_FIELDS & set(update_fields)):
+        return
+    user_ids = set(users_models.Friend.objects.filter(user_id=instance.id).values_list('friend_id', flat=True))
+    user_ids.update(users_models.FriendshipRequest.objects.filter(
+        sender_id=instance.id, status=users_models.FriendshipRequest.PENDING
+    ).values_list('receiver_id', flat=True))
+    if user_ids:
+        bump_list_versions(user_ids)
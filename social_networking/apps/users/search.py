@@ -0,0 +1,164 @@
+import re
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Max, Q, When
+
+from social_networking.apps.users import models as users_models
+from social_networking.apps.commons import (
+    cache as commons_cache,
+    constants as commons_constants,
+)
+
+WORD_RE = re.compile(r'\w+')
+
+
+def name_terms(value):
+    """
+    Split a name (or a search keyword) into lower cased words.
+    """
+    return [word[:commons_constants.SEARCH_TOKEN_LENGTH] for word in WORD_RE.findall((value or '').lower())]
+
+
+def normalize_email(value):
+    return (value or '').strip().lower()[:commons_constants.SEARCH_TOKEN_LENGTH]
+
+
+def normalize_query(keyword):
+    """
+    Search keyword reduced to what search_user_ids depends on: its normalized email and set of name words.
+    For Ex: 'Sumit Lohan ' and 'sumit lohan' give the same, so they share cached results.
+    """
+    return normalize_email(keyword), tuple(sorted(set(name_terms(keyword))))
+
+
+def build_tokens(name, email):
+    """
+    Return set of (kind, token) pairs to be indexed for a user.
+    Every prefix of every word in the name is indexed so search as you type is a plain equality lookup.
+    """
+    tokens = set()
+    for word in name_terms(name):
+        for length in range(1, len(word) + 1):
+            tokens.add((users_models.UserSearchToken.NAME, word[:length]))
+    email = normalize_email(email)
+    if email:
+        tokens.add((users_models.UserSearchToken.EMAIL, email))
+    return tokens
+
+
+def index_user(user):
+    """
+    Bring search tokens of a user in sync with its current name and email.
+    Only the difference is written, so saving a user without touching name/email costs one select.
+    """
+    tokens = build_tokens(user.name, user.email)
+    existing = {
+        (kind, token): pk for pk, kind, token in users_models.UserSearchToken.objects.filter(
+            user_id=user.id
+        ).values_list('id', 'kind', 'token')
+    }
+    stale_ids = [pk for key, pk in existing.items() if key not in tokens]
+    missing = [
+        users_models.UserSearchToken(user_id=user.id, kind=kind, token=token)
+        for kind, token in tokens if (kind, token) not in existing
+    ]
+    if not stale_ids and not missing:
+        return
+    with transaction.atomic():
+        if stale_ids:
+            users_models.UserSearchToken.objects.filter(id__in=stale_ids).delete()
+        if missing:
+            users_models.UserSearchToken.objects.bulk_create(missing, ignore_conflicts=True)
+
+
+def invalidate_search_cache():
+    """
+    Drop cached search results once the running transaction (if any) commits.
+    """
+    transaction.on_commit(commons_cache.search_cache.bump)
+
+
+def rebuild_index(batch_size=commons_constants.SEARCH_INDEX_BATCH_SIZE, stdout=None):
+    """
+    Drop and rebuild the whole search index, walking users in primary key order.
+    """
+    users_models.UserSearchToken.objects.all().delete()
+    last_id = 0
+    indexed = 0
+    while True:
+        users = list(
+            users_models.SocialNetworkingUser.objects.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'name', 'email'
+            )[:batch_size]
+        )
+        if not users:
+            break
+        search_tokens = [
+            users_models.UserSearchToken(user_id=user_id, kind=kind, token=token)
+            for user_id, name, email in users
+            for kind, token in build_tokens(name, email)
+        ]
+        users_models.UserSearchToken.objects.bulk_create(search_tokens, batch_size=batch_size)
+        last_id = users[-1][0]
+        indexed += len(users)
+        if stdout:
+            stdout.write(f'Indexed {indexed} users')
+    invalidate_search_cache()
+    return indexed
+
+
+def search_user_ids(keyword, exclude_user_id=None):
+    """
+    Return queryset of dicts having `user_id`, ranked with exact email match first and
+    then users whose name has a word starting with every word of the keyword (latest users first).
+    Empty keyword returns None, callers decide what an empty search means.
+    """
+    email = normalize_email(keyword)
+    terms = set(name_terms(keyword))
+    if not email:
+        return None
+
+    token_filter = Q(kind=users_models.UserSearchToken.EMAIL, token=email)
+    if terms:
+        token_filter |= Q(kind=users_models.UserSearchToken.NAME, token__in=terms)
+    search_tokens = users_models.UserSearchToken.objects.filter(token_filter)
+    if exclude_user_id:
+        search_tokens = search_tokens.exclude(user_id=exclude_user_id)
+
+    matches = search_tokens.values('user_id').annotate(
+        email_match=Max(Case(
+            When(kind=users_models.UserSearchToken.EMAIL, then=1), default=0, output_field=IntegerField()
+        )),
+        name_matches=Count('token', filter=Q(kind=users_models.UserSearchToken.NAME), distinct=True),
+    )
+    if terms:
+        matches = matches.filter(Q(email_match=1) | Q(name_matches=len(terms)))
+    else:
+        matches = matches.filter(email_match=1)
+    return matches.order_by('-email_match', '-user_id')
+
+
+def user_matches(keyword, name, email):
+    """
+    Whether search_user_ids(keyword) would find a user having name and email, without a query.
+    Empty keyword matches everyone.
+    """
+    query_email = normalize_email(keyword)
+    if not query_email:
+        return True
+    tokens = build_tokens(name, email)
+    if (users_models.UserSearchToken.EMAIL, query_email) in tokens:
+        return True
+    terms = set(name_terms(keyword))
+    return bool(terms) and all((users_models.UserSearchToken.NAME, term) in tokens for term in terms)
+
+
+def user_rows_for_ids(user_ids):
+    """
+    Fetch id, name and email of users for given ids as dicts, keeping the order of ids.
+    """
+    users = {
+        user['id']: user
+        for user in users_models.SocialNetworkingUser.objects.filter(id__in=user_ids).values('id', 'name', 'email')
+    }
+    return [users[user_id] for user_id in user_ids if user_id in users]
@@ -1,13 +1,20 @@
-import datetime
 import re
 
-from django.contrib.auth.hashers import check_password
-from django.db.models import Q
-
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
-from social_networking.apps.users import models as users_models
-from social_networking.apps.commons import constants as commons_constants
+from social_networking.apps.users import (
+    friendships as users_friendships,
+    models as users_models,
+)
+from social_networking.apps.commons import (
+    constants as commons_constants,
+    hashing as commons_hashing,
+    profiling as commons_profiling,
+    serializers as commons_serializers,
+    utils as commons_utils,
+)
 
 
 class BaseUserSerializer(serializers.ModelSerializer):
@@ -44,12 +51,18 @@ class UserTokenSerializer(UserSerializer):
     """
     Serializer for returning token along with user data
     """
-    token = serializers.CharField(source='get_token')
+    token = serializers.SerializerMethodField()
 
     class Meta(UserSerializer.Meta):
         # check this
         fields = '__all__'
 
+    def get_token(self, user):
+        config = commons_utils.get_config('SIGNED_ACCESS_TOKEN', commons_constants.SIGNED_ACCESS_TOKEN_DEFAULTS)
+        if config['ENABLED']:
+            return user.get_access_token
+        return user.get_token
+
 
 class LoginSerializer(serializers.Serializer):
 
@@ -60,27 +73,73 @@ class LoginSerializer(serializers.Serializer):
         """
         Authenticate user
         """
+        user = self.get_user(data)
+        return self.authenticated(data, user, commons_hashing.check_password(data['password'], user.password))
+
+    async def avalidate(self, data):
+        """
+        validate() for async views, the user is read in a thread and the password checked without holding one.
+        """
+        user = await commons_utils.run_in_thread(self.get_user, data)
+        return self.authenticated(data, user, await commons_hashing.acheck_password(data['password'], user.password))
+
+    @staticmethod
+    def get_user(data):
         try:
-            user = users_models.SocialNetworkingUser.objects.get(
+            return users_models.SocialNetworkingUser.objects.get(
                 email__iexact=data.get('email', '')
             )
         except users_models.SocialNetworkingUser.DoesNotExist:
             raise serializers.ValidationError(
                 {'error': 'Invalid Credentials'}
             )
-        if check_password(data['password'], user.password):
+
+    @staticmethod
+    def authenticated(data, user, password_matches):
+        if password_matches:
             data['user'] = user
             return data
         else:
+            commons_profiling.discard('hashing')
             raise serializers.ValidationError(
                 {'error': 'Invalid Credentials'}
             )
 
 
+class MutualFriendsCountSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=commons_constants.MUTUAL_FRIENDS_BATCH_LIMIT
+    )
+
+
 class AcceptRejectFriendRequestSerializer(serializers.Serializer):
     action = serializers.ChoiceField(choices=['accept', 'reject'])
 
 
+class BulkFriendRequestSerializer(serializers.Serializer):
+    receivers = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=commons_constants.BULK_FRIEND_REQUEST_LIMIT
+    )
+
+
+class BulkAcceptRejectFriendRequestSerializer(AcceptRejectFriendRequestSerializer):
+    """
+    Either list request_ids or pass all=true to answer every pending request.
+    """
+    request_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, allow_empty=False,
+        max_length=commons_constants.BULK_FRIEND_REQUEST_LIMIT
+    )
+    all = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if attrs['all'] == ('request_ids' in attrs):
+            raise serializers.ValidationError('Pass either request_ids or all')
+        return attrs
+
+
 class PendingFriendshipRequestSerializer(serializers.ModelSerializer):
     sender_data = BaseUserSerializer(read_only=True, source='sender')
 
@@ -90,12 +149,79 @@ class PendingFriendshipRequestSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['status'] = dict(users_models.FriendshipRequest.REQUEST_STATUS_CHOICES).get(instance.status, 'Unknown')
+        representation['status'] = users_models.FriendshipRequest.STATUS_LABELS.get(instance.status, 'Unknown')
         return representation
 
 
+def status_label(status):
+    return users_models.FriendshipRequest.STATUS_LABELS.get(status, 'Unknown')
+
+
+class UserValuesSerializer(commons_serializers.ValuesSerializer):
+    """
+    Output of BaseUserSerializer, for list endpoints.
+    """
+    fields = (('id', 'id'), ('name', 'name'), ('email', 'email'))
+
+
+class FriendValuesSerializer(commons_serializers.ValuesSerializer):
+    """
+    Friend rows as friend users, output of BaseUserSerializer.
+    """
+    fields = (('id', 'friend_id'), ('name', 'friend__name'), ('email', 'friend__email'))
+
+
+class PendingFriendshipRequestValuesSerializer(commons_serializers.ValuesSerializer):
+    """
+    Output of PendingFriendshipRequestSerializer, sender read with a join.
+    """
+    fields = (
+        ('id', 'id'),
+        ('status', 'status', status_label),
+        ('created_at', 'created_at', commons_serializers.DateTimeConverter()),
+        ('sender_data.id', 'sender_id'),
+        ('sender_data.name', 'sender__name'),
+        ('sender_data.email', 'sender__email'),
+    )
+
+
+class FriendExportValuesSerializer(commons_serializers.ValuesSerializer):
+    """
+    Friend rows as friend users with the time they became friends, for exports.
+    """
+    fields = (
+        ('id', 'friend_id'),
+        ('name', 'friend__name'),
+        ('email', 'friend__email'),
+        ('since', 'created_at', commons_serializers.DateTimeConverter()),
+    )
+
+
+class FriendshipRequestExportValuesSerializer(commons_serializers.ValuesSerializer):
+    """
+    Friend requests sent or received, in any status, for exports. Users are read with joins.
+    """
+    fields = (
+        ('id', 'id'),
+        ('status', 'status', status_label),
+        ('created_at', 'created_at', commons_serializers.DateTimeConverter()),
+        ('updated_at', 'updated_at', commons_serializers.DateTimeConverter()),
+        ('sender_data.id', 'sender_id'),
+        ('sender_data.name', 'sender__name'),
+        ('sender_data.email', 'sender__email'),
+        ('receiver_data.id', 'receiver_id'),
+        ('receiver_data.name', 'receiver__name'),
+        ('receiver_data.email', 'receiver__email'),
+    )
+
+
 class FriendshipRequestSerializer(PendingFriendshipRequestSerializer):
-    receiver = serializers.PrimaryKeyRelatedField(queryset=users_models.SocialNetworkingUser.objects.all())
+    """
+    Send a friend request from the logged in user (pass the request in context), validated with one query.
+    """
+    sender = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    # an id rather than a PrimaryKeyRelatedField, the receiver is loaded by the relationship query.
+    receiver = serializers.IntegerField(min_value=1, source='receiver_id', write_only=True)
     receiver_data = BaseUserSerializer(read_only=True, source='receiver')
 
     class Meta:
@@ -104,26 +230,32 @@ class FriendshipRequestSerializer(PendingFriendshipRequestSerializer):
         extra_kwargs = {
             'status': {'read_only': True},
             'created_at': {'read_only': True},
-            'sender': {'write_only': True},
-            'receiver': {'write_only': True},
         }
 
     def validate(self, attrs):
-        sender = attrs.get('sender')
-        if users_models.FriendshipRequest.objects.filter(
-            sender=sender, created_at__gte=datetime.datetime.now() - datetime.timedelta(minutes=1)
-        ).count() > 3:
+        # requests per minute limit is enforced by throttle of SendFriendRequestAPIView.
+        sender_id = attrs['sender'].id
+        receiver_id = attrs['receiver_id']
+        if sender_id == receiver_id:
+            raise serializers.ValidationError(users_friendships.SELF_REQUEST_ERROR)
+        relationships = users_friendships.resolve_relationships(sender_id, [receiver_id])
+        if receiver_id not in relationships:
+            raise serializers.ValidationError({'receiver': [f'Invalid pk "{receiver_id}" - object does not exist.']})
+        if relationships[receiver_id].pending_sent:
+            raise serializers.ValidationError(users_friendships.PENDING_REQUEST_ERROR)
+        if relationships[receiver_id].friends:
+            raise serializers.ValidationError(users_friendships.ALREADY_FRIENDS_ERROR)
+        attrs['receiver'] = relationships[receiver_id].user
+        return attrs
+
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return users_models.FriendshipRequest.objects.create(
+                    sender=validated_data['sender'], receiver=validated_data['receiver']
+                )
+        except IntegrityError:
+            # the same request sent concurrently, see unique_pending_friend_request.
             raise serializers.ValidationError(
-                'You have reached maximum friendship requests per minute limit. '
-                'Please wait for a minute to send more requests!!'
+                {api_settings.NON_FIELD_ERRORS_KEY: [users_friendships.PENDING_REQUEST_ERROR]}
             )
-        receiver = attrs.get('receiver')
-        if sender == receiver:
-            raise serializers.ValidationError('You cannot send friend request to yourself!!')
-        if users_models.FriendshipRequest.objects.filter(
-            sender=sender, receiver=receiver, status=users_models.FriendshipRequest.PENDING
-        ):
-            raise serializers.ValidationError('One request is already pending with same receiver!!')
-        if users_models.Friend.objects.filter(Q(user=sender, friend=receiver) | Q(user=receiver, friend=sender)).exists():
-            raise serializers.ValidationError('You both are already friends!!')
-        return attrs
@@ -0,0 +1,9 @@
+from django.dispatch import Signal
+
+# sent after commit once users became friends (or stopped being friends), with `pairs` of (user_id, friend_id).
+friendships_created = Signal()
+friendships_removed = Signal()
+# sent after commit for friend requests created in bulk (no post_save there), with `pairs` of (sender_id, receiver_id).
+friend_requests_created = Signal()
+# sent after commit for friend requests answered in bulk (no post_save there), with `pairs` of (sender_id, receiver_id).
+friend_requests_answered = Signal()
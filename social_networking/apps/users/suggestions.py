@@ -0,0 +1,120 @@
+import heapq
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from social_networking.apps.users import (
+    graph as users_graph,
+    models as users_models,
+)
+from social_networking.apps.commons import constants as commons_constants
+
+
+def compute_suggestions(graph, user_ids, limit=commons_constants.FRIEND_SUGGESTIONS_LIMIT):
+    """
+    Rank friends of friends of every given user by mutual friend count (latest users first on ties),
+    leaving out users who have a pending request with that user in either direction.
+    Pending requests and user details of the whole batch are fetched with one query each.
+    """
+    pending = defaultdict(set)
+    for sender_id, receiver_id in users_models.FriendshipRequest.objects.filter(
+        Q(sender_id__in=user_ids) | Q(receiver_id__in=user_ids), status=users_models.FriendshipRequest.PENDING
+    ).values_list('sender_id', 'receiver_id'):
+        pending[sender_id].add(receiver_id)
+        pending[receiver_id].add(sender_id)
+
+    ranked = {}
+    for user_id in user_ids:
+        candidates = graph.friends_of_friends(user_id)
+        for other_user_id in pending[user_id]:
+            candidates.pop(other_user_id, None)
+        ranked[user_id] = heapq.nsmallest(limit, candidates.items(), key=lambda item: (-item[1], -item[0]))
+
+    candidate_ids = {candidate_id for suggestions in ranked.values() for candidate_id, _ in suggestions}
+    users = {
+        user['id']: user for user in users_models.SocialNetworkingUser.objects.filter(
+            id__in=candidate_ids
+        ).values('id', 'name', 'email')
+    }
+    return {
+        user_id: [
+            {**users[candidate_id], 'mutual_friends': mutual_friends}
+            for candidate_id, mutual_friends in suggestions if candidate_id in users
+        ]
+        for user_id, suggestions in ranked.items()
+    }
+
+
+def refresh_suggestions(user_ids, graph=None):
+    """
+    Recompute and store suggestions of given users.
+    """
+    graph = graph or users_graph.get_friend_graph()
+    computed = compute_suggestions(graph, user_ids)
+    with transaction.atomic():
+        existing = {
+            suggestion.user_id: suggestion
+            for suggestion in users_models.FriendSuggestion.objects.select_for_update().filter(user_id__in=user_ids)
+        }
+        to_update = []
+        to_create = []
+        now = timezone.now()
+        for user_id, suggestions in computed.items():
+            suggestion = existing.get(user_id)
+            if suggestion is None:
+                to_create.append(users_models.FriendSuggestion(user_id=user_id, suggestions=suggestions))
+            else:
+                suggestion.suggestions = suggestions
+                suggestion.stale = False
+                # bulk_update doesn't apply auto_now
+                suggestion.updated_at = now
+                to_update.append(suggestion)
+        users_models.FriendSuggestion.objects.bulk_update(to_update, ['suggestions', 'stale', 'updated_at'])
+        users_models.FriendSuggestion.objects.bulk_create(to_create, ignore_conflicts=True)
+    return len(computed)
+
+
+def mark_stale(user_ids):
+    """
+    Flag suggestions of users for recomputation, creating rows for users who have none yet.
+    """
+    # users may be gone already when this follows a delete.
+    existing_user_ids = users_models.SocialNetworkingUser.objects.filter(id__in=user_ids).values_list('id', flat=True)
+    users_models.FriendSuggestion.objects.bulk_create(
+        [users_models.FriendSuggestion(user_id=user_id, stale=True) for user_id in existing_user_ids],
+        ignore_conflicts=True
+    )
+    users_models.FriendSuggestion.objects.filter(user_id__in=user_ids, stale=False).update(stale=True)
+
+
+def mark_friendships_changed(pairs):
+    """
+    Friends of friends change for both users of every pair and for every friend of theirs.
+    """
+    user_ids = {user_id for pair in pairs for user_id in pair}
+    affected = set(user_ids)
+    affected.update(users_models.Friend.objects.filter(user_id__in=user_ids).values_list('friend_id', flat=True))
+    mark_stale(affected)
+
+
+def discard_suggestions(pairs):
+    """
+    Drop the two users of every pair from stored suggestions of each other,
+    used as soon as one of them sends a friend request to the other.
+    """
+    discarded = defaultdict(set)
+    for user_id, other_user_id in pairs:
+        discarded[user_id].add(other_user_id)
+        discarded[other_user_id].add(user_id)
+    with transaction.atomic():
+        changed = []
+        now = timezone.now()
+        for suggestion in users_models.FriendSuggestion.objects.select_for_update().filter(user_id__in=discarded):
+            suggestions = [item for item in suggestion.suggestions if item['id'] not in discarded[suggestion.user_id]]
+            if len(suggestions) != len(suggestion.suggestions):
+                suggestion.suggestions = suggestions
+                suggestion.updated_at = now
+                changed.append(suggestion)
+        users_models.FriendSuggestion.objects.bulk_update(changed, ['suggestions', 'updated_at'])
@@ -1,3 +1,588 @@
-from django.test import TestCase
+import threading
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+
+from social_networking.apps.users import (
+    friendships as users_friendships,
+    graph as users_graph,
+    models as users_models,
+)
+from social_networking.apps.commons import (
+    authentication as commons_authentication,
+    cache as commons_cache,
+    ratelimit as commons_ratelimit,
+    signing as commons_signing,
+    testing as commons_testing,
+)
+
+PENDING = users_models.FriendshipRequest.PENDING
+REJECTED = users_models.FriendshipRequest.REJECTED
+
+
+def reset_process_state():
+    """
+    Caches and rate limits live in the process, so they outlive the rows of a test.
+    """
+    commons_ratelimit.reset_rate_limiter()
+    commons_authentication.token_cache.clear()
+    commons_authentication.revocation_list.clear()
+    commons_cache.response_cache.configure()
+    commons_cache.search_cache.configure()
+    users_graph.friend_graph.clear()
+
+
+@override_settings(QUERY_INSTRUMENTATION={'STRICT': True})
+class APITestCase(commons_testing.QueryBudgetTestMixin, TransactionTestCase):
+    """
+    Requests run like in production: transactions commit, so after commit receivers run within the request
+    and count against the query budget of its view, which STRICT makes a hard limit.
+    """
+
+    def setUp(self):
+        reset_process_state()
+
+    @staticmethod
+    def create_users(count, name='User'):
+        return [
+            users_models.SocialNetworkingUser.objects.create(
+                email=f'{name.lower()}{index}@example.com', name=f'{name} {index}', password='Secret123'
+            )
+            for index in range(count)
+        ]
+
+    @staticmethod
+    def client_for(user, key=None):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {key or user.get_token}')
+        return client
+
+    def send(self, client, receiver, expected_status=201):
+        response = client.post(reverse('send-friend-request'), {'receiver': receiver.id}, format='json')
+        self.assertEqual(response.status_code, expected_status, response.content)
+        self.assertQueryBudget(response)
+        return response
+
+    def answer(self, client, request_id, action='accept', expected_status=204):
+        response = client.patch(
+            reverse('accept-reject-friend-request', args=[request_id]), {'action': action}, format='json'
+        )
+        self.assertEqual(response.status_code, expected_status, response.content)
+        self.assertQueryBudget(response)
+        return response
+
+    def bulk_answer(self, client, data):
+        response = client.patch(reverse('bulk-accept-reject-friend-request'), data, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertQueryBudget(response)
+        return response.json()['results']
+
+    def assertFriends(self, user, friends):
+        self.assertEqual(
+            sorted(users_models.Friend.objects.filter(user=user).values_list('friend_id', flat=True)),
+            sorted(friend.id for friend in friends),
+        )
+
+
+class AnswerFriendRequestTests(APITestCase):
+
+    def test_double_tapped_accept_makes_one_friendship(self):
+        sender, receiver = self.create_users(2)
+        self.send(self.client_for(sender), receiver)
+        request_id = users_models.FriendshipRequest.objects.get().id
+        client = self.client_for(receiver)
+
+        self.answer(client, request_id)
+        response = self.answer(client, request_id, expected_status=404)
+
+        self.assertEqual(response.json(), {'Error': users_friendships.NO_SUCH_REQUEST_ERROR})
+        self.assertFriends(sender, [receiver])
+        self.assertFriends(receiver, [sender])
+
+    def test_users_accepting_each_others_requests(self):
+        first, second = self.create_users(2)
+        first_client, second_client = self.client_for(first), self.client_for(second)
+        first_request = self.send(first_client, second).json()['id']
+        second_request = self.send(second_client, first).json()['id']
+
+        self.answer(second_client, first_request)
+        # accepting one accepted both, the other one is gone.
+        self.answer(first_client, second_request, expected_status=404)
+
+        self.assertFalse(users_models.FriendshipRequest.objects.filter(
+            status=users_models.FriendshipRequest.PENDING
+        ).exists())
+        self.assertFriends(first, [second])
+        self.assertFriends(second, [first])
+
+
+    def test_concurrent_accepts_make_one_friendship(self):
+        sender, receiver = self.create_users(2)
+        request_id = users_models.FriendshipRequest.objects.create(sender=sender, receiver=receiver).id
+        barrier = threading.Barrier(2)
+        results = []
+
+        def accept():
+            try:
+                barrier.wait()
+                results.append(users_friendships.respond_to_friend_request(receiver.id, request_id, 'accept'))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=accept) for _ in range(2)]
+        # SQLite writers queue up for the database lock like MySQL's row locks, see commons.db.backends.sqlite3.
+        options = {'transaction_mode': 'IMMEDIATE'} if connection.vendor == 'sqlite' else {}
+        with mock.patch.dict(connection.settings_dict['OPTIONS'], options):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertCountEqual(results, [users_friendships.ACCEPTED, None])
+        self.assertFriends(sender, [receiver])
+        self.assertFriends(receiver, [sender])
+
+
+class SendFriendRequestTests(APITestCase):
+
+    def test_send_racing_a_concurrent_send(self):
+        sender, receiver = self.create_users(2)
+        resolve_relationships = users_friendships.resolve_relationships
+
+        def resolve_then_send(user_id, other_ids):
+            relationships = resolve_relationships(user_id, other_ids)
+            # the same request created by another call after this one checked.
+            users_models.FriendshipRequest.objects.create(sender=sender, receiver=receiver)
+            return relationships
+
+        with mock.patch.object(users_friendships, 'resolve_relationships', resolve_then_send):
+            response = self.send(self.client_for(sender), receiver, expected_status=400)
+
+        self.assertEqual(response.json(), {'non_field_errors': [users_friendships.PENDING_REQUEST_ERROR]})
+        self.assertEqual(users_models.FriendshipRequest.objects.count(), 1)
+
+    def test_bulk_send_racing_a_concurrent_send(self):
+        sender, *receivers = self.create_users(3)
+        resolve_relationships = users_friendships.resolve_relationships
+
+        def resolve_then_send(user_id, other_ids):
+            relationships = resolve_relationships(user_id, other_ids)
+            users_models.FriendshipRequest.objects.create(sender=sender, receiver=receivers[0])
+            return relationships
+
+        with mock.patch.object(users_friendships, 'resolve_relationships', resolve_then_send):
+            results = users_friendships.send_friend_requests(sender.id, [receiver.id for receiver in receivers])
+
+        # the request sent meanwhile isn't one this call created.
+        self.assertEqual([result['status'] for result in results], [users_friendships.ERROR, users_friendships.CREATED])
+        self.assertEqual(results[0]['error'], users_friendships.PENDING_REQUEST_ERROR)
+        self.assertEqual(
+            users_models.FriendshipRequest.objects.filter(sender=sender, receiver=receivers[0]).count(), 1
+        )
+
+    def test_duplicate_pending_request_is_rejected_by_database(self):
+        sender, receiver = self.create_users(2)
+        users_models.FriendshipRequest.objects.create(sender=sender, receiver=receiver)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            users_models.FriendshipRequest.objects.create(sender=sender, receiver=receiver)
+        # answered requests don't count, the pair can ask again.
+        users_models.FriendshipRequest.objects.filter(sender=sender).answer(users_models.FriendshipRequest.REJECTED)
+        users_models.FriendshipRequest.objects.create(sender=sender, receiver=receiver)
+
+
+class MigrationTestCase(TransactionTestCase):
+    """
+    Migrates the users app back to `migrate_from`, lets the test write rows with the models of then
+    and migrates forward to `migrate_to`. The test database is migrated to the latest state afterwards.
+    """
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.latest = executor.loader.graph.leaf_nodes()
+        executor.migrate([('users', self.migrate_from)])
+        executor.loader.build_graph()
+        self.apps = executor.loader.project_state([('users', self.migrate_from)]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.latest)
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('users', self.migrate_to)])
+        executor.loader.build_graph()
+        return executor.loader.project_state([('users', self.migrate_to)]).apps
+
+    def create_users(self, count):
+        User = self.apps.get_model('users', 'SocialNetworkingUser')
+        return [
+            User.objects.create(email=f'user{index}@example.com', name=f'User {index}', password='!')
+            for index in range(count)
+        ]
+
+
+class UniquePendingFriendRequestMigrationTests(MigrationTestCase):
+    migrate_from = '0005_friend_suggestion'
+    migrate_to = '0006_unique_pending_friend_request'
+
+    def test_duplicate_pending_requests_are_dropped(self):
+        sender, receiver, other = self.create_users(3)
+        FriendshipRequest = self.apps.get_model('users', 'FriendshipRequest')
+        kept = FriendshipRequest.objects.create(sender_id=sender.id, receiver_id=receiver.id, status=PENDING)
+        FriendshipRequest.objects.create(sender_id=sender.id, receiver_id=receiver.id, status=PENDING)
+        rejected = [
+            FriendshipRequest.objects.create(sender_id=other.id, receiver_id=receiver.id, status=REJECTED).id
+            for _ in range(2)
+        ]
+
+        apps = self.migrate()
+
+        FriendshipRequest = apps.get_model('users', 'FriendshipRequest')
+        self.assertEqual(
+            list(FriendshipRequest.objects.filter(status=PENDING).values_list('id', 'pending')), [(kept.id, True)]
+        )
+        self.assertEqual(
+            sorted(FriendshipRequest.objects.filter(status=REJECTED).values_list('id', 'pending')),
+            [(request_id, None) for request_id in rejected],
+        )
+
+
+class FriendRequestRateLimitTests(APITestCase):
+
+    def test_only_created_requests_count_against_rate_limit(self):
+        sender, *receivers = self.create_users(5)
+        client = self.client_for(sender)
+        self.send(client, receivers[0])
+        # refunded: already pending, no such user.
+        self.send(client, receivers[0], expected_status=400)
+        response = client.post(reverse('send-friend-request'), {'receiver': 10 ** 9}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.send(client, receivers[1])
+        self.send(client, receivers[2])
+        # three created within a minute, friend_request rate is 3/min.
+        self.send(client, receivers[3], expected_status=429)
+
+
+class BulkFriendRequestTests(APITestCase):
+
+    def test_bulk_accept_skips_requests_answered_meanwhile(self):
+        receiver, *senders = self.create_users(4)
+        for sender in senders:
+            self.send(self.client_for(sender), receiver)
+        request_ids = list(users_models.FriendshipRequest.objects.order_by('id').values_list('id', flat=True))
+        client = self.client_for(receiver)
+        self.assertEqual(len(client.get(reverse('list-pending-friend-requests')).json()['results']), 3)
+        self.answer(client, request_ids[0], action='reject')
+
+        results = self.bulk_answer(client, {'action': 'accept', 'request_ids': request_ids + [request_ids[1]]})
+
+        self.assertEqual([result['status'] for result in results], [
+            users_friendships.ERROR, users_friendships.ACCEPTED, users_friendships.ACCEPTED, users_friendships.ERROR,
+        ])
+        self.assertEqual(results[0]['error'], users_friendships.NO_SUCH_REQUEST_ERROR)
+        self.assertEqual(results[3]['error'], users_friendships.DUPLICATE_ITEM_ERROR)
+        self.assertFriends(receiver, senders[1:])
+        self.assertEqual(self.bulk_answer(client, {'action': 'accept', 'all': True}), [])
+
+    def bulk_send(self, client, receivers, expected_status=200):
+        response = client.post(
+            reverse('bulk-send-friend-request'), {'receivers': [receiver.id for receiver in receivers]}, format='json'
+        )
+        self.assertEqual(response.status_code, expected_status, response.content)
+        self.assertQueryBudget(response)
+        return response
+
+    @mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, {'friend_request_bulk': '6/min'})
+    def test_bulk_sends_are_charged_for_created_requests(self):
+        sender, *receivers = self.create_users(9)
+        client = self.client_for(sender)
+        self.send(client, receivers[0])
+
+        # more receivers than the friend_request rate allows, the one already pending is refunded.
+        results = self.bulk_send(client, receivers[:6]).json()['results']
+        self.assertEqual(
+            [result['status'] for result in results], [users_friendships.ERROR] + [users_friendships.CREATED] * 5
+        )
+        self.bulk_send(client, receivers[6:7])
+        self.bulk_send(client, receivers[7:8], expected_status=429)
+        # bulk sends have a limit of their own.
+        self.send(client, receivers[7])
+
+
+@override_settings(SIGNED_ACCESS_TOKEN={'ENABLED': True, 'REVOCATION_REFRESH_INTERVAL': 0})
+class TokenRevocationTests(APITestCase):
+
+    def get_friends(self, client, expected_status=200):
+        response = client.get(reverse('list-friends'))
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response
+
+    def test_token_deleted_by_another_worker(self):
+        user = self.create_users(1)[0]
+        client = self.client_for(user)
+        self.get_friends(client)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {users_models.Token._meta.db_table} WHERE user_id = %s', [user.id])
+        # cached, and no revocation says otherwise.
+        self.get_friends(client)
+
+        # what logout and token rotation in another worker store next to deleting the token.
+        users_models.AccessTokenRevocation.objects.bulk_create([
+            users_models.AccessTokenRevocation(user_id=user.id, revoked_before=commons_signing.now_ms())
+        ])
+        self.get_friends(client, expected_status=401)
+
+    def test_new_token_revokes_old_one(self):
+        user = self.create_users(1)[0]
+        old_client = self.client_for(user)
+        self.get_friends(old_client)
+
+        new_client = self.client_for(users_models.SocialNetworkingUser.objects.get(id=user.id))
+
+        self.get_friends(old_client, expected_status=401)
+        self.get_friends(new_client)
+
+
+@override_settings(SIGNED_ACCESS_TOKEN={'ENABLED': True, 'REVOCATION_REFRESH_INTERVAL': 0})
+class SignedAccessTokenTests(APITestCase):
+
+    def get_friends(self, client, expected_status=200):
+        response = client.get(reverse('list-friends'))
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response
+
+    def test_logout_revokes_signed_tokens(self):
+        user = self.create_users(1)[0]
+        client = self.client_for(user, user.get_access_token)
+        self.get_friends(client)
+
+        response = client.post(reverse('logout'))
+        self.assertEqual(response.status_code, 204)
+        self.assertQueryBudget(response)
+
+        self.get_friends(client, expected_status=401)
+
+    def test_signed_token_user_is_loaded_once(self):
+        user, receiver = self.create_users(2)
+        client = self.client_for(user, user.get_access_token)
+        self.get_friends(client)
+
+        response = self.send(client, receiver)
+
+        self.assertEqual(response.json()['sender_data'], {'id': user.id, 'name': user.name, 'email': user.email})
+        # the user was loaded with the token, only the receiver is.
+        user_id_lookup = f'"{users_models.SocialNetworkingUser._meta.db_table}"."id" = '
+        self.assertFalse(any(
+            user_id_lookup in sql.replace('`', '"') for sql, _ in response.wsgi_request.query_recorder.queries
+        ))
+
+        user.name = 'Renamed'
+        user.save()
+        response = self.send(client, self.create_users(1, name='Other')[0])
+        self.assertEqual(response.json()['sender_data']['name'], 'Renamed')
+
+    def test_login_returns_working_signed_token(self):
+        user = self.create_users(1)[0]
+        response = APIClient().post(reverse('login'), {'email': user.email, 'password': 'Secret123'}, format='json')
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertQueryBudget(response)
+        self.assertTrue(commons_signing.is_access_token(response.json()['token']))
+        self.get_friends(self.client_for(user, response.json()['token']))
+
+
+class SearchCacheTests(APITestCase):
+
+    def assertNotSearched(self, response):
+        # served from cache, the search index isn't read.
+        token_table = users_models.UserSearchToken._meta.db_table
+        self.assertFalse(any(token_table in sql for sql, _ in response.wsgi_request.query_recorder.queries))
+
+    def search(self, client, keyword):
+        response = client.get(reverse('user-search'), {'q': keyword})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertQueryBudget(response)
+        return response
+
+    def test_cached_pages_follow_user_changes(self):
+        users = self.create_users(3, name='Sumit')
+        searcher = self.create_users(1, name='Other')[0]
+        client = self.client_for(searcher)
+        self.assertEqual(self.search(client, 'sumit').json()['count'], 3)
+        self.assertNotSearched(self.search(client, 'SUMIT '))
+
+        users[0].name = 'Renamed'
+        users[0].save()
+        self.assertEqual(self.search(client, 'sumit').json()['count'], 2)
+
+        self.create_users(1, name='Sumit New')
+        self.assertEqual(self.search(client, 'sumit').json()['count'], 3)
+
+        users[1].delete()
+        self.assertEqual(self.search(client, 'sumit').json()['count'], 2)
+
+    def test_searching_user_is_left_out_of_cached_pages(self):
+        users = self.create_users(3, name='Sumit')
+        other = self.create_users(1, name='Other')[0]
+        self.assertEqual(self.search(self.client_for(other), 'sumit').json()['count'], 3)
+
+        results = self.search(self.client_for(users[0]), 'sumit').json()['results']
+        self.assertEqual(sorted(user['id'] for user in results), sorted(user.id for user in users[1:]))
+        # and others don't get their page.
+        self.assertEqual(self.search(self.client_for(other), 'sumit').json()['count'], 3)
+
+
+class SymmetricFriendMigrationTests(MigrationTestCase):
+    migrate_from = '0003_access_token_revocation'
+    migrate_to = '0004_symmetric_friend'
+
+    def test_friendships_are_mirrored_and_deduplicated(self):
+        first, second, third = self.create_users(3)
+        Friend = self.apps.get_model('users', 'Friend')
+        for user, friend in ((first, second), (first, second), (second, first), (second, third)):
+            Friend.objects.create(user_id=user.id, friend_id=friend.id)
+
+        apps = self.migrate()
+
+        Friend = apps.get_model('users', 'Friend')
+        self.assertEqual(sorted(Friend.objects.values_list('user_id', 'friend_id')), sorted([
+            (first.id, second.id), (second.id, first.id), (second.id, third.id), (third.id, second.id),
+        ]))
+        # batches are idempotent, an interrupted run is resumed by running it again.
+        import_module('social_networking.apps.users.migrations.0004_symmetric_friend').mirror_friendships(apps, None)
+        self.assertEqual(Friend.objects.count(), 4)
+
+    def test_friendships_of_many_batches(self):
+        users = self.create_users(50)
+        pairs = [(user.id, friend.id) for index, user in enumerate(users) for friend in users[index + 1:]]
+        Friend = self.apps.get_model('users', 'Friend')
+        # more rows than a batch, with duplicates and mirrors on both sides of the batch boundary.
+        Friend.objects.bulk_create(
+            [Friend(user_id=user_id, friend_id=friend_id) for user_id, friend_id in pairs]
+            + [Friend(user_id=friend_id, friend_id=user_id) for user_id, friend_id in pairs[::7]]
+            + [Friend(user_id=user_id, friend_id=friend_id) for user_id, friend_id in pairs[::11]]
+        )
+
+        apps = self.migrate()
+
+        Friend = apps.get_model('users', 'Friend')
+        self.assertEqual(
+            sorted(Friend.objects.values_list('user_id', 'friend_id')),
+            sorted(pairs + [(friend_id, user_id) for user_id, friend_id in pairs]),
+        )
+
+
+@override_settings(
+    CACHES={'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'friend-graph'}},
+    FRIEND_GRAPH={'SHARED_CACHE_ALIAS': 'shared', 'SYNC_INTERVAL': 0},
+)
+class FriendGraphTests(APITestCase):
+
+    def test_friendships_reach_graphs_of_other_workers(self):
+        first, second = self.create_users(2)
+        worker, other_worker = users_graph.FriendGraphHolder(), users_graph.FriendGraphHolder()
+        self.assertEqual(other_worker.get().neighbors(first.id), [])
+
+        # signals of the accept reach this process's users_graph.friend_graph, stand in for the other worker.
+        worker.add_friendship(first.id, second.id)
+        self.assertEqual(other_worker.get().neighbors(first.id), [second.id])
+        self.assertEqual(other_worker.get().neighbors(second.id), [first.id])
+
+        worker.remove_friendship(first.id, second.id)
+        self.assertFalse(other_worker.get().are_friends(first.id, second.id))
+
+
+class ListCacheTests(APITestCase):
+
+    def get(self, client, name, **extra):
+        response = client.get(reverse(name), **extra)
+        self.assertIn(response.status_code, (200, 304), response.content)
+        self.assertQueryBudget(response)
+        return response
+
+    def test_friends_list_follows_friendship_and_name_changes(self):
+        user, friend, other = self.create_users(3)
+        client = self.client_for(user)
+        response = self.get(client, 'list-friends')
+        self.assertEqual(response.json()['results'], [])
+
+        self.assertEqual(self.get(client, 'list-friends', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        self.send(self.client_for(friend), user)
+        self.answer(client, users_models.FriendshipRequest.objects.get().id)
+        response = self.get(client, 'list-friends', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['name'] for item in response.json()['results']], [friend.name])
+
+        friend.name = 'Renamed'
+        friend.save()
+        response = self.get(client, 'list-friends', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['name'] for item in response.json()['results']], ['Renamed'])
+
+        # a change of somebody else's friends keeps the list.
+        self.send(self.client_for(other), friend)
+        self.assertEqual(self.get(client, 'list-friends', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_friends_list_cursor_pages(self):
+        user, *friends = self.create_users(13)
+        users_models.Friend.objects.create_friendships([(user.id, friend.id) for friend in friends])
+        client = self.client_for(user)
+
+        first_page = self.get(client, 'list-friends', data={'pagination': 'cursor'}).json()
+        response = client.get(first_page['next'])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertQueryBudget(response)
+        second_page = response.json()
+
+        self.assertEqual(len(first_page['results']), 10)
+        self.assertIsNone(second_page['next'])
+        self.assertEqual(
+            [item['id'] for item in first_page['results'] + second_page['results']],
+            [friend.id for friend in reversed(friends)],
+        )
+        self.assertEqual(list(second_page['results'][0]), ['id', 'name', 'email'])
+
+    def test_pending_list_follows_sends_and_answers(self):
+        user, sender = self.create_users(2)
+        client = self.client_for(user)
+        etag = self.get(client, 'list-pending-friend-requests')['ETag']
+
+        self.send(self.client_for(sender), user)
+        response = self.get(client, 'list-pending-friend-requests', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+
+        self.answer(client, users_models.FriendshipRequest.objects.get().id, action='reject')
+        response = self.get(client, 'list-pending-friend-requests', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+
+class QueryBudgetTests(APITestCase):
+
+    def test_bulk_accept_of_mutual_requests(self):
+        receiver, *senders = self.create_users(3)
+        receiver_client = self.client_for(receiver)
+        for sender in senders:
+            self.send(self.client_for(sender), receiver)
+        self.send(receiver_client, senders[0])
+        # the token lookup of a fresh worker counts too.
+        commons_authentication.token_cache.clear()
+
+        results = self.bulk_answer(receiver_client, {'action': 'accept', 'all': True})
+
+        self.assertEqual({result['status'] for result in results}, {users_friendships.ACCEPTED})
+        self.assertFalse(users_models.FriendshipRequest.objects.filter(
+            status=users_models.FriendshipRequest.PENDING
+        ).exists())
+        self.assertFriends(receiver, senders)
@@ -11,10 +11,18 @@ router = routers.SimpleRouter()
 
 urlpatterns = [
     url(r'^login/$', users_views.LoginView.as_view(), name='login'),
+    url(r'^logout/$', users_views.LogoutView.as_view(), name='logout'),
     url(r'user/$', users_views.UserRegisterView.as_view(), name='user'),
     url('search/$', users_views.UserSearchAPIView.as_view(), name='user-search'),
+    path('friend-request/bulk/send/', users_views.BulkSendFriendRequestAPIView.as_view(), name='bulk-send-friend-request'),
+    path('friend-request/bulk/', users_views.BulkAcceptRejectFriendRequestAPIView.as_view(), name='bulk-accept-reject-friend-request'),
     path('friend-request/<int:request_id>/', users_views.AcceptRejectFriendRequestAPIView.as_view(), name='accept-reject-friend-request'),
     url('friend-request/send/', users_views.SendFriendRequestAPIView.as_view(), name='send-friend-request'),
+    path('friends/mutual/<int:user_id>/', users_views.MutualFriendsAPIView.as_view(), name='mutual-friends'),
+    path('friends/mutual/', users_views.MutualFriendsCountAPIView.as_view(), name='mutual-friends-count'),
+    path('friends/export/', users_views.ExportFriendsAPIView.as_view(), name='export-friends'),
+    path('friend-request/export/', users_views.ExportFriendRequestsAPIView.as_view(), name='export-friend-requests'),
+    path('friends/suggestions/', users_views.FriendSuggestionsAPIView.as_view(), name='friend-suggestions'),
     url('friends/', users_views.ListFriendsAPIView.as_view(), name='list-friends'),
     url('pending-friend-requests/$', users_views.ListPendingFriendRequestsAPIView.as_view(), name='list-pending-friend-requests'),
     # url(r'', include(router.urls)),
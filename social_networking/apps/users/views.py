@@ -1,154 +1,424 @@
 
 from datetime import datetime
 
-from rest_framework import response, status, views
+from rest_framework import exceptions, response, status, views
 from rest_framework.views import APIView
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 
-from django.db.models import Q
+from django.http import StreamingHttpResponse
 
 from social_networking.apps.users import (
+    exporting as users_exporting,
+    friendships as users_friendships,
+    graph as users_graph,
     models as users_models,
+    search as users_search,
     serializers as users_serializers,
 )
+from social_networking.apps.commons import (
+    cache as commons_cache,
+    constants as commons_constants,
+    pagination as commons_pagination,
+    profiling as commons_profiling,
+    ratelimit as commons_ratelimit,
+    utils as commons_utils,
+)
+from social_networking.apps.commons.db import routing as db_routing
 
 
+@commons_profiling.profiled
 class UserRegisterView(views.APIView):
     """
     Save Data of user on sign up
     """
+    # user, search index and token writes.
+    query_budget = 8
 
     def post(self, request):
         serializer = users_serializers.UserSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        with commons_profiling.phase('validation'):
+            serializer.is_valid(raise_exception=True)
         user = serializer.save()
-        return response.Response(
-            users_serializers.UserTokenSerializer(user).data,
-            status=status.HTTP_201_CREATED
-        )
+        with commons_profiling.phase('serialization'):
+            data = users_serializers.UserTokenSerializer(user).data
+        # anonymous request, the middleware can't tell whose reads to keep on the primary.
+        db_routing.pin_to_primary(user.id)
+        return response.Response(data, status=status.HTTP_201_CREATED)
 
 
+@commons_profiling.profiled
 class LoginView(views.APIView):
     """
     Login API for user
     """
+    throttle_classes = [commons_ratelimit.SlidingWindowThrottle]
+    throttle_scope = 'login'
+    # user, token rotation and the revocation telling other workers' token caches about it.
+    query_budget = 9
 
     def post(self, request):
         """
         create token when user successfully authenticated
         """
         serializer = users_serializers.LoginSerializer()
-        data = serializer.validate(data=request.data)
-        user = data.get('user')
+        with commons_profiling.phase('validation'):
+            data = serializer.validate(data=request.data)
+        return self.login(data.get('user'))
+
+    async def apost(self, request):
+        """
+        post() of the async view (see commons.async_views), the password is checked through
+        commons.hashing.acheck_password, no thread waits on the hashing pool.
+        """
+        serializer = users_serializers.LoginSerializer()
+        with commons_profiling.phase('validation'):
+            data = await serializer.avalidate(data=request.data)
+        return await commons_utils.run_in_thread(self.login, data.get('user'))
+
+    def login(self, user):
         serializer = users_serializers.UserTokenSerializer(user)
-        data = serializer.data
+        with commons_profiling.phase('serialization'):
+            data = serializer.data
         # update last_login of user.
         user.last_login = datetime.now()
-        user.save()
+        user.save(update_fields=['last_login'])
+        # the new token is only on the primary yet.
+        db_routing.pin_to_primary(user.id)
         return response.Response(data, status.HTTP_202_ACCEPTED)
 
 
-class UserSearchAPIView(APIView):
+@commons_profiling.profiled
+class LogoutView(APIView):
+    """
+    Logout API for user, all tokens issued to the user stop working.
+    """
+    permission_classes = [IsAuthenticated]
+    query_budget = 5
+
+    def post(self, request):
+        request.user.revoke_access_tokens()
+        users_models.Token.objects.filter(user_id=request.user.id).delete()
+        return response.Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@commons_profiling.profiled
+class UserSearchAPIView(commons_pagination.PaginationMixin, APIView):
     """
     Api to allow users to search for users to generate friend requests etc
     We need to pass q named query param in the url to search for users with email or name
     For Ex: <domain>/accounts/search?q=sumit
+    Pass pagination=cursor to get keyset paginated results.
     """
     permission_classes = [IsAuthenticated]
+    throttle_classes = [commons_ratelimit.SlidingWindowThrottle]
+    throttle_scope = 'search'
+    # token lookup (until cached), count, matches and user rows, none for pages in the search cache.
+    query_budget = 4
+    read_replica = True
 
     def get(self, request):
         # Get query parameters for search
         search_keyword = request.query_params.get('q', '')
-        q_filter = ~Q(id=request.user.id)
-
-        # First try to match a user by exact email, if not found then get users whose name contains search param
-        users = users_models.SocialNetworkingUser.objects.filter(q_filter, email__iexact=search_keyword) | (
-            users_models.SocialNetworkingUser.objects.filter(q_filter, name__icontains=search_keyword).order_by('-id')
-        )
+        query = users_search.normalize_query(search_keyword)
+        # Exact email match comes first, then users having a name word starting with each word of search param.
+        paginator = self.get_paginator(request, keyset_ordering=('-email_match', '-user_id') if query[0] else None)
+
+        # pages are shared by every user the search doesn't find, one it finds is left out by the query.
+        excluded_id = None
+        if users_search.user_matches(search_keyword, request.user.name, request.user.email):
+            excluded_id = request.user.id
+        search_cache = commons_cache.search_cache
+        page_key = search_cache.page_key((query, excluded_id, self.pagination_key(request, paginator)))
+        page = search_cache.get(page_key)
+        if page is None:
+            page = self.search_page(request, search_keyword, paginator, excluded_id)
+            search_cache.set(page_key, page)
+        else:
+            self.restore_paginator(paginator, page['paginator'], request)
+        return paginator.get_paginated_response(page['results'])
+
+    def search_page(self, request, search_keyword, paginator, excluded_id=None):
+        matches = users_search.search_user_ids(search_keyword, exclude_user_id=excluded_id)
 
         # Pagination
-        paginator = PageNumberPagination()
-        paginated_users = paginator.paginate_queryset(users, request)
+        serializer = users_serializers.UserValuesSerializer()
+        if matches is None:
+            # empty search lists everyone
+            users = users_models.SocialNetworkingUser.objects.exclude(id=excluded_id).order_by('-id')
+            paginated_users = paginator.paginate_queryset(serializer.values(users), request)
+        else:
+            paginated_matches = paginator.paginate_queryset(matches, request)
+            paginated_users = users_search.user_rows_for_ids([match['user_id'] for match in paginated_matches])
 
-        # Serialize the queryset
-        serializer = users_serializers.BaseUserSerializer(paginated_users, many=True)
-
-        return paginator.get_paginated_response(serializer.data)
+        with commons_profiling.phase('serialization'):
+            results = serializer.to_representation(paginated_users)
+        return {'results': results, 'paginator': self.paginator_state(paginator)}
 
 
+@commons_profiling.profiled
 class SendFriendRequestAPIView(APIView):
+    """
+    Send a friend request, for Ex: {"receiver": 42}
+    Only created requests count against the friend_request rate limit, attempts which fail validation are refunded.
+    """
     permission_classes = [IsAuthenticated]
+    throttle_classes = [commons_ratelimit.SlidingWindowThrottle]
+    throttle_scope = 'friend_request'
+    # relationship query and insert, suggestion updates of after commit receivers included.
+    query_budget = 7
+
+    def throttled(self, request, wait):
+        raise exceptions.Throttled(wait, detail=(
+            'You have reached maximum friendship requests per minute limit. '
+            'Please wait for a minute to send more requests!!'
+        ))
 
     def post(self, request):
-        request.data['sender'] = request.user.id
-        serializer = users_serializers.FriendshipRequestSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save()
+        serializer = users_serializers.FriendshipRequestSerializer(data=request.data, context={'request': request})
+        with commons_profiling.phase('validation'):
+            is_valid = serializer.is_valid()
+        if is_valid:
+            try:
+                serializer.save()
+            except exceptions.ValidationError:
+                # the same request sent concurrently, counted once by the call which created it.
+                commons_ratelimit.refund(request)
+                raise
             # we can just send status code in response,
             # i am sending the data just to have clarity while evaluating through postman
-            return response.Response(serializer.data, status=status.HTTP_201_CREATED)
+            with commons_profiling.phase('serialization'):
+                data = serializer.data
+            return response.Response(data, status=status.HTTP_201_CREATED)
+        # only created requests count against the limit, so a few invalid receivers don't lock a user out.
+        commons_ratelimit.refund(request)
         return response.Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@commons_profiling.profiled
 class AcceptRejectFriendRequestAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    # token lookup (until cached), select, answer and mutual request updates, friendship insert and
+    # suggestion updates of after commit receivers.
+    query_budget = 9
 
     def patch(self, request, request_id):
         serializer = users_serializers.AcceptRejectFriendRequestSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        with commons_profiling.phase('validation'):
+            serializer.is_valid(raise_exception=True)
 
-        # Filter only those friend requests whose receiver is logged in user and status is pending.
-        friendship_request = users_models.FriendshipRequest.objects.filter(
-            pk=request_id, receiver=request.user, status=users_models.FriendshipRequest.PENDING
+        # Only pending friend requests whose receiver is logged in user can be answered, once.
+        answered = users_friendships.respond_to_friend_request(
+            request.user.id, request_id, serializer.validated_data['action']
         )
-        if not friendship_request:
+        if answered is None:
             return response.Response(
-                data={'Error': 'No such pending friend request for this user'}, status=status.HTTP_404_NOT_FOUND
+                data={'Error': users_friendships.NO_SUCH_REQUEST_ERROR}, status=status.HTTP_404_NOT_FOUND
             )
-        friendship_request = friendship_request.first()
-        action = serializer.data['action']
-        if action == 'accept':
-            friendship_request.status = users_models.FriendshipRequest.ACCEPTED
-            friendship_request.save()
-            # Create Friend object if user is accepting the request.
-            friend = users_models.Friend(user=friendship_request.sender, friend=request.user)
-            friend.save()
-        elif action == 'reject':
-            friendship_request.status = users_models.FriendshipRequest.REJECTED
-            friendship_request.save()
         return response.Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class ListFriendsAPIView(APIView):
+@commons_profiling.profiled
+class BulkSendFriendRequestAPIView(APIView):
+    """
+    Send friend requests to many users in one call, for Ex: {"receivers": [4, 8, 15]}
+    Every receiver counts against the friend_request_bulk rate limit, hits of receivers no request was
+    created for are refunded.
+    """
     permission_classes = [IsAuthenticated]
+    throttle_classes = [commons_ratelimit.SlidingWindowThrottle]
+    throttle_scope = 'friend_request_bulk'
+    # token lookup (until cached), relationship query, pending request ids before and after the insert, insert and
+    # suggestion updates of after commit receivers.
+    query_budget = 8
 
-    def get(self, request):
-        friends = users_models.Friend.objects.filter(Q(user=request.user)|Q(friend=request.user)).order_by('-id')
+    def get_throttle_cost(self, request):
+        receivers = request.data.get('receivers') if isinstance(request.data, dict) else None
+        return len(receivers) if isinstance(receivers, list) and receivers else 1
 
-        # Pagination
-        paginator = PageNumberPagination()
-        paginated_requests = paginator.paginate_queryset(friends, request)
+    def post(self, request):
+        serializer = users_serializers.BulkFriendRequestSerializer(data=request.data)
+        with commons_profiling.phase('validation'):
+            is_valid = serializer.is_valid()
+        if not is_valid:
+            commons_ratelimit.refund(request)
+            return response.Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        results = users_friendships.send_friend_requests(request.user.id, serializer.validated_data['receivers'])
+        commons_ratelimit.refund(
+            request, sum(1 for result in results if result['status'] != users_friendships.CREATED)
+        )
+        return response.Response({'results': results}, status=status.HTTP_200_OK)
+
+
+@commons_profiling.profiled
+class BulkAcceptRejectFriendRequestAPIView(APIView):
+    """
+    Accept or reject many pending friend requests in one call,
+    for Ex: {"action": "accept", "request_ids": [16, 23, 42]} or {"action": "accept", "all": true}
+    """
+    permission_classes = [IsAuthenticated]
+    # token lookup (until cached), select, answer and mutual request updates, friendships insert and
+    # suggestion updates of after commit receivers.
+    query_budget = 9
+
+    def patch(self, request):
+        serializer = users_serializers.BulkAcceptRejectFriendRequestSerializer(data=request.data)
+        with commons_profiling.phase('validation'):
+            serializer.is_valid(raise_exception=True)
+        results = users_friendships.respond_to_friend_requests(
+            request.user.id, serializer.validated_data['action'], serializer.validated_data.get('request_ids')
+        )
+        return response.Response({'results': results}, status=status.HTTP_200_OK)
+
+
+@commons_profiling.profiled
+class ListFriendsAPIView(commons_pagination.PaginationMixin, APIView):
+    permission_classes = [IsAuthenticated]
+    # token lookup (until cached), count and page, friend users come with a join. Repeated polls hit the list cache.
+    query_budget = 3
+    read_replica = True
+
+    @commons_cache.versioned_response
+    def get(self, request):
+        # Friendships are stored in both directions, so rows having logged in user as Friend.user give all friends.
+        friends = users_models.Friend.objects.filter(user=request.user).order_by('-id')
+        serializer = users_serializers.FriendValuesSerializer()
 
-        # In Friend model, logged in user can be Friend.user and Friend.friend for different Friend objects.
-        # So, filter only those users who don't match with logger in user and return.
-        friend_users = [friend.friend if friend.user_id == request.user.id else friend.user for friend in paginated_requests]
+        # Pagination, rows carry friend user fields through a join and Friend.id (not output) for keyset pagination.
+        paginator = self.get_paginator(request)
+        paginated_friends = paginator.paginate_queryset(serializer.values(friends, 'id'), request)
 
-        serializer = users_serializers.BaseUserSerializer(friend_users, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        with commons_profiling.phase('serialization'):
+            results = serializer.to_representation(paginated_friends)
+        return paginator.get_paginated_response(results)
 
 
-class ListPendingFriendRequestsAPIView(APIView):
+@commons_profiling.profiled
+class ListPendingFriendRequestsAPIView(commons_pagination.PaginationMixin, APIView):
     permission_classes = [IsAuthenticated]
+    # token lookup (until cached), count and page, senders come with a join. Repeated polls hit the list cache.
+    query_budget = 3
+    read_replica = True
 
+    @commons_cache.versioned_response
     def get(self, request):
         pending_requests = users_models.FriendshipRequest.objects.filter(
             receiver=request.user, status=users_models.FriendshipRequest.PENDING
         ).order_by('-id')
+        serializer = users_serializers.PendingFriendshipRequestValuesSerializer()
+
+        # Pagination
+        paginator = self.get_paginator(request)
+        paginated_requests = paginator.paginate_queryset(serializer.values(pending_requests), request)
+
+        with commons_profiling.phase('serialization'):
+            results = serializer.to_representation(paginated_requests)
+        return paginator.get_paginated_response(results)
+
+
+@commons_profiling.profiled
+class ExportAPIView(APIView):
+    """
+    Streams all rows of an export of the logged in user as NDJSON (one JSON object per line), for data
+    portability and analytics jobs. Rows are read in keyset chunks while the response is being sent,
+    so memory and time to first byte don't depend on the number of rows.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [commons_ratelimit.SlidingWindowThrottle]
+    throttle_scope = 'export'
+    # token lookup (until cached), rows are read after the view returned.
+    query_budget = 1
+    export = None
+
+    def get(self, request):
+        streaming_response = StreamingHttpResponse(
+            users_exporting.EXPORTS[self.export](request.user.id), content_type=commons_constants.NDJSON_CONTENT_TYPE
+        )
+        streaming_response['Content-Disposition'] = f'attachment; filename="{self.export}.ndjson"'
+        # let proxies pass chunks on as they come.
+        streaming_response['X-Accel-Buffering'] = 'no'
+        return streaming_response
+
+
+@commons_profiling.profiled
+class ExportFriendsAPIView(ExportAPIView):
+    """
+    All friends of the logged in user with the time they became friends, oldest first.
+    """
+    export = users_exporting.FRIENDS
+
+
+@commons_profiling.profiled
+class ExportFriendRequestsAPIView(ExportAPIView):
+    """
+    All friend requests the logged in user sent or received, in any status, oldest first.
+    """
+    export = users_exporting.REQUESTS
+
+
+@commons_profiling.profiled
+class FriendSuggestionsAPIView(APIView):
+    """
+    People you may know: users ranked by number of mutual friends.
+    Suggestions are precomputed by `refresh_friend_suggestions` command, so this is a single row lookup.
+    """
+    permission_classes = [IsAuthenticated]
+    query_budget = 2
+
+    def get(self, request):
+        suggestions = users_models.FriendSuggestion.objects.filter(
+            user_id=request.user.id
+        ).values_list('suggestions', flat=True).first()
+        return response.Response({'results': suggestions or []})
+
+
+@commons_profiling.profiled
+class MutualFriendsAPIView(APIView):
+    """
+    Mutual friends of logged in user and given user, latest users first.
+    Computed by intersecting sorted friend id lists of the in memory friend graph.
+    """
+    permission_classes = [IsAuthenticated]
+    # token lookup, friend graph load (first request of a worker) and user rows.
+    query_budget = 4
+
+    def get(self, request, user_id):
+        graph = users_graph.get_friend_graph()
+        mutual_friend_ids = graph.mutual_friends(request.user.id, user_id)
+        mutual_friend_ids.reverse()
 
         # Pagination
         paginator = PageNumberPagination()
-        paginated_requests = paginator.paginate_queryset(pending_requests, request)
+        paginated_ids = paginator.paginate_queryset(mutual_friend_ids, request)
+
+        serializer = users_serializers.UserValuesSerializer()
+        rows = users_search.user_rows_for_ids(paginated_ids)
+        with commons_profiling.phase('serialization'):
+            results = serializer.to_representation(rows)
+        return paginator.get_paginated_response(results)
+
+
+@commons_profiling.profiled
+class MutualFriendsCountAPIView(APIView):
+    """
+    Mutual friend counts of logged in user with a batch of users, e.g. to decorate search results.
+    For Ex: <domain>/accounts/friends/mutual/?user_ids=4,8,15
+    """
+    permission_classes = [IsAuthenticated]
+    query_budget = 3
 
-        serializer = users_serializers.PendingFriendshipRequestSerializer(paginated_requests, many=True)
-        return paginator.get_paginated_response(serializer.data)
+    def get(self, request):
+        user_ids = request.query_params.get('user_ids', '')
+        serializer = users_serializers.MutualFriendsCountSerializer(
+            data={'user_ids': user_ids.split(',') if user_ids else []}
+        )
+        with commons_profiling.phase('validation'):
+            serializer.is_valid(raise_exception=True)
+
+        graph = users_graph.get_friend_graph()
+        friend_ids = graph.neighbors(request.user.id)
+        results = [
+            {'id': user_id, 'mutual_friends': len(users_graph.intersect_sorted(friend_ids, graph.neighbors(user_id)))}
+            for user_id in serializer.validated_data['user_ids']
+        ]
+        return response.Response({'results': results})
@@ -2,6 +2,8 @@
 ASGI config for social_networking project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with any ASGI server, e.g. ``uvicorn social_networking.asgi:application``.
+Async views of the users API are under ``async/accounts/``, see apps/users/async_urls.py.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -9,8 +11,14 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
+from social_networking.settings import Settings
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'social_networking.settings')
+# configure class based settings, same as manage.py does.
+if not settings.configured:
+    settings.configure(Settings())
 
 application = get_asgi_application()
@@ -56,6 +56,14 @@ class Settings:
     ]
 
     MIDDLEWARE = [
+        # outermost, so queries of other middleware count too.
+        'social_networking.apps.commons.middleware.QueryCountMiddleware',
+        # latency, status codes and DB time per route for /metrics, see METRICS.
+        'social_networking.apps.commons.middleware.MetricsMiddleware',
+        # Server-Timing of requests asking for it, see PROFILING.
+        'social_networking.apps.commons.middleware.ProfilingMiddleware',
+        # reads of read only views go to a replica, see DATABASE_ROUTING.
+        'social_networking.apps.commons.middleware.ReadReplicaMiddleware',
         'django.middleware.security.SecurityMiddleware',
         'django.contrib.sessions.middleware.SessionMiddleware',
         'django.middleware.common.CommonMiddleware',
@@ -95,14 +103,115 @@ class Settings:
 
     REST_FRAMEWORK = {
         'DEFAULT_AUTHENTICATION_CLASSES': [
-            'social_networking.apps.commons.authentication.CustomTokenAuthentication',
+            'social_networking.apps.commons.authentication.SignedTokenAuthentication',
         ],
         'DEFAULT_PERMISSION_CLASSES': [
             'rest_framework.permissions.AllowAny',
         ],
         'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+        'DEFAULT_RENDERER_CLASSES': [
+            'social_networking.apps.commons.renderers.FastJSONRenderer',
+            'rest_framework.renderers.BrowsableAPIRenderer',
+        ],
         'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-        'PAGE_SIZE': 10
+        'PAGE_SIZE': 10,
+        # used by commons.ratelimit.SlidingWindowThrottle through throttle_scope of views.
+        'DEFAULT_THROTTLE_RATES': {
+            # streaming exports of friends and friend requests
+            'export': '30/hour',
+            # created friend requests
+            'friend_request': '3/min',
+            # created friend requests of bulk sends, one per receiver. A batch costing more than the rate never goes
+            # through, keep it at least BULK_FRIEND_REQUEST_LIMIT.
+            'friend_request_bulk': '500/hour',
+            'login': '10/min',
+            'search': '60/min',
+        },
+    }
+
+    # In memory friend graph, see users.graph. Each worker reloads it from DB after MAX_AGE seconds, with several
+    # workers set SHARED_CACHE_ALIAS so that friendships changed by one reach the others within SYNC_INTERVAL.
+    FRIEND_GRAPH = {
+        'MAX_AGE': 10 * 60,
+        'MAX_DELTA_EDGES': 100000,
+        'CHUNK_SIZE': 10000,
+        'SHARED_CACHE_ALIAS': None,
+        'SYNC_INTERVAL': 1,
+        'LOG_SIZE': 10000,
+        'LOG_TIMEOUT': 10 * 60,
+    }
+
+    # Rate limiter backend, use CacheRateLimitBackend with a shared cache to limit across workers.
+    RATE_LIMIT = {
+        'BACKEND': 'social_networking.apps.commons.ratelimit.InMemoryRateLimitBackend',
+        'OPTIONS': {},
+    }
+
+    # Versioned cache of friends and pending friend request lists, see commons.cache.VersionedResponseCache
+    LIST_CACHE = {
+        'ENABLED': True,
+        'MAX_SIZE': 10000,
+        'TIMEOUT': 60,
+        'SHARED_CACHE_ALIAS': None,
+    }
+
+    # Cache of user search pages, see commons.cache.SearchResultCache
+    SEARCH_CACHE = {
+        'ENABLED': True,
+        'MAX_SIZE': 5000,
+        'TIMEOUT': 30,
+        'SHARED_CACHE_ALIAS': None,
+    }
+
+    # Cache of authentication tokens, see commons.authentication.TokenCache. With several workers a logout or
+    # new token reaches the caches of the others within SIGNED_ACCESS_TOKEN REVOCATION_REFRESH_INTERVAL seconds,
+    # set SHARED_CACHE_ALIAS to a cache they share to make it immediate.
+    TOKEN_AUTH_CACHE = {
+        'ENABLED': True,
+        'MAX_SIZE': 10000,
+        'TIMEOUT': 300,
+        'SHARED_CACHE_ALIAS': None,
+    }
+
+    # Stateless signed access tokens, see commons.signing
+    SIGNED_ACCESS_TOKEN = {
+        'ENABLED': False,
+        'LIFETIME': 24 * 60 * 60,
+        'REVOCATION_REFRESH_INTERVAL': 5,
+    }
+
+    # Password hashing in a process pool, see commons.hashing
+    PASSWORD_HASHING = {
+        'ENABLED': True,
+        'MAX_WORKERS': None,
+        'MAX_PENDING': None,
+        'TIMEOUT': 10,
+    }
+
+    # Queries per view and N+1 detection, see commons.middleware.QueryCountMiddleware
+    QUERY_INSTRUMENTATION = {
+        'ENABLED': True,
+        'DUPLICATE_THRESHOLD': 3,
+        'STRICT': False,
+    }
+
+    # Prometheus metrics at /metrics, see commons.metrics
+    METRICS = {
+        'ENABLED': True,
+        # e.g. a tmpfs directory emptied when the server starts, to add up metrics of all workers.
+        'DIRECTORY': None,
+        'FLUSH_INTERVAL': 5,
+        'TOKEN': None,
+    }
+
+    # Per request profiling, see commons.middleware.ProfilingMiddleware
+    PROFILING = {
+        'ENABLED': True,
+        'HEADER': 'X-Profile',
+        'TOKEN': None,
+        'SAMPLE_RATE': 0.0,
+        'CPROFILE_DIR': None,
+        'CPROFILE_SLOWEST': 10,
     }
 
     # Database
@@ -110,15 +219,33 @@ class Settings:
 
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.mysql',
+            # mysql backend with pooled connections, see commons.db.pool
+            'ENGINE': 'social_networking.apps.commons.db.backends.mysql',
             'NAME': 'social_network_db',
             'USER': 'root',
             'PASSWORD': 'root_password',  # Use the same password as specified in docker-compose.yml
             'HOST': 'social_db',
             'PORT': '3306',
+            # connections per worker, see constants.DB_POOL_DEFAULTS for all options.
+            'POOL': {
+                'MAX_SIZE': 10,
+                'RECYCLE': 60 * 60,
+                'PRE_PING': True,
+            },
         }
     }
 
+    # Reads of read only views (search, friends and pending request lists) go to a replica when REPLICAS
+    # name aliases of DATABASES, for Ex: 'replica': {..., 'TEST': {'MIRROR': 'default'}}.
+    # See commons.db.routing.ReplicaRouting and ReadReplicaMiddleware.
+    DATABASE_ROUTERS = ['social_networking.apps.commons.db.routing.ReplicaRouter']
+    DATABASE_ROUTING = {
+        'REPLICAS': [],
+        'STICKY_SECONDS': 10,
+        'MAX_SIZE': 100000,
+        'SHARED_CACHE_ALIAS': None,
+    }
+
     WSGI_APPLICATION = 'social_networking.wsgi.application'
 
     # Password validation
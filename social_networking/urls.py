@@ -17,7 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from social_networking.apps.commons import views as commons_views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', commons_views.metrics, name='metrics'),
     path('accounts/', include('social_networking.apps.users.urls')),
+    path('async/accounts/', include('social_networking.apps.users.async_urls')),
 ]
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
+from social_networking.settings import Settings
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'social_networking.settings')
+# configure class based settings, same as manage.py does.
+if not settings.configured:
+    settings.configure(Settings())
 
 application = get_wsgi_application()